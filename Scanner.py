@@ -240,6 +240,62 @@ class Scanner:
         print(f"已从文件加载扫描点位置: {file_path}")
         return scanner
 
+    def fly_path(self, kind='spiral', spacing=None, ratio=None):
+        """
+        连续飞扫路径（密集采样的折线），以扫描中心为原点，扫描范围与 round、fermat 模式相同（半径 step × scan_num）
+
+        参数:
+            kind: 'spiral' 阿基米德螺旋线，从中心向外，螺距为 step；
+                  'lissajous' 李萨如曲线 (sin(p·t), sin(q·t))，覆盖边长 2 × step × scan_num 的正方形，
+                  相邻线间距约为 step，从中心出发回到中心
+            spacing: 路径点间距，默认 step / 20
+            ratio: lissajous 的频率比 (p, q)，默认 q = p + 1
+
+        返回:
+            (n, 2) 路径点
+        """
+        extent = self.step * self.scan_num
+        spacing = self.step / 20 if spacing is None else spacing
+        if kind == 'spiral':
+            # r = b·θ，弧长 s(θ) = b·(θ·√(1 + θ²) + asinh θ) / 2；
+            # 按弧长取点，中心附近再限制每点转过的角度，使曲率大处也有足够的点
+            b = self.step / (2 * math.pi)
+            theta_max = extent / b
+            fine = np.linspace(0, theta_max, max(int(theta_max / 0.002), 2))
+            arc = b * (fine * np.sqrt(1 + fine ** 2) + np.arcsinh(fine)) / 2
+            index = arc / spacing + fine / 0.05
+            theta = np.interp(np.linspace(0, index[-1], max(int(np.ceil(index[-1])), 2)), index, fine)
+            return np.column_stack([b * theta * np.cos(theta), b * theta * np.sin(theta)])
+        if kind == 'lissajous':
+            if ratio is None:
+                p = int(np.ceil(2 * extent / self.step))
+                ratio = (p, p + 1)
+            p, q = ratio
+            # 曲线总长约为 4·extent·(p + q)
+            n = max(int(np.ceil(4 * extent * (p + q) / spacing)), 2)
+            t = np.linspace(0, 2 * math.pi, n)
+            return np.column_stack([extent * np.sin(p * t), extent * np.sin(q * t)])
+        raise ValueError(f'不支持的连续路径：{kind}')
+
+    def fly_trajectory(self, velocity, acceleration, kind='spiral', sample_time=0.01, center=(0.0, 0.0), **kwargs):
+        """
+        连续飞扫轨迹：沿 fly_path 匀速运动（螺旋线即等线速度），中心附近等曲率大处按加速度限制减速，
+        起止为静止，可由运动控制器上传执行（MotionController.upload_trajectory）
+
+        参数:
+            velocity: 线速度（mm/s）
+            acceleration: 各轴加速度上限（mm/s²）
+            sample_time: PVT 元素的时间间隔（s）
+            center: 扫描中心的绝对位置 (x, y)（mm）
+            kwargs: 传给 fly_path
+
+        返回:
+            pvt_trajectory.PVTTrajectory
+        """
+        from pvt_trajectory import PVTTrajectory
+        path = self.fly_path(kind, **kwargs) + np.asarray(center, dtype=np.float64)
+        return PVTTrajectory.from_path(path, velocity, acceleration, sample_time)
+
 
 def visualize_scan_path(scanner:Scanner, save_path=None, dpi=100):
     """
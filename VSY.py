@@ -6,7 +6,7 @@ import numpy as np
 from abc import ABC, abstractmethod
 
 
-from camera import Camera
+from camera import Camera, frame_info
 
 
 # 此处省略您提供的所有常量定义和结构体定义...
@@ -264,29 +264,34 @@ class VSyCamera(Camera):
 
     def read_newest_image(self):
         """读取最新图像帧"""
+        return self.read_newest_frame()[0]
+
+    def read_newest_frame(self):
+        """读取最新图像帧和帧信息（nFrameID 为帧计数，SDK 不提供相机时间戳）"""
         # 计算缓冲区大小
         imgsize = self.width * self.height * (2 if self.bits > 8 else 1)
 
         # 获取图像帧
         img_buffer = (c_ubyte * imgsize)()
-        frame_info = VSY_FRAME_OUT_INFO_EX()
+        frame_info_ = VSY_FRAME_OUT_INFO_EX()
 
         ret = self.VsyGevLib.VSY_GigECam_GetOneFrameTimeoutEx(
             self.pDevObject,
             cast(img_buffer, POINTER(c_ubyte)),
             imgsize,
-            byref(frame_info),
+            byref(frame_info_),
             1000  # 超时时间1秒
         )
 
         if ret != VSY_BUFFER_STATUS_SUCCESS:
-            return ret
+            return ret, frame_info()
+        info = frame_info(frame_info_.nFrameID)
 
         # 转换为numpy数组
         dtype = np.uint16
         img_np = np.frombuffer(img_buffer, dtype=dtype).reshape((self.height, self.width))
 
-        return img_np
+        return img_np, info
 
     def get_frame_period(self):
         """获取帧周期（秒）"""
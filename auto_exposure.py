@@ -0,0 +1,127 @@
+import math
+import time
+import numpy as np
+
+
+def signal_level(image, percentile=99.9, roi=None):
+    """
+    图像的高百分位强度（ADU），比最大值不易受热像素、宇宙线影响
+
+    参数:
+        percentile: 百分位（0–100）
+        roi: 可选，统计区域 (行切片, 列切片)
+    """
+    if roi is not None:
+        image = image[roi]
+    return float(np.percentile(image, percentile))
+
+
+def read_fresh_frame(camera, last_id=None, changed_at=None, settle_frames=2, wait=0.0, timeout=2.0):
+    """
+    读取曝光时间改变之后开始曝光的第一帧，不停止采集。
+    有帧计数时丢弃计数不超过 last_id + settle_frames 的帧（改变时正在曝光、读出的帧仍是旧曝光时间）；
+    没有帧计数时丢弃主机接收时间早于 changed_at + wait + settle_frames 个帧周期的帧
+
+    参数:
+        camera: Camera 对象
+        last_id: 改变曝光时间前收到的最后一帧的帧计数，None 表示不按帧计数判断
+        changed_at: 改变曝光时间的主机时间（perf_counter），None 表示不按时间判断
+        settle_frames: 改变后丢弃的帧数
+        wait: 按时间判断时额外等待的时间（s），一般取新旧曝光时间中较长的一个
+        timeout: 超时时间（s）
+
+    返回:
+        (图像, frame_info)，超时返回 (None, None)
+    """
+    period = camera.get_frame_period()
+    if not period or not 0 < period < math.inf:
+        period = 0.01
+    deadline = time.perf_counter() + timeout
+    while time.perf_counter() < deadline:
+        frames = camera.read_new_frames()
+        for image, info in frames:
+            if last_id is not None and info['frame_id'] is not None:
+                if info['frame_id'] - last_id <= settle_frames:
+                    continue
+            elif changed_at is not None and info['host_time'] < changed_at + wait + settle_frames * period:
+                continue
+            return image, info
+        if not frames:
+            time.sleep(period / 4)
+    return None, None
+
+
+def auto_exposure(camera, target, tolerance=0.1, percentile=99.9, black_level=0.0, saturation=None,
+                  min_exposure=1e-6, max_exposure=1.0, max_steps=4, settle_frames=2, roi=None, exposure=None):
+    """
+    按线性模型自动调节曝光时间：信号（扣除偏置）与曝光时间成正比，由当前帧的高百分位强度直接算出
+    使其等于 target 的曝光时间，一般一到两步收敛。采集过程中直接设置曝光时间，不停止采集，
+    设置后丢弃仍是旧曝光时间的帧（见 read_fresh_frame）。饱和时线性模型失效，曝光时间至少缩短为 1/4
+
+    参数:
+        camera: Camera 对象
+        target: 目标百分位强度（ADU，含偏置）
+        tolerance: 允许的相对偏差，百分位强度与 target 之差不超过 tolerance × (target - black_level) 即结束
+        percentile: 用于判断强度的百分位
+        black_level: 偏置（ADU），不随曝光时间变化
+        saturation: 饱和值（ADU），None 时百分位强度等于图像最大值即视为饱和（高光部分被截断）
+        min_exposure, max_exposure: 曝光时间范围（s）
+        max_steps: 最多调节的次数
+        settle_frames: 每次改变后丢弃的帧数
+        roi: 可选，统计区域 (行切片, 列切片)
+        exposure: 当前曝光时间（s），None 时从 camera.get_ex_time() 读取
+
+    返回:
+        (success, final_exposure, final_level)
+        success: 是否调节到目标范围内
+        final_exposure: 最终的曝光时间（s）
+        final_level: 最终图像的百分位强度（ADU）
+    """
+    if exposure is None:
+        exposure = camera.get_ex_time()
+    if exposure is None:
+        print(f'{type(camera).__name__} 无法读取曝光时间，请给出当前曝光时间')
+        return False, None, None
+    step = getattr(camera, 'exposure_step', None)
+    signal = target - black_level
+
+    # 取出缓冲区中已有的帧，之后读到的第一帧即为当前曝光时间
+    frames = camera.read_new_frames()
+    last_id = frames[-1][1]['frame_id'] if frames else None
+    changed_at, wait, settle = None, 0.0, 0
+    level = None
+    for k in range(max_steps + 1):
+        image, info = read_fresh_frame(camera, last_id, changed_at, settle, wait)
+        if image is None:
+            print('自动曝光：读取图像超时')
+            return False, exposure, level
+        last_id = info['frame_id']
+        level = signal_level(image, percentile, roi)
+        print(f'曝光 {exposure * 1e3:.3f} ms：{percentile} 百分位 {level:.0f} ADU')
+        if abs(level - target) <= tolerance * signal:
+            return True, exposure, level
+        if k == max_steps:
+            break
+
+        if saturation is not None:
+            saturated = level >= saturation
+        else:
+            saturated = level > target and level >= (image if roi is None else image[roi]).max()
+        if saturated:
+            # 真实强度高于测量值，按测量值估计的曝光时间偏长
+            new_exposure = exposure * min(signal / (level - black_level), 0.25)
+        elif level - black_level <= 0:
+            new_exposure = exposure * 10
+        else:
+            new_exposure = exposure * signal / (level - black_level)
+        new_exposure = min(max(new_exposure, min_exposure), max_exposure)
+        if step:
+            new_exposure = max(round(new_exposure / step), 1) * step
+        if new_exposure == exposure:
+            print(f'自动曝光：曝光时间已到达范围边界 {exposure * 1e3:.3f} ms')
+            return False, exposure, level
+
+        camera.set_ex_time(new_exposure)
+        changed_at, wait, settle = time.perf_counter(), max(exposure, new_exposure), settle_frames
+        exposure = new_exposure
+    return False, exposure, level
@@ -0,0 +1,138 @@
+import numpy as np
+
+
+def marginal_centroid(image, threshold=0.1):
+    """
+    由行、列边缘和计算质心，不生成坐标网格，也不产生整帧的浮点临时数组
+
+    参数:
+        image: 图像
+        threshold: 边缘和扣除最小值后，低于 threshold × 最大值的部分视为背景
+
+    返回:
+        (row, col) 浮点坐标，图像为空时返回 None
+    """
+    rows = image.sum(axis=1, dtype=np.float64)
+    cols = image.sum(axis=0, dtype=np.float64)
+    center = []
+    for marginal in (rows, cols):
+        marginal -= marginal.min()
+        peak = marginal.max()
+        if peak <= 0:
+            return None
+        marginal[marginal < threshold * peak] = 0
+        center.append(np.dot(np.arange(len(marginal)), marginal) / marginal.sum())
+    return tuple(center)
+
+
+class BeamCenterTracker:
+    """
+    衍射图中心跟踪：第一次在抽样后的整幅图像上用边缘和求质心，之后只在缓存中心附近的窗口内检查漂移，
+    漂移超过容差时才更新缓存的中心；窗口内找不到光斑或光斑移到窗口边缘时再回到整幅图像估计。
+    可在全分辨率的小窗口内做亚像素细化。
+    """
+
+    def __init__(self, decimation=4, threshold=0.1, tolerance=4, refine_window=64, check_every=1, track_window=128):
+        """
+        参数:
+            decimation: 抽样间隔，估计时只使用 image[::decimation, ::decimation]
+            threshold: 边缘和的背景阈值（相对最大值）
+            tolerance: 中心漂移超过该像素数时才更新
+            refine_window: 亚像素细化窗口边长（全分辨率像素），0 表示不细化
+            check_every: 每隔多少帧检查一次漂移，其余帧直接使用缓存
+            track_window: 检查漂移的窗口边长（全分辨率像素），以缓存中心为中心
+        """
+        self.decimation = decimation
+        self.threshold = threshold
+        self.tolerance = tolerance
+        self.refine_window = refine_window
+        self.check_every = check_every
+        self.track_window = track_window
+        self.center = None  # (row, col) 浮点
+        self.updates = 0
+        self._contrast = None  # 中心更新后窗口内行边缘和的峰谷差，用于判断光斑是否移出窗口
+        self._frames = 0
+
+    def _coarse(self, image):
+        d = self.decimation
+        coarse = marginal_centroid(image[::d, ::d], self.threshold)
+        if coarse is None:
+            return None
+        return coarse[0] * d, coarse[1] * d
+
+    def estimate(self, image):
+        """不使用缓存，估计一次中心"""
+        coarse = self._coarse(image)
+        return None if coarse is None else self._refine(image, *coarse)
+
+    @staticmethod
+    def _window(image, row, col, size):
+        """以 (row, col) 为中心、边长 size 的窗口左上角，限制在图像内"""
+        r0 = int(np.clip(round(row) - size // 2, 0, max(image.shape[0] - size, 0)))
+        c0 = int(np.clip(round(col) - size // 2, 0, max(image.shape[1] - size, 0)))
+        return r0, c0
+
+    def _refine(self, image, row, col):
+        if self.refine_window:
+            size = self.refine_window
+            r0, c0 = self._window(image, row, col, size)
+            fine = marginal_centroid(image[r0:r0 + size, c0:c0 + size], self.threshold)
+            if fine is not None:
+                row, col = r0 + fine[0], c0 + fine[1]
+        return row, col
+
+    def _tracked(self, image):
+        """缓存中心附近的窗口、窗口左上角和窗口内行边缘和的峰谷差"""
+        size = self.track_window
+        r0, c0 = self._window(image, self.center[0], self.center[1], size)
+        window = image[r0:r0 + size, c0:c0 + size]
+        return window, r0, c0, np.ptp(window.sum(axis=1, dtype=np.float64))
+
+    def _track(self, image):
+        """
+        在缓存中心附近的窗口内估计中心，代价与窗口大小有关而与整幅图像无关
+
+        返回:
+            (row, col)，窗口内的光斑明显变弱（光斑已移出窗口）或质心靠近窗口边缘时返回 None
+        """
+        window, r0, c0, contrast = self._tracked(image)
+        if self._contrast is not None and contrast < 0.5 * self._contrast:
+            return None
+        local = marginal_centroid(window, self.threshold)
+        if local is None:
+            return None
+        margin = self.track_window // 8
+        for position, length, origin, limit in zip(local, window.shape, (r0, c0), image.shape[:2]):
+            # 窗口贴着图像边界的一侧不算边缘
+            if (position < margin and origin > 0) or (position > length - margin and origin + length < limit):
+                return None
+        return r0 + local[0], c0 + local[1]
+
+    def update(self, image):
+        """
+        更新中心，漂移不超过容差时返回缓存值
+
+        返回:
+            (row, col) 整数像素坐标
+        """
+        self._frames += 1
+        check = self.center is None or self._frames % self.check_every == 0
+        estimate = None
+        if check:
+            estimate = self._track(image) if self.center is not None and self.track_window else None
+            if estimate is None:
+                estimate = self._coarse(image)
+        if estimate is not None:
+            row, col = estimate
+            if self.center is None or max(abs(row - self.center[0]), abs(col - self.center[1])) > self.tolerance:
+                self.center = self._refine(image, row, col)
+                if self.track_window:
+                    self._contrast = self._tracked(image)[3]
+                self.updates += 1
+        if self.center is None:
+            return image.shape[0] // 2, image.shape[1] // 2
+        return int(round(self.center[0])), int(round(self.center[1]))
+
+    def reset(self):
+        self.center = None
+        self._contrast = None
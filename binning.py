@@ -0,0 +1,99 @@
+import math
+import numpy as np
+
+
+class Binner:
+    """
+    软件合并像素（binning）：把 by×bx 的像素块求和为一个像素。
+    先在 reshape 视图上把每行相邻的 bx 列逐个相加，再把相邻的 by 行相加，全部写入预先分配的uint32缓冲区
+    （比对四维视图直接 sum(axis=(1, 3)) 快约2.5倍）；缓冲区按输入尺寸分配一次，之后每帧复用。
+    不能整除的边缘行列被舍去。
+    """
+
+    def __init__(self, factor=(2, 2), dtype=np.uint16, overflow='clip'):
+        """
+        参数:
+            factor: 合并倍数 (by, bx)，整数表示两个方向相同，如 2 即 2×2
+            dtype: 输出类型，np.uint16 或 np.uint32
+            overflow: 输出为 uint16 时超出范围的处理方式：
+                      'clip' 饱和到65535；'shift' 右移 log2(by×bx) 位（相当于取平均，保持原来的位深）
+        """
+        if np.isscalar(factor):
+            factor = (factor, factor)
+        self.factor = (int(factor[0]), int(factor[1]))
+        self.dtype = np.dtype(dtype)
+        if overflow not in ('clip', 'shift'):
+            raise ValueError(f'未知的溢出处理方式: {overflow}')
+        self.overflow = overflow
+        self._shape = None
+        self._acc = None
+        self._out = None
+
+    @property
+    def enabled(self):
+        return self.factor != (1, 1)
+
+    @property
+    def extra_bits(self):
+        """求和后增加的位数，'shift' 模式下为0"""
+        if self.overflow == 'shift' and self.dtype != np.uint32:
+            return 0
+        return int(math.ceil(math.log2(self.factor[0] * self.factor[1])))
+
+    def output_shape(self, shape):
+        return shape[0] // self.factor[0], shape[1] // self.factor[1]
+
+    def _allocate(self, shape):
+        rows, cols = self.output_shape(shape)
+        self._shape = shape
+        self._cols = np.empty((rows * self.factor[0], cols), dtype=np.uint32)
+        self._acc = np.empty((rows, cols), dtype=np.uint32)
+        self._out = self._acc if self.dtype == np.uint32 else np.empty((rows, cols), dtype=self.dtype)
+
+    def __call__(self, image, out=None):
+        """
+        合并一帧。返回的数组在下一次调用时会被覆盖，需要保留时请复制（FrameSink.write 会自动复制）
+
+        参数:
+            image: 二维图像
+            out: 可选的输出数组，尺寸为 output_shape(image.shape)
+
+        返回:
+            合并后的图像
+        """
+        if not self.enabled:
+            return image
+        if image.ndim != 2:
+            raise ValueError('合并像素只支持单通道图像')
+        if image.shape != self._shape:
+            self._allocate(image.shape)
+        by, bx = self.factor
+        rows, cols = self._acc.shape
+        # 列方向合并
+        view = image[:rows * by, :cols * bx].reshape(rows * by, cols, bx)
+        if bx == 1:
+            self._cols[...] = view[:, :, 0]
+        else:
+            np.add(view[:, :, 0], view[:, :, 1], out=self._cols, dtype=np.uint32)
+            for k in range(2, bx):
+                np.add(self._cols, view[:, :, k], out=self._cols)
+        # 行方向合并
+        view = self._cols.reshape(rows, by, cols)
+        if by == 1:
+            self._acc[...] = view[:, 0]
+        else:
+            np.add(view[:, 0], view[:, 1], out=self._acc)
+            for k in range(2, by):
+                np.add(self._acc, view[:, k], out=self._acc)
+        if out is None:
+            out = self._out
+        if out.dtype == np.uint32:
+            if out is not self._acc:
+                out[...] = self._acc
+            return out
+        if self.overflow == 'shift':
+            np.right_shift(self._acc, int(math.ceil(math.log2(by * bx))), out=self._acc)
+        limit = np.iinfo(out.dtype).max
+        np.minimum(self._acc, limit, out=self._acc)
+        np.copyto(out, self._acc, casting='unsafe')
+        return out
@@ -0,0 +1,229 @@
+import os
+import time
+import numpy as np
+from dark_library import FrameAverager, acquire_frames
+
+
+def robust_sigma(values):
+    """中位数绝对偏差换算的标准差（1.4826 × MAD），不受少数坏像素影响"""
+    median = np.median(values)
+    return 1.4826 * np.median(np.abs(values - median))
+
+
+def neighbour_indices(mask, max_radius=3):
+    """
+    预先计算坏像素的替换索引：每个坏像素取 (2r+1)×(2r+1) 窗口内的好像素求平均，
+    窗口从 r=1 开始，窗口内没有好像素时增大 r，直到 max_radius。
+
+    参数:
+        mask: 坏像素掩膜（True 为坏像素）
+        max_radius: 最大搜索半径
+
+    返回:
+        [(bad, neighbours, weights), ...]，每个半径一组：bad 为坏像素的一维索引 (n,)，
+        neighbours 为邻近像素的一维索引 (n, k)，weights 为权重 (n, k)（无效邻点权重为0，每行和为1）。
+        max_radius 内没有好像素的坏像素放在最后一组，neighbours 为空，替换为0
+    """
+    mask = np.asarray(mask, dtype=bool)
+    rows, cols = mask.shape
+    r_bad, c_bad = np.nonzero(mask)
+    groups = []
+    for radius in range(1, max_radius + 1):
+        if r_bad.size == 0:
+            break
+        dy, dx = np.mgrid[-radius:radius + 1, -radius:radius + 1]
+        keep = (dy != 0) | (dx != 0)
+        dy, dx = dy[keep], dx[keep]
+        r = r_bad[:, None] + dy[None, :]
+        c = c_bad[:, None] + dx[None, :]
+        inside = (r >= 0) & (r < rows) & (c >= 0) & (c < cols)
+        r, c = np.clip(r, 0, rows - 1), np.clip(c, 0, cols - 1)
+        valid = inside & ~mask[r, c]
+        count = valid.sum(axis=1)
+        found = count > 0
+        if np.any(found):
+            weights = valid[found] / count[found, None].astype(np.float32)
+            groups.append((r_bad[found] * cols + c_bad[found], r[found] * cols + c[found],
+                           weights.astype(np.float32)))
+        r_bad, c_bad = r_bad[~found], c_bad[~found]
+    if r_bad.size:
+        groups.append((r_bad * cols + c_bad, np.empty((r_bad.size, 0), dtype=np.intp),
+                       np.empty((r_bad.size, 0), dtype=np.float32)))
+    return groups
+
+
+def replace_masked(flat, groups):
+    """
+    用 neighbour_indices 的结果原地替换坏像素
+
+    参数:
+        flat: 一维视图（image.reshape(-1)），原地修改
+        groups: neighbour_indices 的返回值
+    """
+    for bad, neighbours, weights in groups:
+        if neighbours.shape[1] == 0:
+            flat[bad] = 0
+        else:
+            flat[bad] = np.einsum('ij,ij->i', np.take(flat, neighbours), weights)
+
+
+def estimate_adu_per_photon(flat_pair, dark_pair, mask=None):
+    """
+    由两帧平场和两帧暗场估计每个光子对应的ADU：散粒噪声方差 = ADU/光子 × 信号。
+    用两帧之差的方差消除固定图样噪声，再减去暗场之差的方差（读出噪声）。
+
+    参数:
+        flat_pair: 两帧平场（同样光强）
+        dark_pair: 两帧暗场
+        mask: 坏像素掩膜，不参与统计
+
+    返回:
+        ADU/光子
+    """
+    fa, fb = (np.asarray(f, dtype=np.float64) for f in flat_pair)
+    da, db = (np.asarray(d, dtype=np.float64) for d in dark_pair)
+    good = np.ones(fa.shape, dtype=bool) if mask is None else ~mask
+    signal = (fa[good] + fb[good]).mean() / 2 - (da[good] + db[good]).mean() / 2
+    variance = (np.var(fa[good] - fb[good]) - np.var(da[good] - db[good])) / 2
+    if signal <= 0 or variance <= 0:
+        raise ValueError('平场信号太弱，无法估计ADU/光子')
+    return float(variance / signal)
+
+
+def record_frames(camera, n_frames, frame_period=None):
+    """
+    采集 n_frames 帧，返回 (float32 平均帧, 前两帧)；前两帧用于估计噪声
+    """
+    averager = FrameAverager()
+    pair = []
+    for image in acquire_frames(camera, n_frames, frame_period):
+        averager.add(image)
+        if len(pair) < 2:
+            pair.append(image.copy())
+    if averager.count < 2:
+        raise ValueError('读到的帧数不足，无法标定')
+    return averager.mean(), pair
+
+
+class DetectorCalibration:
+    """
+    探测器标定数据：增益图（平场校正系数）、坏像素掩膜（热像素和死像素）和ADU/光子换算系数，
+    由暗场和均匀照明的平场计算一次后保存为 npz，采集时由 frame_pipeline.Calibrate 逐帧应用。
+    所有图像均为整帧（探测器读出区域）尺寸。
+    """
+
+    def __init__(self, gain=None, mask=None, adu_per_photon=None, info=None):
+        """
+        参数:
+            gain: 增益图（float32，好像素平均为1），None 表示不做平场校正
+            mask: 坏像素掩膜（True 为坏像素）
+            adu_per_photon: ADU/光子，None 表示不换算为光子数
+            info: 相机信息等附加说明（dict）
+        """
+        self.gain = None if gain is None else np.asarray(gain, dtype=np.float32)
+        self.mask = None if mask is None else np.asarray(mask, dtype=bool)
+        self.adu_per_photon = adu_per_photon
+        self.info = dict(info or {})
+
+    @property
+    def shape(self):
+        for array in (self.gain, self.mask):
+            if array is not None:
+                return array.shape
+        return None
+
+    @property
+    def n_bad(self):
+        return 0 if self.mask is None else int(np.count_nonzero(self.mask))
+
+    @classmethod
+    def from_frames(cls, dark, flat, dark_pair=None, flat_pair=None, hot_sigma=8.0, dead_fraction=0.2,
+                    max_gain=5.0, adu_per_photon=None, info=None):
+        """
+        由平均暗场和平均平场计算标定数据
+
+        参数:
+            dark: 平均暗场
+            flat: 平均平场（均匀照明，不饱和）
+            dark_pair, flat_pair: 可选，各两帧单帧图像，用于估计ADU/光子
+            hot_sigma: 暗场高于中位数 hot_sigma 倍稳健标准差的像素为热像素
+            dead_fraction: 扣暗场后的平场低于中位数该比例的像素为死像素
+            max_gain: 增益超出 [1 / max_gain, max_gain] 的像素也标为坏像素
+            adu_per_photon: 已知的ADU/光子（如由光子能量换算），给定时不估计
+        """
+        dark = np.asarray(dark, dtype=np.float32)
+        signal = np.asarray(flat, dtype=np.float32) - dark
+        hot = dark > np.median(dark) + hot_sigma * max(robust_sigma(dark), 1e-3)
+        level = np.median(signal[~hot])
+        if level <= 0:
+            raise ValueError('平场没有信号，请检查照明')
+        dead = signal < dead_fraction * level
+        mask = hot | dead
+        with np.errstate(divide='ignore', invalid='ignore'):
+            gain = np.where(mask, 0, np.mean(signal[~mask]) / signal).astype(np.float32)
+        mask |= (gain > max_gain) | (gain < 1 / max_gain)
+        gain[mask] = 0
+        gain[~mask] /= gain[~mask].mean()
+        if adu_per_photon is None and flat_pair is not None and dark_pair is not None:
+            adu_per_photon = estimate_adu_per_photon(flat_pair, dark_pair, mask)
+        info = dict(info or {}, n_hot=int(np.count_nonzero(hot)), n_dead=int(np.count_nonzero(dead)),
+                    flat_level=float(level), time=time.strftime('%Y-%m-%dT%H:%M:%S'))
+        return cls(gain, mask, adu_per_photon, info)
+
+    @classmethod
+    def acquire(cls, camera, n_frames=64, frame_period=None, **kwargs):
+        """
+        交互式标定：提示挡住光束采集暗场，再提示均匀照明采集平场，其余参数同 from_frames
+        """
+        input('挡住光束后按回车采集暗场')
+        dark, dark_pair = record_frames(camera, n_frames, frame_period)
+        input('均匀照明（不饱和）后按回车采集平场')
+        flat, flat_pair = record_frames(camera, n_frames, frame_period)
+        return cls.from_frames(dark, flat, dark_pair, flat_pair, **kwargs)
+
+    @staticmethod
+    def default_path(serial, pixel_format=None, directory='calibration/detector'):
+        name = f'{serial}_{pixel_format}'
+        name = ''.join(c if c.isalnum() or c in '._-' else '_' for c in name)
+        return os.path.join(directory, name + '.npz')
+
+    def save(self, path):
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        arrays = {'info_keys': np.array(list(self.info.keys()), dtype=str),
+                  'info_values': np.array([str(v) for v in self.info.values()], dtype=str)}
+        if self.gain is not None:
+            arrays['gain'] = self.gain
+        if self.mask is not None:
+            arrays['mask'] = self.mask
+        if self.adu_per_photon is not None:
+            arrays['adu_per_photon'] = np.float64(self.adu_per_photon)
+        np.savez_compressed(path, **arrays)
+
+    @classmethod
+    def load(cls, path):
+        """读取标定文件，文件不存在时返回 None"""
+        if not os.path.exists(path):
+            return None
+        with np.load(path) as data:
+            info = dict(zip(data['info_keys'].tolist(), data['info_values'].tolist())) if 'info_keys' in data else {}
+            return cls(data['gain'] if 'gain' in data else None, data['mask'] if 'mask' in data else None,
+                       float(data['adu_per_photon']) if 'adu_per_photon' in data else None, info)
+
+    def __repr__(self):
+        adu = 'None' if self.adu_per_photon is None else f'{self.adu_per_photon:.3g}'
+        return f'DetectorCalibration(shape={self.shape}, bad={self.n_bad}, adu_per_photon={adu})'
+
+
+if __name__ == '__main__':
+    from camera import Ham
+
+    cam = Ham()
+    cam.start_acquisition()
+    time.sleep(1)
+    info = cam.get_camera_info()
+    calibration = DetectorCalibration.acquire(cam, info=info)
+    path = DetectorCalibration.default_path(info['serial'], 'mono16')
+    calibration.save(path)
+    print(calibration, path)
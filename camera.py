@@ -1,15 +1,53 @@
-from PIL import Image
-from pyueye import ueye
 # import cv2
-from PyQt5 import QtGui
-from PyQt5.QtGui import QImage, QImageReader
 import numpy as np
-from pylablib.devices import uc480, DCAM
 from abc import ABC, abstractmethod
-import imagingcontrol4 as ic4
 import time
 
+def frame_info(frame_id=None, timestamp=None, host_time=None):
+    """
+    帧信息，read_newest_frame 的返回值之一
+
+    参数:
+        frame_id: 相机的帧计数，无法获取时为 None
+        timestamp: 相机时钟的时间戳（s），无法获取时为 None
+        host_time: 主机收到该帧的时间（time.perf_counter()，s），默认为当前时间
+    """
+    return {'frame_id': None if frame_id is None else int(frame_id),
+            'timestamp': None if timestamp is None else float(timestamp),
+            'host_time': time.perf_counter() if host_time is None else host_time}
+
+
+def _pylablib_info(info, timestamp_scale, host_time):
+    """pylablib 的 TFrameInfo 转为 frame_info，timestamp_scale 为相机时间戳单位（s）"""
+    if info is None:
+        return frame_info(host_time=host_time)
+    timestamp = getattr(info, 'timestamp_dev', None)
+    if timestamp is None:
+        timestamp = getattr(info, 'timestamp_us', None)
+    return frame_info(getattr(info, 'framestamp', None),
+                      None if timestamp is None else timestamp * timestamp_scale, host_time)
+
+
+def _pylablib_frame(cam, timestamp_scale):
+    """读取pylablib相机的最新帧和帧信息"""
+    image, info = cam.read_newest_image(return_info=True)
+    return image, _pylablib_info(info, timestamp_scale, time.perf_counter())
+
+
+def _pylablib_frames(cam, timestamp_scale):
+    """读取pylablib相机环形缓冲区中所有未读的帧（read_multiple_images），跳过已被覆盖的帧"""
+    result = cam.read_multiple_images(return_info=True)
+    host_time = time.perf_counter()
+    if result is None:
+        return []
+    frames, infos = result
+    return [(image, _pylablib_info(info, timestamp_scale, host_time)) for image, info in zip(frames, infos)]
+
+
 class Camera(ABC):
+    exposure_step = None  # 曝光时间的设置步长（s），None 表示连续可调
+    ring_buffer = False  # read_new_frames 是否按顺序取出环形缓冲区中的所有帧（飞扫 sequence 模式需要）
+
     def __init__(self):
         super().__init__()
 
@@ -33,12 +71,125 @@ class Camera(ABC):
         """获取帧率，返回：S"""
         pass
 
+    def get_ex_time(self):
+        """
+        读取当前曝光时间（s），无法读取时返回 None。默认使用pylablib相机的 get_exposure，其他相机在子类中覆盖
+        """
+        try:
+            return float(self.cam.get_exposure())
+        except Exception:
+            return None
+
+    def read_newest_frame(self):
+        """
+        读取最新的图像和帧信息（见 frame_info），用于飞扫时确定每帧的曝光时刻。
+        默认只有主机接收时间，能读取相机时间戳和帧计数的相机在子类中覆盖
+        """
+        image = self.read_newest_image()
+        return image, frame_info()
+
+    def start_sequence(self, n_buffers=256):
+        """
+        准备连续采集（飞扫不丢帧模式）：相机按自身帧率连续曝光，帧存入 n_buffers 帧的环形缓冲区，
+        由 read_new_frames 依次取出。默认不做任何设置
+        """
+        pass
+
+    def stop_sequence(self):
+        """结束连续采集，恢复 read_newest_frame / read_newest_image 读取最新帧的设置。默认不做任何设置"""
+        pass
+
+    def read_new_frames(self):
+        """
+        取出上次调用以来相机产生的所有帧，返回 [(图像, frame_info), ...]，按采集顺序排列。
+        默认只返回最新的一帧（两次调用之间的帧会丢失，可由帧计数检查出来；有的相机每次调用都会等到下一帧，
+        永远不会返回空列表），有环形缓冲区的相机在子类中覆盖并设置 ring_buffer = True
+        """
+        image, info = self.read_newest_frame()
+        # 读取失败时有的相机返回错误码而不是 None
+        return [(image, info)] if isinstance(image, np.ndarray) else []
+
+    def read_clock(self):
+        """
+        读取相机当前时钟（s，与 frame_info 的 timestamp 同一时钟），用于 clock_sync 把帧时间戳换算到主机时钟。
+        默认不支持，返回 None，此时只能由帧时间戳被动拟合
+        """
+        return None
+
+    def set_external_trigger(self, enabled=True, line=None):
+        """
+        外部触发：enabled 为 True 时每个外部触发脉冲（上升沿）曝光一帧，用于位置比较触发的飞扫；
+        False 恢复为相机自由运行
+
+        参数:
+            line: GenICam 相机的触发输入线（TriggerSource），None 为该相机的默认输入线
+
+        返回:
+            是否设置成功，默认不支持
+        """
+        print(f'{type(self).__name__} 不支持外部触发')
+        return False
+
+    def get_camera_info(self):
+        """
+        返回区分暗场、标定数据用的相机信息 {'serial', 'gain', 'roi'}，无法获取的项为 None。
+        默认从pylablib相机的 get_device_info / get_gains / get_roi 读取，其他相机在子类中覆盖
+        """
+        info = {'serial': None, 'gain': None, 'roi': None}
+        cam = getattr(self, 'cam', None)
+        try:
+            info['serial'] = cam.get_device_info().serial_number
+        except Exception:
+            pass
+        try:
+            info['gain'] = float(cam.get_gains()[0])
+        except Exception:
+            pass
+        try:
+            info['roi'] = tuple(int(v) for v in cam.get_roi()[:4])
+        except Exception:
+            pass
+        if not info['serial']:
+            info['serial'] = type(self).__name__
+        return info
+
+    def measure_photon_transfer(self, exposures, n_frames=32, restore_exposure=None, **kwargs):
+        """
+        在均匀照明下测量光子转移曲线，拟合转换增益和读出噪声（见 photon_transfer.PhotonTransferCurve）
+
+        参数:
+            exposures: 曝光时间序列（s）
+            n_frames: 每个曝光时间统计的帧数
+            restore_exposure: 测量后恢复的曝光时间（s）
+
+        返回:
+            PhotonTransferCurve.fit 的结果
+        """
+        from photon_transfer import PhotonTransferCurve
+        ptc = PhotonTransferCurve(self, exposures, n_frames, **kwargs)
+        return ptc.measure(restore_exposure)
+
+    def auto_exposure(self, target, tolerance=0.1, percentile=99.9, **kwargs):
+        """
+        按线性模型自动调节曝光时间，使图像的高百分位强度等于 target（ADU），采集过程中直接设置，
+        一般一到两步收敛（见 auto_exposure.auto_exposure）
+
+        返回:
+            (success, final_exposure, final_level)
+        """
+        from auto_exposure import auto_exposure
+        return auto_exposure(self, target, tolerance, percentile, **kwargs)
+
 
 class IDS(Camera):
+    ring_buffer = True
+
     def __init__(self):
 
         # self.cam = uc480.UC480Camera(backend='ueye')
         super().__init__()
+        global uc480
+        from pylablib.devices import uc480
         print((uc480.list_cameras(backend='ueye')))
         # print(uc480.UC480Camera.get_all_color_modes())
         cam_id = uc480.list_cameras(backend='ueye')[0][0]
@@ -88,15 +239,54 @@ class IDS(Camera):
         except Exception as e:
             print(f'IDS获取图像失败：{e}')
 
+    def start_sequence(self, n_buffers=256):
+        try:
+            self.cam.stop_acquisition()
+            self.cam.start_acquisition(nframes=n_buffers)
+        except Exception as e:
+            print(f'IDS开始连续采集失败：{e}')
+
+    def read_new_frames(self):
+        try:
+            return _pylablib_frames(self.cam, 1e-7)
+        except Exception as e:
+            print(f'IDS获取图像失败：{e}')
+            return []
+
+    def read_newest_frame(self):
+        """uc480 TFrameInfo：framestamp 为帧计数，timestamp_dev 为相机时间戳（0.1 µs）"""
+        try:
+            image, info = _pylablib_frame(self.cam, 1e-7)
+            if image is None:
+                self.wait_for_frame(1)
+                image, info = _pylablib_frame(self.cam, 1e-7)
+            return image, info
+        except Exception as e:
+            print(f'IDS获取图像失败：{e}')
+            return None, frame_info()
+
 
     def get_frame_period(self):
         return self.cam.get_frame_period()
+
+    def set_external_trigger(self, enabled=True, line=None):
+        """uc480 只有一个触发输入，line 不使用"""
+        try:
+            self.cam.set_trigger_mode('ext_rise' if enabled else 'int')
+            return True
+        except Exception as e:
+            print(f'IDS设置触发模式失败：{e}')
+            return False
     
 
 class Ham(Camera):
+    ring_buffer = True
+
     def __init__(self):
 
         super().__init__()
+        global DCAM
+        from pylablib.devices import DCAM
         print(DCAM.get_cameras_number())
         try:
             self.cam = DCAM.DCAMCamera(idx=0)
@@ -133,12 +323,49 @@ class Ham(Camera):
         except Exception as e:
             print(f'Ham获取图像失败：{e}')
 
+    def start_sequence(self, n_buffers=256):
+        try:
+            self.cam.stop_acquisition()
+            self.cam.start_acquisition(nframes=n_buffers)
+        except Exception as e:
+            print(f'Ham开始连续采集失败：{e}')
+
+    def read_new_frames(self):
+        try:
+            return _pylablib_frames(self.cam, 1e-6)
+        except Exception as e:
+            print(f'Ham获取图像失败：{e}')
+            return []
+
+    def read_newest_frame(self):
+        """DCAM TFrameInfo：framestamp 为帧计数，timestamp_us 为相机时间戳（µs）"""
+        try:
+            image, info = _pylablib_frame(self.cam, 1e-6)
+            if image is None:
+                self.wait_for_frame(1)
+                image, info = _pylablib_frame(self.cam, 1e-6)
+            return image, info
+        except Exception as e:
+            print(f'Ham获取图像失败：{e}')
+            return None, frame_info()
+
 
     def get_frame_period(self):
         return self.cam.get_frame_period()
 
+    def set_external_trigger(self, enabled=True, line=None):
+        """DCAM 的外部触发输入由相机设置决定（默认上升沿），line 不使用"""
+        try:
+            self.cam.set_trigger_mode('ext' if enabled else 'int')
+            return True
+        except Exception as e:
+            print(f'Ham设置触发模式失败：{e}')
+            return False
+
 
 class Basler(Camera):
+    ring_buffer = True
+
     def __init__(self):
         super().__init__()
         global pylon
@@ -146,6 +373,7 @@ class Basler(Camera):
         # 创建相机对象并连接到第一个可用的相机
         self.camera = pylon.InstantCamera(pylon.TlFactory.GetInstance().CreateFirstDevice())
         self.camera.Open()
+        self._max_num_buffer = None  # start_sequence 之前的缓冲区数，stop_sequence 恢复
         print(self.camera)
 
     def set_ex_time(self, exposure_time):
@@ -157,6 +385,13 @@ class Basler(Camera):
         except Exception as e:
             print(f"设置曝光时间失败: {e}")
 
+    def get_ex_time(self):
+        try:
+            return self.camera.ExposureTime.Value * 1e-6
+        except Exception as e:
+            print(f"读取曝光时间失败: {e}")
+            return None
+
     def start_acquisition(self):
         try:
             self.camera.StartGrabbing(pylon.GrabStrategy_LatestImages)
@@ -186,6 +421,84 @@ class Basler(Camera):
             print(f"获取图像时发生错误: {e}")
             return None
 
+    def read_newest_frame(self):
+        """GenICam：BlockID 为帧计数，TimeStamp 为相机时间戳（GevTimestampTickFrequency 一般为1 GHz，即 ns）"""
+        try:
+            grab_result = self.camera.RetrieveResult(5000, pylon.TimeoutHandling_ThrowException)
+            return self._grab_to_frame(grab_result)
+        except Exception as e:
+            print(f"获取图像时发生错误: {e}")
+            return None, frame_info()
+
+    def _grab_to_frame(self, grab_result):
+        host_time = time.perf_counter()
+        image = grab_result.Array
+        info = frame_info(grab_result.BlockID, grab_result.TimeStamp * 1e-9, host_time)
+        grab_result.Release()
+        return image, info
+
+    def start_sequence(self, n_buffers=256):
+        """按顺序取出所有帧（GrabStrategy_OneByOne），缓冲区满时相机丢帧"""
+        try:
+            self.camera.StopGrabbing()
+            if self._max_num_buffer is None:
+                self._max_num_buffer = self.camera.MaxNumBuffer.Value
+            self.camera.MaxNumBuffer.Value = n_buffers
+            self.camera.StartGrabbing(pylon.GrabStrategy_OneByOne)
+        except Exception as e:
+            print(f"启动连续采集时发生错误: {e}")
+
+    def stop_sequence(self):
+        """恢复 GrabStrategy_LatestImages 和原来的缓冲区数"""
+        try:
+            self.camera.StopGrabbing()
+            if self._max_num_buffer is not None:
+                self.camera.MaxNumBuffer.Value = self._max_num_buffer
+                self._max_num_buffer = None
+            self.camera.StartGrabbing(pylon.GrabStrategy_LatestImages)
+        except Exception as e:
+            print(f"结束连续采集时发生错误: {e}")
+
+    def read_new_frames(self):
+        frames = []
+        try:
+            while self.camera.NumReadyBuffers.Value > 0:
+                grab_result = self.camera.RetrieveResult(0, pylon.TimeoutHandling_Return)
+                if not grab_result.IsValid():
+                    break
+                if grab_result.GrabSucceeded():
+                    frames.append(self._grab_to_frame(grab_result))
+                else:
+                    grab_result.Release()
+        except Exception as e:
+            print(f"获取图像时发生错误: {e}")
+        return frames
+
+    def read_clock(self):
+        """GenICam：TimestampLatch 锁存当前时钟后读取 TimestampLatchValue（ns），老的 GigE 相机为 GevTimestampControlLatch"""
+        try:
+            if hasattr(self.camera, 'TimestampLatch'):
+                self.camera.TimestampLatch.Execute()
+                return self.camera.TimestampLatchValue.Value * 1e-9
+            self.camera.GevTimestampControlLatch.Execute()
+            return self.camera.GevTimestampValue.Value * 1e-9
+        except Exception as e:
+            print(f"读取相机时钟失败: {e}")
+            return None
+
+    def set_external_trigger(self, enabled=True, line=None):
+        """GenICam：TriggerSelector=FrameStart，TriggerSource 默认 Line1（Basler 的光耦输入）"""
+        try:
+            self.camera.TriggerSelector.Value = 'FrameStart'
+            if enabled:
+                self.camera.TriggerSource.Value = line or 'Line1'
+                self.camera.TriggerActivation.Value = 'RisingEdge'
+            self.camera.TriggerMode.Value = 'On' if enabled else 'Off'
+            return True
+        except Exception as e:
+            print(f"设置触发模式失败: {e}")
+            return False
+
     def set_frame_rate(self, frame_rate: float):
         """设置相机的帧率"""
         if self.camera:
@@ -243,10 +556,12 @@ class Basler(Camera):
         print("相机已关闭")
 
 
-class IC4Camera(Camera):
+def _capture_listener():
+    """IC4 的 QueueSinkListener：保留最新一帧和帧信息（imagingcontrol4 在创建相机时才导入）"""
     class _NumpyCaptureListener(ic4.QueueSinkListener):
         def __init__(self):
             self.latest_frame = None
+            self.latest = None
 
         def sink_connected(self, sink: ic4.QueueSink, image_type: ic4.ImageType, min_buffers_required: int) -> bool:
             return True
@@ -254,12 +569,21 @@ class IC4Camera(Camera):
         def frames_queued(self, sink: ic4.QueueSink):
             try:
                 buffer = sink.pop_output_buffer()
+                host_time = time.perf_counter()
                 np_array = buffer.numpy_wrap()
-                self.latest_frame = np_array.copy()
+                frame = np_array.copy()
+                meta = buffer.meta_data
+                # 图像和帧信息一起替换，读取时不会配错
+                self.latest = (frame, frame_info(meta.device_frame_number, meta.device_timestamp_ns * 1e-9, host_time))
+                self.latest_frame = frame
 
             except Exception as e:
                 print(f"帧处理异常: {str(e)}")
 
+    return _NumpyCaptureListener()
+
+
+class IC4Camera(Camera):
     def __init__(self, width, height):
 
         super().__init__()
@@ -271,6 +595,8 @@ class IC4Camera(Camera):
         self._initialize(width, height)
 
     def _initialize(self, width, height):
+        global ic4
+        import imagingcontrol4 as ic4
         try:
             ic4.Library.init()
             device_list = ic4.DeviceEnum.devices()
@@ -290,7 +616,7 @@ class IC4Camera(Camera):
             self.grabber.device_property_map.set_value(ic4.PropId.WIDTH, width)
             self.grabber.device_property_map.set_value(ic4.PropId.HEIGHT, height)
 
-            self.listener = self._NumpyCaptureListener()
+            self.listener = _capture_listener()
             self.sink = ic4.QueueSink(
                 self.listener,
                 [ic4.PixelFormat.Mono16],  # 根据实际像素格式调整
@@ -322,6 +648,13 @@ class IC4Camera(Camera):
         except (AttributeError, ic4.IC4Exception) as e:
             raise RuntimeError(f"设置曝光时间失败: {str(e)}") from e
 
+    def get_ex_time(self):
+        try:
+            return self.grabber.device_property_map.get_value_float(ic4.PropId.EXPOSURE_TIME) * 1e-6
+        except (AttributeError, ic4.IC4Exception) as e:
+            print(f'IC4读取曝光时间失败: {e}')
+            return None
+
     def start_acquisition(self):
         """启动图像采集"""
         try:
@@ -339,6 +672,39 @@ class IC4Camera(Camera):
         except Exception as e:
             print(f'IC4获取图像失败{e}')
 
+    def read_newest_frame(self):
+        """帧计数和相机时间戳来自 ImageBuffer.meta_data，在收到帧的回调中记录"""
+        latest = self.listener.latest
+        if latest is None:
+            return None, frame_info()
+        self.listener.latest = None
+        self.listener.latest_frame = None
+        return latest[0].astype(np.uint16), latest[1]
+
+
+    def read_clock(self):
+        """GenICam：TimestampLatch 锁存当前时钟后读取 TimestampLatchValue（ns）"""
+        try:
+            props = self.grabber.device_property_map
+            props.execute_command(ic4.PropId.TIMESTAMP_LATCH)
+            return props.get_value_int(ic4.PropId.TIMESTAMP_LATCH_VALUE) * 1e-9
+        except (AttributeError, ic4.IC4Exception) as e:
+            print(f'IC4读取相机时钟失败: {e}')
+            return None
+
+    def set_external_trigger(self, enabled=True, line=None):
+        """GenICam：TriggerSelector=FrameStart，TriggerSource 默认 Line1"""
+        try:
+            props = self.grabber.device_property_map
+            props.set_value(ic4.PropId.TRIGGER_SELECTOR, 'FrameStart')
+            if enabled:
+                props.set_value(ic4.PropId.TRIGGER_SOURCE, line or 'Line1')
+                props.set_value(ic4.PropId.TRIGGER_ACTIVATION, 'RisingEdge')
+            props.set_value(ic4.PropId.TRIGGER_MODE, 'On' if enabled else 'Off')
+            return True
+        except (AttributeError, ic4.IC4Exception) as e:
+            print(f'IC4设置触发模式失败: {e}')
+            return False
 
     def get_frame_period(self) -> float:
         try:
@@ -0,0 +1,308 @@
+import threading
+import time
+import numpy as np
+
+
+class ClockSync:
+    """
+    一个设备时钟（相机时间戳、XPS 控制器时间等，单位 s）与主机时钟 time.perf_counter()（与 camera.frame_info 的
+    host_time、position_trace.PositionTrace 相同）的线性关系：主机时间 = 斜率 × 设备时间 + 截距，
+    斜率 - 1 为两个时钟的频率差（漂移）。
+
+    样本有两种：
+        主动采样（sample）：读取设备当前时钟，主机时间取读取前后的中点，往返时间越短越准确。
+            拟合只用往返时间不超过中位数的样本，再去掉残差超过 3 倍 MAD 的样本；
+        被动样本（add 不给往返时间）：主机收到带设备时间戳的数据（如相机帧）的时间，
+            比真实时刻晚一个不确定的传输延迟，拟合取下包络（各时间段延迟最小的样本）。
+    """
+
+    def __init__(self, read_clock=None, name='device', max_samples=2000, min_span=1000):
+        """
+        参数:
+            read_clock: 读取设备当前时钟（s）的函数，失败时返回 None；只用被动样本时为 None
+            name: 设备名称
+            max_samples: 最多保留的样本数，超过时丢弃最早的样本（长时间运行时跟随漂移的变化）
+            min_span: 主动样本的时间跨度不到 min_span 倍往返时间时认为两个时钟频率相同，只拟合截距
+        """
+        self.read_clock = read_clock
+        self.name = name
+        self.max_samples = max_samples
+        self.min_span = min_span
+        self.device_times = []
+        self.host_times = []
+        self.round_trips = []
+        self._fit = None
+        self._lock = threading.Lock()
+
+    def __len__(self):
+        return len(self.device_times)
+
+    def add(self, device_time, host_time, round_trip=None):
+        """
+        添加一个样本
+
+        参数:
+            device_time: 设备时钟（s）
+            host_time: 对应的主机时间（perf_counter，s）
+            round_trip: 主动采样的往返时间（s），None 表示被动样本（host_time 为接收时间）
+        """
+        with self._lock:
+            self.device_times.append(float(device_time))
+            self.host_times.append(float(host_time))
+            self.round_trips.append(np.nan if round_trip is None else float(round_trip))
+            if len(self.device_times) > self.max_samples:
+                del self.device_times[0], self.host_times[0], self.round_trips[0]
+            self._fit = None
+
+    def sample(self, n=1):
+        """
+        主动采样 n 次
+
+        返回:
+            是否读取成功
+        """
+        if self.read_clock is None:
+            return False
+        for _ in range(n):
+            t0 = time.perf_counter()
+            device_time = self.read_clock()
+            t1 = time.perf_counter()
+            if device_time is None:
+                return False
+            self.add(device_time, (t0 + t1) / 2, t1 - t0)
+        return True
+
+    def _arrays(self):
+        with self._lock:
+            return (np.array(self.device_times), np.array(self.host_times), np.array(self.round_trips))
+
+    def fit(self):
+        """
+        拟合时钟关系
+
+        返回:
+            (斜率, 截距)，主机时间 = 斜率 × 设备时间 + 截距；样本少于2个时返回 None
+        """
+        if self._fit is not None:
+            return self._fit
+        device, host, round_trip = self._arrays()
+        if len(device) < 2:
+            return None
+        # 以第一个样本为原点拟合，避免大的时间戳损失精度
+        d0, h0 = device[0], host[0]
+        x, y = device - d0, host - h0
+        active = np.isfinite(round_trip)
+        if np.count_nonzero(active) >= 2:
+            x, y, round_trip = x[active], y[active], round_trip[active]
+            keep = round_trip <= np.median(round_trip)
+            if np.ptp(x[keep]) < self.min_span * np.median(round_trip):
+                # 样本的时间跨度太短时斜率由往返抖动决定，只拟合截距（不估计漂移）
+                slope, intercept = 1.0, np.median(y[keep] - x[keep])
+            else:
+                slope, intercept = self._robust_line(x[keep], y[keep])
+        else:
+            slope, intercept = self._lower_envelope(x, y)
+        self._fit = (slope, h0 + intercept - slope * d0)
+        return self._fit
+
+    @staticmethod
+    def _line(x, y):
+        if x.max() - x.min() > 0:
+            slope, intercept = np.polyfit(x, y, 1)
+        else:
+            slope, intercept = 1.0, np.mean(y - x)
+        return slope, intercept
+
+    @classmethod
+    def _robust_line(cls, x, y, n_iter=3):
+        """最小二乘拟合，去掉残差超过 3 倍 MAD 的样本后重新拟合"""
+        keep = np.ones(len(x), dtype=bool)
+        for _ in range(n_iter):
+            slope, intercept = cls._line(x[keep], y[keep])
+            residual = y - (slope * x + intercept)
+            mad = 1.4826 * np.median(np.abs(residual[keep] - np.median(residual[keep])))
+            new = np.abs(residual - np.median(residual[keep])) <= max(3 * mad, 1e-9)
+            if np.count_nonzero(new) < 2 or np.array_equal(new, keep):
+                break
+            keep = new
+        return slope, intercept
+
+    @classmethod
+    def _lower_envelope(cls, x, y, n_bins=20):
+        """
+        被动样本的下包络：按时间等分为若干段，每段取残差最小（延迟最小）的样本稳健拟合，
+        再把截距移到这些样本的最小残差，使换算出的主机时间为传输延迟最短时的接收时间
+        """
+        slope, intercept = cls._line(x, y)
+        n_bins = max(min(n_bins, len(x) // 2), 1)
+        for _ in range(3):
+            residual = y - (slope * x + intercept)
+            order = np.argsort(x, kind='stable')
+            chosen = np.array([part[np.argmin(residual[part])] for part in np.array_split(order, n_bins)])
+            if len(chosen) < 2:
+                break
+            slope, intercept = cls._robust_line(x[chosen], y[chosen])
+        residual = y[chosen] - (slope * x[chosen] + intercept)
+        mad = 1.4826 * np.median(np.abs(residual - np.median(residual)))
+        # 明显早于包络的样本（时间戳错误）不参与截距
+        valid = residual >= np.median(residual) - max(3 * mad, 1e-9)
+        return slope, intercept + residual[valid].min()
+
+    @property
+    def drift(self):
+        """设备时钟相对主机时钟的频率差（主机时间 / 设备时间 - 1），未拟合时为 None"""
+        fit = self.fit()
+        return None if fit is None else fit[0] - 1
+
+    def to_host(self, device_times):
+        """设备时间换算为主机时间（perf_counter，s），无法拟合时为 NaN"""
+        device_times = np.asarray(device_times, dtype=np.float64)
+        fit = self.fit()
+        if fit is None:
+            return np.full(device_times.shape, np.nan)
+        return fit[0] * device_times + fit[1]
+
+    def to_device(self, host_times):
+        """主机时间换算为设备时间（s），无法拟合时为 NaN"""
+        host_times = np.asarray(host_times, dtype=np.float64)
+        fit = self.fit()
+        if fit is None:
+            return np.full(host_times.shape, np.nan)
+        return (host_times - fit[1]) / fit[0]
+
+    def residuals(self):
+        """各样本的主机时间减去拟合值（s），被动样本即为传输延迟"""
+        device, host, _ = self._arrays()
+        return host - self.to_host(device)
+
+    def report(self):
+        fit = self.fit()
+        if fit is None:
+            return f'{self.name}: 样本不足'
+        device, _, round_trip = self._arrays()
+        text = f'{self.name}: {len(device)} 个样本，漂移 {(fit[0] - 1) * 1e6:.2f} ppm'
+        residual = self.residuals()
+        active = np.isfinite(round_trip)
+        if np.any(active):
+            residual = residual[active]
+            spread = 1.4826 * np.median(np.abs(residual - np.median(residual)))
+            text += f'，往返 {np.median(round_trip[active]) * 1e6:.0f} µs，残差 {spread * 1e6:.1f} µs（MAD）'
+        else:
+            text += f'，延迟 {np.min(residual) * 1e3:.2f}–{np.max(residual) * 1e3:.2f} ms'
+        return text
+
+    def save(self, path):
+        device, host, round_trip = self._arrays()
+        fit = self.fit()
+        np.savez(path, device_time=device, host_time=host, round_trip=round_trip,
+                 fit=np.array(fit if fit is not None else (np.nan, np.nan)))
+
+
+class ClockSyncService:
+    """
+    在后台线程中每隔 interval 对每个设备时钟主动采样 burst 次，维护各设备的 ClockSync，
+    在各时钟之间换算时间（主机时钟的名称为 'host'）。用于飞扫给帧时间戳、控制器时间换算到主机时间，
+    以及统计各环节的延迟。
+    """
+
+    def __init__(self, interval=1.0, burst=5):
+        """
+        参数:
+            interval: 两次采样之间的时间（s）
+            burst: 每次连续采样的次数，拟合时只用往返时间短的样本
+        """
+        self.interval = interval
+        self.burst = burst
+        self.clocks = {}
+        self._stop = threading.Event()
+        self._thread = None
+
+    def add(self, name, read_clock=None):
+        """
+        添加一个设备时钟。read_clock 读取失败（设备不支持）时只能添加被动样本
+
+        返回:
+            该设备的 ClockSync
+        """
+        clock = ClockSync(read_clock, name)
+        if read_clock is not None and not clock.sample(self.burst):
+            print(f'{name} 无法读取设备时钟，只使用被动样本')
+            clock.read_clock = None
+        self.clocks[name] = clock
+        return clock
+
+    def add_camera(self, camera, name='camera'):
+        """相机时钟（Camera.read_clock，与 frame_info 的 timestamp 同一时钟）"""
+        return self.add(name, camera.read_clock)
+
+    def add_motion(self, motion, name='stage'):
+        """运动控制器时钟（MotionController.read_clock）"""
+        return self.add(name, motion.read_clock)
+
+    def __getitem__(self, name):
+        return self.clocks[name]
+
+    def __contains__(self, name):
+        return name in self.clocks
+
+    def sample(self):
+        for clock in self.clocks.values():
+            if clock.read_clock is not None:
+                clock.sample(self.burst)
+
+    def start(self):
+        if self._thread is not None:
+            return
+        self._stop.clear()
+        self._thread = threading.Thread(target=self._run, daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        """停止后台采样，并在结束时再采样一次，使样本覆盖整个运行时间"""
+        if self._thread is None:
+            return
+        self._stop.set()
+        self._thread.join()
+        self._thread = None
+        self.sample()
+
+    def _run(self):
+        while not self._stop.wait(self.interval):
+            self.sample()
+
+    def __enter__(self):
+        self.start()
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.stop()
+
+    def convert(self, times, source, target='host'):
+        """
+        把 source 时钟的时间换算为 target 时钟
+
+        参数:
+            times: 时间（s）
+            source, target: 设备名称或 'host'
+        """
+        times = np.asarray(times, dtype=np.float64)
+        if source != 'host':
+            times = self.clocks[source].to_host(times)
+        if target != 'host':
+            times = self.clocks[target].to_device(times)
+        return times
+
+    def report(self):
+        return '；'.join(clock.report() for clock in self.clocks.values())
+
+    def save(self, path):
+        """保存为 npz：每个设备 <名称>_device_time、<名称>_host_time、<名称>_round_trip、<名称>_fit"""
+        arrays = {}
+        for name, clock in self.clocks.items():
+            device, host, round_trip = clock._arrays()
+            fit = clock.fit()
+            arrays[f'{name}_device_time'] = device
+            arrays[f'{name}_host_time'] = host
+            arrays[f'{name}_round_trip'] = round_trip
+            arrays[f'{name}_fit'] = np.array(fit if fit is not None else (np.nan, np.nan))
+        np.savez(path, **arrays)
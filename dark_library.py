@@ -0,0 +1,141 @@
+import json
+import os
+import time
+import numpy as np
+
+
+class FrameAverager:
+    """
+    逐帧累加求平均，整数图像累加到 uint32（uint16 最多可累加65537帧不溢出），浮点图像累加到 float64。
+    累加缓冲区在第一帧时分配，不保存各帧。
+    """
+
+    def __init__(self):
+        self.sum = None
+        self.count = 0
+
+    def add(self, image):
+        if self.sum is None:
+            self.sum = np.zeros(image.shape, dtype=np.uint32 if np.issubdtype(image.dtype, np.integer) else np.float64)
+        np.add(self.sum, image, out=self.sum, casting='unsafe')
+        self.count += 1
+
+    def mean(self):
+        """返回 float32 平均值"""
+        if self.count == 0:
+            return None
+        return (self.sum / self.count).astype(np.float32)
+
+
+def acquire_frames(camera, n_frames, frame_period=None, timeout=None):
+    """
+    依次读取 n_frames 个不同的帧（read_newest_image 在新帧到达前会返回同一帧，与上一帧相同时跳过）
+
+    参数:
+        camera: Camera 对象
+        n_frames: 帧数
+        frame_period: 两次读取之间的等待时间（秒），默认使用 camera.get_frame_period()
+        timeout: 超时时间（秒），默认为 n_frames × frame_period 的4倍加5秒
+    """
+    if frame_period is None:
+        frame_period = camera.get_frame_period()
+    if timeout is None:
+        timeout = 4 * n_frames * frame_period + 5
+    start = time.time()
+    previous = None
+    count = 0
+    while count < n_frames:
+        if time.time() - start > timeout:
+            print(f'读取超时，只得到 {count} 帧')
+            return
+        image = camera.read_newest_image()
+        if image is not None and (previous is None or not np.array_equal(image, previous)):
+            previous = image
+            count += 1
+            yield image
+        else:
+            time.sleep(frame_period / 4)
+
+
+class DarkLibrary:
+    """
+    暗场库：多帧平均的整帧暗场按 (相机序列号, 像素格式, 探测器区域, 增益, 曝光时间) 保存在磁盘上，
+    重新启动程序或切换回原来的曝光时间时直接读取，不需要重新采集。
+
+    文件结构:
+        directory/index.json    各暗场的参数、帧数和采集时间
+        directory/<key>.npy     float32 平均暗场
+    """
+
+    def __init__(self, directory='calibration/darks'):
+        self.directory = directory
+        self._index_file = os.path.join(directory, 'index.json')
+        self._cache = {}
+        self.index = {}
+        if os.path.exists(self._index_file):
+            with open(self._index_file, 'r', encoding='utf-8') as f:
+                self.index = json.load(f)
+
+    @staticmethod
+    def make_key(serial, exposure, roi, gain=None, pixel_format=None):
+        """
+        参数:
+            serial: 相机序列号
+            exposure: 曝光时间（s），按微秒取整后比较
+            roi: 探测器读出区域，如 (height, width) 或 (x, y, width, height)
+            gain: 增益
+            pixel_format: 像素格式，如 'mono12'
+        """
+        return {'serial': str(serial), 'pixel_format': str(pixel_format), 'roi': [int(v) for v in roi],
+                'gain': None if gain is None else float(gain), 'exposure_us': int(round(exposure * 1e6))}
+
+    @staticmethod
+    def key_name(key):
+        roi = 'x'.join(str(v) for v in key['roi'])
+        gain = 'auto' if key['gain'] is None else f"{key['gain']:g}"
+        name = f"{key['serial']}_{key['pixel_format']}_{roi}_g{gain}_{key['exposure_us']}us"
+        return ''.join(c if c.isalnum() or c in '._-' else '_' for c in name)
+
+    def lookup(self, key):
+        """返回对应的 float32 暗场，没有时返回 None"""
+        name = self.key_name(key)
+        if name in self._cache:
+            return self._cache[name]
+        if name not in self.index:
+            return None
+        path = os.path.join(self.directory, self.index[name]['file'])
+        if not os.path.exists(path):
+            return None
+        dark = np.load(path)
+        self._cache[name] = dark
+        return dark
+
+    def store(self, key, dark, n_frames):
+        """保存暗场并更新索引"""
+        os.makedirs(self.directory, exist_ok=True)
+        name = self.key_name(key)
+        file_name = name + '.npy'
+        dark = np.asarray(dark, dtype=np.float32)
+        np.save(os.path.join(self.directory, file_name), dark)
+        self.index[name] = dict(key, file=file_name, n_frames=int(n_frames),
+                                time=time.strftime('%Y-%m-%dT%H:%M:%S'))
+        with open(self._index_file, 'w', encoding='utf-8') as f:
+            json.dump(self.index, f, ensure_ascii=False, indent=1)
+        self._cache[name] = dark
+        return dark
+
+    def acquire(self, camera, key, n_frames=32, frame_period=None):
+        """
+        采集 n_frames 帧求平均并保存（调用前需要挡住光束）
+
+        返回:
+            float32 平均暗场，没有读到图像时返回 None
+        """
+        averager = FrameAverager()
+        for image in acquire_frames(camera, n_frames, frame_period):
+            averager.add(image)
+        if averager.count == 0:
+            print('没有读到图像，暗场未保存')
+            return None
+        print(f'暗场采集完成：{averager.count} 帧平均，{self.key_name(key)}')
+        return self.store(key, averager.mean(), averager.count)
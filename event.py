@@ -3,10 +3,11 @@ import os
 import time
 from audioop import error
 from time import sleep
-from PyQt5.QtWidgets import QMainWindow, QApplication, QGraphicsScene
+from PyQt5.QtWidgets import QMainWindow, QApplication, QGraphicsScene, QGraphicsView
 from PyQt5.QtGui import QPixmap, QImage
 from PyQt5.QtCore import QTimer, Qt
 import sys
+from concurrent.futures import ThreadPoolExecutor
 
 from gui_simple import Ui_MainWindow
 from camera import IDS, Ham
@@ -14,8 +15,17 @@ from VSY import VSyCamera as vsy
 from VSY import VsyGvspPixelType
 from motion_controller import xps, smartact, nators
 import numpy as np
-from PIL import Image
 from Scanner import Scanner
+from frame_sink import create_sink
+from storage_check import check_storage, estimate_compression_ratio, WriteRateMonitor
+from beam_center import BeamCenterTracker
+from live_map import LiveScanMap
+from frame_metrics import FrameQualityMonitor, describe_flags
+from rescan import plan_revisit, revisit_moves
+from drift import DriftTracker
+from frame_pipeline import Pipeline, Crop, Bin, DarkSubtract, Calibrate, Stats, ToneMap
+from dark_library import DarkLibrary
+from calibration import DetectorCalibration
 from copy import copy, deepcopy
 from typing import Union, List, Tuple
 
@@ -53,8 +63,54 @@ class MainWindow(QMainWindow):
         self.abs_y = []
         self.final_pos = None
         self.center = None
-        self.dark = None
-        self.dps = []
+        self.auto_center = False  # True 时按衍射图中心裁剪（跟踪光斑漂移）
+        self.center_tracker = BeamCenterTracker()
+        self.live_map = None
+        self.quality_monitor = FrameQualityMonitor()
+        self.binning = (1, 1)  # 裁剪后、显示和保存前的软件合并像素
+        self.save_pipeline = None  # 裁剪 -> 合并像素 -> 扣暗场
+        self.display_pipeline = None  # 裁剪 -> 合并像素 -> 统计 -> 灰度映射
+        self.drift_tracker = DriftTracker(downsample=8)
+        self.drift_interval = 0  # 每隔多少个扫描点回到参考点（第一个扫描点）测量漂移，0 表示不测量
+        self.drift_apply = None  # 漂移修正方式：None, 'crop'（平移裁剪中心）或 'position'（修正记录的位置）
+        self.auto_rescan = True  # 扫描结束后自动重扫被标记的点
+        self.rescan_mode = 'append'  # 'append': 替换帧追加在末尾，保留原帧；'overwrite': 覆盖原帧
+        self.rescan_order = []
+        self.rescan_dx = []
+        self.rescan_dy = []
+        self.rescan_back = None
+        self.rescan_point = 0
+        self.rescan_slot = 0
+        self.rescan_failed = []
+        self.map_scene = QGraphicsScene()
+        self.map_view = QGraphicsView(self.map_scene)  # 独立窗口显示扫描图像（BF/DF/DPCx/DPCy）
+        self.map_view.setWindowTitle('扫描图像 BF | DF / DPCx | DPCy')
+        self.dark = None  # 整帧平均暗场（float32），来自暗场库
+        self.dark_library = DarkLibrary()
+        self.dark_frames = 32  # 采集暗场时平均的帧数
+        self.auto_acquire_dark = False  # 暗场库中没有匹配的暗场时，开始扫描前自动采集（需确认光束已挡住）
+        self.dark_written = False
+        self.camera_info = None
+        self.calibration = None  # 探测器标定（增益图、坏像素、ADU/光子），见 calibration.py
+        self.apply_calibration = True  # 保存的帧是否应用标定
+        self.sensor_shape = None
+        self.sink = None
+        self.sink_type = 'hdf5'  # 'hdf5', 'cxi', 'sparse', 'tiff', 'npy', 'png'
+        self.sparse_threshold = 0  # 稀疏存储阈值（扣除暗场后）
+        self.swmr = True  # hdf5/cxi 使用单写多读模式，扫描时其他进程可读取
+        # CXI文件中记录的实验参数，单位：m，由界面输入（波长 nm、距离 mm、像素尺寸 µm）
+        self.wavelength = None
+        self.detector_distance = None
+        self.pixel_size = None
+        self.start_pos = None
+        self.settle_time = 0.8  # 每次移动后等待位移台稳定的时间（s）
+        self.move_time = 0.0  # 实测的每个扫描点的移动耗时（s），用于估计数据速率
+        self.extra_delay = 0.0  # 磁盘写入速度不足时每个扫描点额外等待的时间（s）
+        self.storage_check = None  # 后台运行的磁盘写入速度检查（Future）
+        self.storage_warning = None
+        self._storage_executor = ThreadPoolExecutor(max_workers=1)
+        self.write_monitor = None
+        self.write_timer = None
 
         # 这里添加事件响应
         self.ui.carmera_init.clicked.connect(self.init_camera)
@@ -72,6 +128,13 @@ class MainWindow(QMainWindow):
         self.ui.y_motion.returnPressed.connect(self.set_ymotion)
         self.ui.log.clicked.connect(self.set_log)
         self.ui.save_image.clicked.connect(self.save_dark)
+        self.ui.auto_center.clicked.connect(self.set_auto_center)
+        self.ui.wavelength.returnPressed.connect(self.set_wavelength)
+        self.ui.detector_distance.returnPressed.connect(self.set_detector_distance)
+        self.ui.pixel_size.returnPressed.connect(self.set_pixel_size)
+        self.ui.select_sink.currentTextChanged.connect(self.set_sink_type)
+        self.ui.select_binning.currentTextChanged.connect(self.set_binning)
+        self.build_pipelines()
 
     def init_camera(self):
 
@@ -152,6 +215,9 @@ class MainWindow(QMainWindow):
             
 
             if camera_flag:
+                self.camera_info = self.camera.get_camera_info()
+                self.load_calibration()
+                self.build_pipelines()
                 self.camera.start_acquisition()
                 sleep(1)  # 部分相机启动需要时间，不能立刻获取图像
                 # self.camera.set_frame_rate()
@@ -187,6 +253,14 @@ class MainWindow(QMainWindow):
         elif self.ui.init_motion_ctr.text() == '开始扫描':
             self.check_path()
             self.generate_scan_point()
+            self.ensure_dark()
+            if not self.open_sink():
+                return
+            self.live_map = LiveScanMap(self.abs_x, self.abs_y, self.frame_shape)
+            self.quality_monitor.reset()
+            self.drift_tracker.reset()
+            self.quality_monitor.saturation_level = self.full_scale
+            self.map_view.show()
             self.scan()
             self.ui.init_motion_ctr.setText('终止位移台移动')
         else:
@@ -249,9 +323,13 @@ class MainWindow(QMainWindow):
         # print(self.abs_x, self.abs_y)
 
     def scan(self):
+        if self.drift_interval and self.camera and self.cur_point % self.drift_interval == 0:
+            self.measure_drift()
+        start = time.perf_counter()
         self.motion.move_by(self.x[self.cur_point], axis=0)
         self.motion.move_by(self.y[self.cur_point], axis=1)
-        sleep(0.8)
+        self.move_time = time.perf_counter() - start
+        sleep(self.settle_time)
         self.cur_point = self.cur_point + 1
         if self.camera:
             self.save_image(self.cur_point)
@@ -263,17 +341,94 @@ class MainWindow(QMainWindow):
 
         if self.cur_point < len(self.x):
             # print(2)
-            QTimer.singleShot(300, self.scan)
+            QTimer.singleShot(300 + int(self.extra_delay * 1000), self.scan)
         else:
             self.motion.move_by(-self.final_pos[0], axis=0)
             sleep(5)
             self.motion.move_by(-self.final_pos[1], axis=1)
-            print('保存dps')
-            from h5py import File
-            with File(os.path.join(self.save_path, 'dps.h5'), 'w') as f:
-                f.create_dataset('dps', data=self.dps)
+            if not (self.auto_rescan and self.start_rescan()):
+                print('保存dps')
+                self.close_sink()
         #     self.save_image()
 
+    def measure_drift(self):
+        """
+        回到参考点（第一个扫描点，abs坐标原点）采集一帧，与第一次的参考帧做相位相关得到漂移，再回到当前点。
+        使用未裁剪的整帧，测量结果不受裁剪中心修正的影响
+        """
+        if self.cur_point == 0:
+            x = y = 0.0  # 还未开始移动，当前就在参考点
+        else:
+            x, y = self.abs_x[self.cur_point - 1], self.abs_y[self.cur_point - 1]
+        if x or y:
+            self.motion.move_by(-x, axis=0)
+            self.motion.move_by(-y, axis=1)
+            sleep(self.settle_time)
+        image = self.camera.read_newest_image()
+        if image.ndim == 3:
+            image = image[..., 0]
+        dy, dx = self.drift_tracker.update(image, self.cur_point)
+        if x or y:
+            self.motion.move_by(x, axis=0)
+            self.motion.move_by(y, axis=1)
+        if len(self.drift_tracker.records) > 1:
+            message = f'漂移 dy={dy:.2f} dx={dx:.2f} 像素'
+            print(message)
+            self.ui.statusbar.showMessage(message, 5000)
+
+    def start_rescan(self, indices=None):
+        """
+        重扫被标记的点：按较短的路径依次回到这些点重新采集，替换帧与原帧写在同一个存储中，
+        并记录重扫信息。需在扫描结束、位移台回到起点后调用，存储仍处于打开状态
+
+        参数:
+            indices: 需要重扫的扫描点序号，默认为质量检查标记的点
+
+        返回:
+            是否开始重扫
+        """
+        if indices is None:
+            indices = sorted(i for i in self.quality_monitor.flagged if i < len(self.x))
+        if not indices or self.sink is None or self.camera is None:
+            return False
+        if self.rescan_mode == 'overwrite' and not self.sink.supports_overwrite:
+            print(f'{self.sink_type} 格式不能覆盖已写入的帧，重扫帧将追加在末尾')
+        self.rescan_order = plan_revisit(self.abs_x, self.abs_y, indices)
+        self.rescan_dx, self.rescan_dy, self.rescan_back = revisit_moves(self.abs_x, self.abs_y, self.rescan_order)
+        self.rescan_point = 0
+        self.rescan_slot = len(self.x)
+        self.rescan_failed = []
+        print(f'重扫 {len(self.rescan_order)} 个点: {[i + 1 for i in self.rescan_order]}')
+        QTimer.singleShot(300, self.rescan)
+        return True
+
+    def rescan(self):
+        k = self.rescan_point
+        index = self.rescan_order[k]
+        self.motion.move_by(self.rescan_dx[k], axis=0)
+        self.motion.move_by(self.rescan_dy[k], axis=1)
+        sleep(self.settle_time)
+        if self.rescan_mode == 'overwrite' and self.sink.supports_overwrite:
+            slot = index
+        else:
+            slot = self.rescan_slot
+            self.rescan_slot += 1
+        flags = self.quality_monitor.flagged.get(index, 0)
+        self.quality_monitor.reset_reference()  # 上一帧不是相邻点，不比较相关性
+        self.save_image(index + 1, slot=slot)
+        self.sink.write_rescan(index, slot, flags)
+        if self.quality_monitor.flagged.get(slot):
+            self.rescan_failed.append(index + 1)
+        self.rescan_point += 1
+        if self.rescan_point < len(self.rescan_order):
+            QTimer.singleShot(300, self.rescan)
+        else:
+            self.motion.move_by(self.rescan_back[0], axis=0)
+            self.motion.move_by(self.rescan_back[1], axis=1)
+            print('重扫完成' + (f'，仍异常的点: {self.rescan_failed}' if self.rescan_failed else ''))
+            print('保存dps')
+            self.close_sink()
+
     def image_show(self):
         # while time.time() - a < 20:
         self.scene.clear()
@@ -281,19 +436,20 @@ class MainWindow(QMainWindow):
         image = self.camera.read_newest_image()
         # if self.center is None:
         #     self.center = self.find_center(image)
-        image = self.crop_image(image)
-        self.photon = np.max(image)
+        if self.sensor_shape is None:
+            self.sensor_shape = image.shape[:2]
+            self.load_dark()
+        image = self.display_pipeline(image)
+        self.photon = self.display_pipeline.stage('stats').result['max']
         # print(image.shape)
-        if self.ui.log.text() == '正常显示':
-            image = (4095 * np.log10(9 * image / 4095 + 1)).astype(np.uint16)
         # image = image.transpose((2, 0, 1))
         # print(np.max(image), image.shape)
 
-        if self.pixel_type == 'mono12':
-            frame = QImage(image << 4, image.shape[0], image.shape[1], QImage.Format_Grayscale16)
-        elif self.pixel_type == 'mono16':
-            frame = QImage(image, image.shape[0], image.shape[1], QImage.Format_Grayscale16)
+        if self.pixel_type in ('mono12', 'mono16'):
+            # 灰度映射已把满量程映射到 0~65535（log显示时为对数曲线）
+            frame = QImage(image.data, image.shape[1], image.shape[0], image.strides[0], QImage.Format_Grayscale16)
         elif image.dtype == np.uint8:
+            image = self.display_pipeline.output('stats')
             frame = QImage(image, image.shape[0], image.shape[1], QImage.Format_RGB888)
         frame = frame.scaled(640, 640, Qt.KeepAspectRatio, Qt.SmoothTransformation)
         pix = QPixmap.fromImage(frame)
@@ -304,77 +460,262 @@ class MainWindow(QMainWindow):
         # time.sleep(2)
         # print(time.time())
 
-    def save_image(self, name=0):
+    def save_image(self, name=0, slot=None):
+        """
+        采集一帧并保存。name 为0时采集暗场并存入暗场库，否则为扫描点序号（从1开始）；
+        slot 为写入存储的位置，默认为 name - 1，重扫追加时指向末尾
+        """
         try:
-            image_ = self.camera.read_newest_image()
-            image_ = self.crop_image(image_)
             if name == 0:
-                self.dark = image_
+                self.acquire_dark()
             else:
-                image_ = image_ - self.dark
-                self.dps.append(image_)
-            image_ = Image.fromarray(image_)
-            if not os.path.exists(self.save_path):
-                os.makedirs(self.save_path)
-
-            save_path = os.path.join(self.save_path, f'{name}.png')
-            print(save_path)
-            image_.save(save_path)
+                image_ = self.camera.read_newest_image()
+                # 饱和减法扣暗场，结果写入预分配的缓冲区；raw 为扣暗场前的图像，用于判断饱和
+                image_ = self.save_pipeline(image_)
+                raw = self.save_pipeline.output('bin')
+                if slot is None:
+                    slot = name - 1
+                dark = self.save_pipeline.stage('dark').dark
+                if not self.dark_written and dark is not None:
+                    # 与保存的帧同样裁剪、合并的暗场，需在第一帧之前写入（SWMR模式下之后不能再建数据集）
+                    self.sink.write_dark(dark)
+                    self.dark_written = True
+                self.sink.write(slot, image_)
+                self.save_position(slot)
+                self.check_quality(slot, image_, raw)
+                if slot == name - 1:
+                    self.update_live_map(slot, image_)
 
         except Exception as e:
             raise e
 
+    def open_sink(self):
+        """按选择的格式创建帧存储，扫描过程中逐帧写入；CXI 缺少实验参数时不创建，返回 False"""
+        self.close_sink()
+        if self.sink_type == 'cxi':
+            missing = [name for name, value in (('波长', self.wavelength), ('探测器距离', self.detector_distance),
+                                                ('像素尺寸', self.pixel_size)) if value is None]
+            if missing:
+                message = f'CXI 文件需要{"、".join(missing)}，请先输入'
+                print(message)
+                self.ui.statusbar.showMessage(message, 5000)
+                return False
+            # 合并像素后的像素尺寸 (x, y)，x 沿列方向
+            pixel_size = (self.pixel_size * self.binning[1], self.pixel_size * self.binning[0])
+            kwargs = {'abs_x': self.abs_x, 'abs_y': self.abs_y, 'wavelength': self.wavelength,
+                      'distance': self.detector_distance, 'pixel_size': pixel_size, 'exposure': self.ex_time,
+                      'swmr': self.swmr}
+        elif self.sink_type == 'hdf5':
+            kwargs = {'n_frames': len(self.x), 'swmr': self.swmr}
+        elif self.sink_type == 'sparse':
+            kwargs = {'threshold': self.sparse_threshold, 'swmr': self.swmr}
+        elif self.sink_type == 'npy':
+            kwargs = {'n_frames': len(self.x)}
+        else:
+            kwargs = {}
+        # 写入速度测试在后台运行，结果由 show_write_rate 处理
+        self.extra_delay = 0.0
+        self.storage_warning = None
+        self.storage_check = self._storage_executor.submit(
+            check_storage, self.save_path, self.frame_shape, fps=1 / self.estimate_point_period(),
+            compression_ratio=self.storage_compression_ratio(), size_mb=32)
+        self.sink = create_sink(self.sink_type, self.save_path, **kwargs)
+        self.write_monitor = WriteRateMonitor(self.sink)
+        self.write_timer = QTimer(self)
+        self.write_timer.timeout.connect(self.show_write_rate)
+        self.write_timer.start(1000)
+        self.start_pos = None
+        if self.motion is not None:
+            self.start_pos = (self.motion.get_position(0), self.motion.get_position(1))
+        self.dark_written = False
+        return True
+
+    def save_position(self, index):
+        """记录实测位置（相对扫描起点，mm），与Scanner.abs_x/abs_y对应"""
+        if self.start_pos is None or None in self.start_pos:
+            return
+        x, y = self.motion.get_position(0), self.motion.get_position(1)
+        if x is not None and y is not None:
+            if self.drift_apply == 'position':
+                dx, dy = self.drift_tracker.position_correction()
+                x, y = x + dx, y + dy
+            self.sink.write_position(index, x - self.start_pos[0], y - self.start_pos[1])
+
+    def estimate_point_period(self):
+        """
+        每个扫描点的耗时（s）：移动 + 稳定 + 曝光 + 显示和下一点的定时器间隔（0.4 s）+ 额外等待。
+        移动耗时为上一个扫描点的实测值，还未扫描时按0计（数据速率偏高，检查偏保守）
+        """
+        return self.move_time + self.settle_time + self.ex_time + 0.4 + self.extra_delay
+
+    def storage_compression_ratio(self):
+        """由当前的一帧估计所选存储格式的压缩比，hdf5、cxi、npy 不压缩"""
+        kind = {'sparse': 'sparse', 'png': 'deflate', 'tiff': 'deflate'}.get(self.sink_type)
+        if kind is None or self.camera is None:
+            return 1.0
+        image = self.camera.read_newest_image()
+        if not isinstance(image, np.ndarray):
+            return 1.0
+        return estimate_compression_ratio(self.save_pipeline(image), kind, self.sparse_threshold)
+
+    def apply_storage_check(self):
+        """磁盘写入速度检查完成后，速度不足时按建议的抽帧系数延长扫描点间隔（步进扫描不跳过扫描点）"""
+        if self.storage_check is None or not self.storage_check.done():
+            return
+        future, self.storage_check = self.storage_check, None
+        try:
+            ok, measured, expected, decimation = future.result()
+        except Exception as e:
+            print(f'磁盘写入速度检查失败：{e}')
+            return
+        if not ok:
+            self.extra_delay = (decimation - 1) * self.estimate_point_period()
+            self.storage_warning = (f'磁盘写入 {measured:.1f} MB/s 不足以保存 {expected:.1f} MB/s，'
+                                    f'每个扫描点多等待 {self.extra_delay:.1f} s')
+            print(self.storage_warning)
+
+    def show_write_rate(self):
+        self.apply_storage_check()
+        if self.write_monitor is not None:
+            text = self.write_monitor.status_text()
+            if self.storage_warning:
+                text = f'{self.storage_warning}  {text}'
+            self.ui.statusbar.showMessage(text)
+
+    def close_sink(self):
+        if self.write_timer is not None:
+            self.write_timer.stop()
+            self.write_timer = None
+        if self.drift_interval and len(self.drift_tracker.records) > 1:
+            self.drift_tracker.save(os.path.join(self.save_path, 'drift.npz'))
+        if self.sink is not None and self.calibration is not None and self.apply_calibration:
+            # 保存的帧已应用标定，同时保存所用的标定数据
+            self.calibration.save(os.path.join(self.save_path, 'calibration.npz'))
+        if self.sink is not None:
+            self.sink.close()
+            self.ui.statusbar.showMessage(f'已保存 {self.sink.frame_count} 帧')
+            print(f'处理耗时: {self.save_pipeline.timing_text()}')
+            self.sink = None
+            self.write_monitor = None
+
+    def check_quality(self, index, image, raw=None):
+        metrics, flags = self.quality_monitor.update(index, image, raw)
+        self.sink.write_metrics(index, metrics, flags)
+        if flags:
+            message = f'第 {index + 1} 点异常：{describe_flags(flags)}'
+            print(message)
+            self.ui.statusbar.showMessage(message, 5000)
+
+    def update_live_map(self, index, image):
+        if self.live_map is None or image.shape != self.live_map.frame_shape:
+            return
+        self.live_map.add(index, image)
+        mosaic = self.live_map.render_mosaic()
+        frame = QImage(mosaic.data, mosaic.shape[1], mosaic.shape[0], mosaic.strides[0], QImage.Format_Grayscale16)
+        frame = frame.scaled(640, 640, Qt.KeepAspectRatio, Qt.FastTransformation)
+        self.map_scene.clear()
+        self.map_scene.addPixmap(QPixmap.fromImage(frame))
+
     def save_dark(self):
         try:
-            self.check_path()
             self.save_image(0)
         except Exception as e:
             print(e)
 
-    def find_center(self, image):
-        image = image - np.mean(image)
-        image[image < 0] = 0
-        image = image / np.max(image)
-
-        total_intensity = np.sum(image)
-
-        # 生成坐标网格
-        y_indices, x_indices = np.indices(image.shape)
-
-        # 计算加权质心坐标
-        print(np.sum(x_indices * image))
-        x_center = np.sum(x_indices * image) / total_intensity
-        y_center = np.sum(y_indices * image) / total_intensity
-
-        # 确保坐标在图像范围内
-        x_center = np.clip(x_center, 0, image.shape[1] - 1)
-        y_center = np.clip(y_center, 0, image.shape[0] - 1)
-
-        return (int(round(x_center)), int(round(y_center)))
-
-    def crop_image(self, image):
-        if image.ndim == 2:
-            width, height = image.shape
+    def dark_key(self):
+        """当前相机设置对应的暗场库键：序列号、曝光时间、读出区域、增益、像素格式"""
+        info = self.camera_info or {}
+        roi = info.get('roi')
+        if roi is None:
+            if self.sensor_shape is None:
+                self.sensor_shape = self.camera.read_newest_image().shape[:2]
+            roi = self.sensor_shape
+        return DarkLibrary.make_key(info.get('serial'), self.ex_time, roi, info.get('gain'), self.pixel_type)
+
+    def set_dark(self, dark):
+        self.dark = dark
+        self.save_pipeline.stage('dark').set_full_dark(dark)
+
+    def load_dark(self):
+        """从暗场库读取与当前设置匹配的暗场，返回是否找到"""
+        if self.camera is None:
+            return False
+        key = self.dark_key()
+        dark = self.dark_library.lookup(key)
+        self.set_dark(dark)
+        if dark is None:
+            print(f'暗场库中没有 {DarkLibrary.key_name(key)}，请挡住光束后采集暗场')
+        return dark is not None
+
+    def acquire_dark(self):
+        """采集 dark_frames 帧求平均并存入暗场库（调用前需挡住光束）"""
+        dark = self.dark_library.acquire(self.camera, self.dark_key(), self.dark_frames,
+                                         frame_period=max(self.frame_period, 1) / 1000)
+        if dark is not None:
+            self.set_dark(dark)
+
+    def load_calibration(self):
+        """读取当前相机的探测器标定文件（calibration/detector/<序列号>_<像素格式>.npz）"""
+        path = DetectorCalibration.default_path(self.camera_info['serial'], self.pixel_type)
+        self.calibration = DetectorCalibration.load(path)
+        if self.calibration is not None:
+            print(f'已读取探测器标定 {self.calibration}')
+
+    def ensure_dark(self):
+        """扫描开始前查找匹配的暗场，没有时按 auto_acquire_dark 决定是否自动采集"""
+        if self.camera is None or self.load_dark():
+            return
+        if self.auto_acquire_dark:
+            self.acquire_dark()
         else:
-            width, height, _ = image.shape
-
-        # x1 = self.center[0] - self.xpixel_num // 2  # + self.x_offset
-        # y1 = self.center[1] - self.ypixel_num // 2  # + self.y_offset
-        x1 = width // 2 - self.xpixel_num // 2
-        y1 = height // 2 - self.ypixel_num // 2
-        # print(x1, y1)
-        x2 = x1 + self.xpixel_num
-        y2 = y1 + self.ypixel_num
-
-        x1 = max(0, x1)
-        y1 = max(0, y1)
-        x2 = min(width, x2)
-        y2 = min(height, y2)
-        if image.ndim == 2:
-            new_image = image[x1:x2, y1:y2]
+            print('警告：没有匹配的暗场，本次扫描不扣暗场')
+
+    def find_center(self, image):
+        """返回衍射图中心 (行, 列)，漂移不超过容差时使用缓存值"""
+        if image.ndim == 3:
+            image = image[..., 0]
+        return self.center_tracker.update(image)
+
+    def crop_origin(self, image):
+        """
+        裁剪窗口左上角 (行, 列)，由 Crop 阶段调用；Crop 会把窗口限制在图像内并保持裁剪尺寸不变
+        """
+        width, height = image.shape[:2]
+        if self.auto_center:
+            self.center = self.find_center(image)
+            x1 = self.center[0] - self.xpixel_num // 2 + self.x_offset
+            y1 = self.center[1] - self.ypixel_num // 2 + self.y_offset
         else:
-            new_image = image[x1:x2, y1:y2, :]
-        return new_image.astype(image.dtype)
+            x1 = width // 2 - self.xpixel_num // 2
+            y1 = height // 2 - self.ypixel_num // 2
+            if self.drift_apply == 'crop':
+                # 裁剪窗口跟随测得的衍射图漂移
+                x1 += int(round(self.drift_tracker.drift[0]))
+                y1 += int(round(self.drift_tracker.drift[1]))
+        return x1, y1
+
+    @property
+    def full_scale(self):
+        """合并像素后的满量程"""
+        level = 65535 if self.pixel_type == 'mono16' else 4095
+        return min(level * self.binning[0] * self.binning[1], 65535)
+
+    def build_pipelines(self):
+        """按当前的裁剪尺寸、合并倍数和显示方式重建处理流程，缓冲区在处理第一帧时分配"""
+        size = (self.xpixel_num, self.ypixel_num)
+        # 彩色图像不合并像素
+        binning = self.binning if self.pixel_type in (None, 'mono12', 'mono16') else (1, 1)
+        crop, bin_ = Crop(size, self.crop_origin), Bin(binning)
+        dark = DarkSubtract(crop=crop, bin=bin_)  # 整帧暗场按裁剪位置和合并倍数换算
+        dark.set_full_dark(self.dark)
+        stages = [crop, bin_, dark]
+        if self.calibration is not None and self.apply_calibration:
+            stages.append(Calibrate(self.calibration, crop=crop, bin=bin_))
+        # 合并像素后、扣暗场前的帧用于饱和判断，不能被原地校正修改
+        self.save_pipeline = Pipeline(stages, keep=('bin',))
+        mode = 'log' if self.ui.log.text() == '正常显示' else 'linear'
+        self.display_pipeline = Pipeline([Crop(size, self.crop_origin), Bin(binning), Stats(self.full_scale),
+                                          ToneMap(self.full_scale, mode)])
 
     def set_xmotion(self):
         distance = self.ui.xmotion.text()
@@ -400,14 +741,46 @@ class MainWindow(QMainWindow):
 
     def set_xpixel_num(self):
         self.xpixel_num = int(self.ui.xpixel_num.text())
+        self.build_pipelines()
 
     def set_ypixel_num(self):
         self.ypixel_num = int(self.ui.ypixel_num.text())
+        self.build_pipelines()
 
     def set_ex_time(self):
         # 文本框输入为：ms，传参为：S 
         self.ex_time = float(self.ui.ex_time.text()) / 1000
         self.camera.set_ex_time(self.ex_time)
+        # 暗场与曝光时间对应，换用暗场库中该曝光时间的暗场
+        self.load_dark()
+
+    def set_sink_type(self, sink_type):
+        self.sink_type = sink_type
+
+    @staticmethod
+    def _read_length(edit, unit):
+        """读取长度输入框，空白时为 None，unit 为输入单位对应的米数"""
+        text = edit.text().strip()
+        return float(text) * unit if text else None
+
+    def set_wavelength(self):
+        self.wavelength = self._read_length(self.ui.wavelength, 1e-9)
+
+    def set_detector_distance(self):
+        self.detector_distance = self._read_length(self.ui.detector_distance, 1e-3)
+
+    def set_pixel_size(self):
+        self.pixel_size = self._read_length(self.ui.pixel_size, 1e-6)
+
+    @property
+    def frame_shape(self):
+        """保存的帧尺寸（裁剪并合并像素之后）"""
+        return self.xpixel_num // self.binning[0], self.ypixel_num // self.binning[1]
+
+    def set_binning(self, text):
+        # 暗场为整帧暗场，由处理流程按合并倍数换算，不需要重新采集
+        self.binning = tuple(int(v) for v in text.split('x'))
+        self.build_pipelines()
 
     def set_save_path(self):
         self.save_path = self.ui.save_path.text()
@@ -429,6 +802,13 @@ class MainWindow(QMainWindow):
             self.image_timer.stop()
             self.frame_period -= 10
             self.image_timer.start(self.frame_period)
+        self.display_pipeline.stage('tone').mode = 'log' if self.ui.log.text() == '正常显示' else 'linear'
+
+    def set_auto_center(self):
+        """切换按衍射图中心裁剪和按图像中心裁剪，开启时重新估计中心"""
+        self.auto_center = not self.auto_center
+        self.ui.auto_center.setText('固定中心' if self.auto_center else '自动居中')
+        self.center_tracker.reset()
 
 
 if __name__ == '__main__':
@@ -2,11 +2,17 @@ from threading import Thread, Event
 from queue import Queue
 import time
 from time import sleep
-from copy import deepcopy
-from motion_controller import xps
-from camera import PCOCamera
+from frame_sink import HDF5Sink
+from storage_check import check_storage, WriteRateMonitor
+from frame_metrics import FrameQualityMonitor
+from position_trace import PositionTrace, FrameTimes
+from clock_sync import ClockSyncService
+from frame_sequence import FrameSequence
+from frame_pipeline import Pipeline, PipelinePool, Bin, DarkSubtract, Calibrate
+from position_compare import compare_positions, TriggerMatcher
+from scan_planner import FlyScanPlan
+from pvt_trajectory import PVTTrajectory
 from threading import Thread
-from PIL import Image
 import os 
 import numpy as np
 import h5py
@@ -25,9 +31,25 @@ class SoftTriggerFlyScan:
             'y_ori': 0.5,             # y轴起始位置
             'ystep': 0.1,           # 步长 (mm)
             'sampling_interval': 0.3,  # 采样间隔 (秒)
-            'scan_num': 20
+            'scan_num': 20,
+            'velocity': 0.5            # X轴速度 (mm/s)，用于估计帧数
         }
         print(self.scan_params)
+        self.decimation = 1  # 每 decimation 个采样间隔保存一帧
+        self.binning = (1, 1)  # 保存前合并像素，5120×5120 的相机一般用 (4, 4)
+        self.workers = 2  # 图像处理线程数
+        self.dark = None  # 整帧平均暗场（dark_library.DarkLibrary），None 表示不扣暗场
+        self.calibration = None  # 探测器标定（calibration.DetectorCalibration），None 表示不校正
+        self.trace_axes = (0, 1)  # 扫描过程中连续记录位置的轴
+        self.frame_time_offset = 0.0  # 帧时间戳到曝光中点的偏移（s），见 position_trace.FrameTimes
+        self.clock_interval = 1.0  # 扫描过程中采样相机时钟的间隔（s），见 clock_sync.ClockSyncService
+        # 'sequence'：相机按自身帧率连续采集，依次取出环形缓冲区中的每一帧（不丢帧）；
+        # 'poll'：每个 sampling_interval 读取一次最新帧，两次读取之间的帧丢弃
+        self.acquisition = 'sequence'
+        self.n_buffers = 256  # sequence 模式相机环形缓冲区的帧数
+        self.max_pending = 8  # 处理线程积压超过该帧数时暂停取帧，由相机缓冲区暂存
+        self.frame_id_wrap = None  # 帧计数的回绕周期，见 frame_sequence.FrameSequence
+        self.full_scale = 4095  # 相机的满量程（ADU），mono16 相机为 65535，用于合并像素后的饱和判断
         self._generate_path()
 
     def _generate_path(self):
@@ -43,6 +65,36 @@ class SoftTriggerFlyScan:
                 self.x_pos.append(self.scan_params['xrange'][0])
                 self.y_pos.append((i+1) * self.scan_params['ystep'] + offset)
 
+    def frame_interval(self):
+        """保存的帧间隔（s）：sequence 模式为相机帧周期，poll 模式为采样间隔，均乘以抽帧系数"""
+        if self.acquisition == 'sequence':
+            period = self.camera.get_frame_period()
+            if period and period > 0:
+                return period * self.decimation
+        return self.scan_params['sampling_interval'] * self.decimation
+
+    def estimate_frame_count(self, margin=1.2):
+        """
+        根据路径长度、X轴速度和帧间隔估计总帧数，用于预分配存储
+
+        参数:
+            margin: 余量系数，加减速和线程调度会使实际帧数略多于理论值
+
+        返回:
+            估计帧数
+        """
+        if 'frame_count' in self.scan_params:
+            # scan_planner.FlyScanPlan 按加减速计算的帧数
+            return int(np.ceil(self.scan_params['frame_count'] / self.decimation * margin))
+        interval = self.frame_interval()
+        velocity = self.scan_params.get('velocity')
+        line_length = abs(self.scan_params['xrange'][1] - self.scan_params['xrange'][0])
+        n_lines = len(self.x_pos) - 1
+        if not velocity:
+            return 64 * n_lines
+        frames_per_line = line_length / velocity / interval
+        return int(np.ceil(n_lines * (frames_per_line + 1) * margin))
+
     def _move_and_wait(self, pos, axis):
         """异步移动并在后台等待完成"""
         try:
@@ -53,8 +105,60 @@ class SoftTriggerFlyScan:
         return move_thread
     
 
-    def run_scan(self):
-        images = []
+    def check_storage(self, save_file):
+        """测试保存位置的写入速度，不足时自动增大抽帧系数"""
+        image = self.camera.read_newest_image()
+        if image is None:
+            return
+        directory = os.path.dirname(os.path.abspath(save_file))
+        ok, measured, expected, decimation = check_storage(
+            directory, (image.shape[0] // self.binning[0], image.shape[1] // self.binning[1]), image.dtype,
+            fps=self.decimation / self.frame_interval())
+        self.decimation = decimation
+
+    def run_scan(self, save_file, decimation=None, binning=None):
+        """
+        执行飞扫，图像直接写入按估计帧数预分配的分块HDF5数据集，结束时截断到实际帧数，
+        不在内存中保留整个扫描的数据。
+
+        扫描过程中在后台线程连续记录位移台位置，每行结束后按各帧的曝光时刻插值出位置，
+        写入数据集 'position'（mm）和 'frame_time'（相对扫描开始，s）；
+        位置记录和帧时间戳另存为 <save_file>_trace.npz、<save_file>_frames.npz。
+
+        acquisition 为 'sequence' 时保存相机产生的每一帧（按 decimation 抽帧），
+        用帧计数检查连续性，丢帧报告另存为 <save_file>_dropped.npz
+
+        参数:
+            save_file: 保存的h5文件路径
+            decimation: 抽帧系数，None 时根据磁盘写入速度自动选择
+            binning: 合并像素倍数，如 (4, 4)，None 时使用 self.binning
+
+        返回:
+            实际采集的帧数
+        """
+        if binning is not None:
+            self.binning = tuple(binning)
+        self._check_acquisition()
+        if decimation is None:
+            self.check_storage(save_file)
+        else:
+            self.decimation = decimation
+        interval = self.scan_params['sampling_interval'] * self.decimation
+        sequence_mode = self.acquisition == 'sequence'
+        n_frames = self.estimate_frame_count()
+        print(f'预计帧数: {n_frames}')
+        store = HDF5Sink(save_file, n_frames=n_frames, swmr=True)
+        monitor = WriteRateMonitor(store)
+        quality = FrameQualityMonitor(saturation_level=self.saturation_level())
+        # 合并像素和质量检查在线程池中完成，采集循环只负责读帧
+        pool = PipelinePool(self._make_pipeline, workers=self.workers)
+        trace = PositionTrace(self.motion, self.trace_axes)
+        # 能读取相机时钟时，扫描过程中定期采样，把帧时间戳换算到主机时钟；否则由帧时间戳被动拟合
+        clocks = ClockSyncService(self.clock_interval)
+        frame_times = FrameTimes(self.frame_time_offset, clocks.add_camera(self.camera))
+        self._sequence = FrameSequence(self.frame_id_wrap)
+        self._seen = 0
+        count = 0
         try:
         # 初始化位置，异步移动并等待完成
             self._move_and_wait(self.y_pos[0], 1).join()
@@ -62,110 +166,372 @@ class SoftTriggerFlyScan:
             self._move_and_wait(self.x_pos[0], 0).join()
         except Exception as e:
             print(e)
+            pool.close()
+            store.close()
             sys.exit(1)
 
+        trace.start()
+        clocks.start()
+        self._t0 = time.perf_counter()
+        try:
+            if sequence_mode:
+                self._start_camera()
+            for i in range(1, len(self.y_pos)):
+                if sequence_mode:
+                    # 丢弃换行期间的帧，同时更新帧计数，不算作丢帧
+                    self._drain(pool, count, keep=False)
+                self._prepare_line(i)
+                # 异步移动X轴
+                x_thread = self._start_line(i)
+                print('Fly-scan!')
+                line_start = count
+
+                # 在X轴移动过程中采集图像，写入时会复制，无需deepcopy
+                while x_thread.is_alive():
+                    start = time.time()
+                    self._line_progress()
+                    if sequence_mode:
+                        frames = self._drain(pool, count)
+                    else:
+                        image, info = self.camera.read_newest_frame()
+                        # 重复读到的同一帧丢弃；两次读取之间的帧计为丢失
+                        frames = [(image, info)] if isinstance(image, np.ndarray) and \
+                            self._sequence.update(info['frame_id'], count) >= 0 else []
+                    for image, info in frames:
+                        frame_times.add(count, info)
+                        pool.submit(image, self._store_frame, store, quality, count)
+                        count += 1
+
+                    if sequence_mode:
+                        time.sleep(0.001 if frames else self.frame_interval() / self._frame_decimation() / 2)
+                    else:
+                        time.sleep(max(interval + start - time.time(), 0.001))
+
+                # 确保X轴线程完成
+                x_thread.join()
+                if sequence_mode:
+                    # 取出本行运动结束前曝光的帧
+                    for image, info in self._drain(pool, count, until=time.perf_counter()):
+                        frame_times.add(count, info)
+                        pool.submit(image, self._store_frame, store, quality, count)
+                        count += 1
+                self._assign_positions(store, trace, frame_times, line_start)
+                pool.check()
+                print(monitor.status_text(), f'异常帧 {len(quality.flagged)}',
+                      f'位置采样 {trace.sample_rate():.0f} Hz', self._sequence.report())
+
+                self._next_line(i)
+        finally:
+            trace.stop()
+            clocks.stop()
+            self._finish_scan()
+            if sequence_mode:
+                self.camera.stop_sequence()
+            pool.close()
+            print(f'处理耗时: {pool.timing_text()}')
+            print(f'丢帧报告: {self._sequence.report()}')
+            store.close()
+            name = os.path.splitext(save_file)[0]
+            trace.save(name + '_trace.npz')
+            frame_times.save(name + '_frames.npz')
+            clocks.save(name + '_clock.npz')
+            clock = frame_times.clock_sync()
+            if clock is not None:
+                print(f'相机时钟: {clock.report()}')
+            self._sequence.save(name + '_dropped.npz')
+
+        pool.check()
+        return count
+
+    def _check_acquisition(self):
+        """sequence 模式需要相机按顺序取出环形缓冲区中的帧（Camera.ring_buffer），否则改用 poll 模式"""
+        if self.acquisition == 'sequence' and not self.camera.ring_buffer:
+            print(f'{type(self.camera).__name__} 没有环形缓冲区，改用 poll 模式')
+            self.acquisition = 'poll'
 
-        for i in range(1, len(self.y_pos)):
-            # 异步移动X轴
-            x_thread = self._move_and_wait(self.x_pos[i], 0)
-            print('Fly-scan!')
-            
-            # 在X轴移动过程中采集图像
-            while x_thread.is_alive():
-                start = time.time()
-                image = deepcopy(self.camera.read_newest_image())
-                # print(image)
-                if image is not None:
-                    images.append(image)
-                # print('image')
-
-                time.sleep(max(self.scan_params['sampling_interval'] + start - time.time(), 0.001))
-            
-            # 确保X轴线程完成
-            x_thread.join()
-            
-            # 移动Y轴并等待完成（可根据需要改为异步）
-            y_thread = self._move_and_wait(self.y_pos[i], 1)
-            y_thread.join()
-
-        return images
-
-def auto_exposure(cam, lower_bound, upper_bound, 
-                 max_iter=20, step_scale=1.2, 
-                 min_exposure=1e-6, max_exposure=10.0):
+    def saturation_level(self):
+        """合并像素后的饱和值：满量程 × 合并的像素数，不超过合并结果 uint16 的范围"""
+        return min(self.full_scale * self.binning[0] * self.binning[1], 65535)
+
+    def _drain(self, pool, count, keep=True, until=None):
+        """
+        sequence 模式：取出相机缓冲区中的帧，按顺序检查帧计数，按 decimation 抽帧后返回要保存的帧
+        （依次保存为第 count, count + 1, ... 帧）。
+        处理线程积压超过 max_pending 时暂不取帧；给出 until（主机时间）时等待积压减少后继续取出，
+        直到缓冲区取空、读到主机接收时间晚于 until 的帧，或已取出 2 × n_buffers 帧
+        （每次读取都会等到下一帧的相机不会取空）。
+        keep=False 时取出的帧全部丢弃（只更新帧计数）
+        """
+        kept = []
+        n_read = 0
+        while True:
+            if pool.pending > self.max_pending:
+                if until is None:
+                    return kept
+                time.sleep(0.001)
+                continue
+            # 读取失败时有的相机返回错误码，不是图像的按没有帧处理
+            frames = [(image, info) for image, info in self.camera.read_new_frames()
+                      if isinstance(image, np.ndarray)]
+            if not frames:
+                return kept
+            for image, info in frames:
+                self._seen += 1
+                if keep and (self._seen - 1) % self._frame_decimation() == 0:
+                    # 重复读到的同一帧丢弃
+                    if self._sequence.update(info['frame_id'], count + len(kept)) >= 0:
+                        kept.append((image, info))
+                else:
+                    # 换行期间和抽帧跳过的帧只更新帧计数
+                    self._sequence.update(info['frame_id'])
+            n_read += len(frames)
+            if until is None or frames[-1][1]['host_time'] > until or n_read >= 2 * self.n_buffers:
+                return kept
+
+    def _start_camera(self):
+        """sequence 模式：扫描开始前启动相机连续采集"""
+        self.camera.start_sequence(self.n_buffers)
+
+    def _prepare_line(self, i):
+        """每行开始运动前调用，i 为目标点序号"""
+        pass
+
+    def _start_line(self, i):
+        """开始第 i 行的运动，返回运动线程，线程结束即该行结束"""
+        return self._move_and_wait(self.x_pos[i], 0)
+
+    def _line_progress(self):
+        """运动过程中每次取帧时调用"""
+        pass
+
+    def _next_line(self, i):
+        """第 i 行结束后移动到下一行"""
+        # 移动Y轴并等待完成（可根据需要改为异步）
+        self._move_and_wait(self.y_pos[i], 1).join()
+
+    def _finish_scan(self):
+        """扫描结束（包括出错）时调用"""
+        pass
+
+    def _frame_decimation(self):
+        """sequence 模式下相机产生的帧中每几帧保存一帧"""
+        return self.decimation
+
+    def _assign_positions(self, store, trace, frame_times, first):
+        """
+        由帧的曝光时刻和位置记录插值出第 first 帧之后各帧的位置并写入。
+        相机时钟与主机时钟的关系每行用全部已采集的帧重新拟合
+        """
+        times = frame_times.exposure_times()[first:]
+        x, y = self._frame_positions(trace, frame_times, first, times)
+        for k, index in enumerate(frame_times.indices[first:]):
+            store.write_position(index, x[k], y[k])
+            store.write_frame_time(index, times[k] - self._t0)
+        missing = int(np.count_nonzero(np.isnan(x)))
+        if missing:
+            print(f'{missing} 帧的曝光时刻超出位置记录范围，位置为NaN')
+
+    def _frame_positions(self, trace, frame_times, first, times):
+        """第 first 帧之后各帧的 (X, Y) 位置，由位置记录在曝光时刻 times 插值"""
+        positions = trace.positions_at(times)
+        nan = np.full(len(times), np.nan)
+        x = positions[:, self.trace_axes.index(0)] if 0 in self.trace_axes else nan
+        y = positions[:, self.trace_axes.index(1)] if 1 in self.trace_axes else nan
+        return x, y
+
+    def _make_pipeline(self):
+        """每个处理线程一个：合并像素、扣暗场、应用探测器标定"""
+        bin_ = Bin(self.binning)
+        dark = DarkSubtract(bin=bin_)
+        dark.set_full_dark(self.dark)
+        stages = [bin_, dark]
+        if self.calibration is not None:
+            stages.append(Calibrate(self.calibration, bin=bin_))
+        # 合并像素后的原始帧用于饱和判断，不能被原地校正修改
+        return Pipeline(stages, keep=('bin',))
+
+    def _store_frame(self, image, pipeline, store, quality, index):
+        """
+        在处理线程中调用：image 为处理流程的缓冲区，写入时会复制。
+        饱和按合并像素后、扣暗场前的图像判断；与上一帧的比较按帧序号顺序进行
+        """
+        store.write(index, image)
+        measured = quality.measure(image, pipeline.output('bin'))
+        for i, metrics, flags in quality.update_ordered(index, measured):
+            store.write_metrics(i, metrics, flags)
+
+class HardwareTriggerFlyScan(SoftTriggerFlyScan):
     """
-    自动调节相机曝光时间，使图像最大强度值落入指定区间
-    
-    参数：
-        cam: 相机对象（需实现 get_exposure/set_exposure/read_newest_image）
-        lower_bound: 目标强度下限（像素值）
-        upper_bound: 目标强度上限（像素值）
-        max_iter: 最大迭代次数（默认20）
-        step_scale: 动态调整比例（默认1.5倍）
-        min_exposure: 硬件最小曝光时间（秒，默认1μs）
-        max_exposure: 硬件最大曝光时间（秒，默认10秒）
-        
-    返回：
-        (success, final_exposure, final_max)
-        success: 是否成功调节
-        final_exposure: 最终使用的曝光时间
-        final_max: 最终图像的最大强度值
+    硬件触发飞扫：X轴运动时位移台的位置比较输出（XPS PCO / SmarAct）每经过 trigger_step 产生一个脉冲，
+    相机工作在外部触发模式，每个脉冲曝光一帧，帧在空间上等间距，与软件读取的时机无关。
+    帧按帧计数对应到脉冲序号（position_compare.TriggerMatcher），X位置取脉冲位置；
+    Y位置和曝光时刻仍由位置记录和帧时间戳得到。scan_params 中 'trigger_step' 为触发间隔（mm）。
     """
-    current_exposure = cam.get_ex_time()
 
-    
-    for _ in range(max_iter):
-        # 设置并获取当前曝光时间
-        current_exposure = max(min(current_exposure, max_exposure), min_exposure)
-        cam.cam.stop_acquisition()
-        cam.set_ex_time(current_exposure)
-        cam.start_acquisition()
-        print(current_exposure)
-        
-        # 采集图像并获取最大值
-        img = cam.read_newest_image()
-        if img is None:
-            raise RuntimeError("无法从相机获取图像")
-        current_max = img.max()
-        
-        # 检查是否满足条件
-        if lower_bound <= current_max <= upper_bound:
-            return (True, current_exposure, current_max)
-            
-        # 动态调整策略
-        if current_max < lower_bound:  # 曝光不足
-            new_exposure = current_exposure * step_scale
-            # 当接近上限时降低调整幅度
-            if new_exposure > 0.8 * max_exposure:
-                new_exposure = (current_exposure + max_exposure) / 2
-        else:  # 曝光过度
-            new_exposure = current_exposure / step_scale
-            # 当接近下限时降低调整幅度
-            if new_exposure < 2 * min_exposure:
-                new_exposure = (current_exposure + min_exposure) / 2
-                
-        # 应用调整后的曝光时间
-        current_exposure = new_exposure
-        
-    # 超过最大迭代次数仍未满足条件
-    return (False, current_exposure, current_max)
+    def __init__(self, motion, camera, scan_params=None):
+        super().__init__(motion, camera, scan_params)
+        self.acquisition = 'sequence'
+        # 行两端不触发的距离（mm），用于跳过加减速段
+        self.trigger_margin = self.scan_params.get('trigger_margin', 0.0)
+        self.trigger_input = None  # 相机的触发输入线，None 为相机默认
+        self._matcher = None
+        self.missing_triggers = 0
+
+    def trigger_step(self):
+        """实际触发间隔（mm）：需要抽帧时增大触发间隔，而不是丢弃帧"""
+        return self.scan_params['trigger_step'] * self.decimation
+
+    def _line_window(self, i):
+        """第 i 行（x_pos[i-1] → x_pos[i]）的触发区间，沿运动方向"""
+        start, stop = self.x_pos[i - 1], self.x_pos[i]
+        margin = self.trigger_margin if stop >= start else -self.trigger_margin
+        return start + margin, stop - margin
+
+    def frame_interval(self):
+        velocity = self.scan_params.get('velocity')
+        if velocity:
+            return self.trigger_step() / velocity
+        return super().frame_interval()
+
+    def estimate_frame_count(self, margin=1.0):
+        """每行的脉冲数之和"""
+        total = sum(len(compare_positions(*self._line_window(i), self.trigger_step()))
+                    for i in range(1, len(self.x_pos)))
+        return int(np.ceil(total * margin))
+
+    def _frame_decimation(self):
+        return 1
+
+    def _check_acquisition(self):
+        """外部触发的帧需要按顺序全部取出，没有环形缓冲区的相机不能退回 poll 模式"""
+        if not self.camera.ring_buffer:
+            raise RuntimeError(f'{type(self.camera).__name__} 没有环形缓冲区，无法进行硬件触发飞扫')
+
+    def _start_camera(self):
+        if not self.camera.set_external_trigger(True, self.trigger_input):
+            raise RuntimeError('相机不支持外部触发，无法进行硬件触发飞扫')
+        self.camera.start_sequence(self.n_buffers)
+        self.missing_triggers = 0
+
+    def _prepare_line(self, i):
+        """在X轴静止时设置本行的位置比较，记录第一个脉冲应有的帧计数"""
+        positions = self.motion.enable_position_compare(0, *self._line_window(i), self.trigger_step())
+        if positions is None:
+            raise RuntimeError('位移台不支持位置比较触发，无法进行硬件触发飞扫')
+        last_id = self._sequence.last_id
+        self._matcher = TriggerMatcher(positions, None if last_id is None else last_id + 1, self.frame_id_wrap)
+
+    def _frame_positions(self, trace, frame_times, first, times):
+        _, y = super()._frame_positions(trace, frame_times, first, times)
+        x = np.array([self._matcher.position(frame_id) for frame_id in frame_times.frame_ids[first:]])
+        self.missing_triggers += len(self._matcher.missing)
+        print(self._matcher.report())
+        return x, y
+
+    def _finish_scan(self):
+        self.motion.disable_position_compare(0)
+        self.camera.set_external_trigger(False)
+        print(f'缺少 {self.missing_triggers} 个触发对应的帧')
+
 
 def save_as_compound_dataset(filename, data_list):
     with h5py.File(filename, 'w') as f:
         f.create_dataset('dps', data=data_list)
     
 
+class TrajectoryFlyScan(SoftTriggerFlyScan):
+    """
+    PVT 轨迹飞扫：由 scan_planner.FlyScanPlan 生成整个蛇形路径的 PVT 轨迹（pvt_trajectory.PVTTrajectory），
+    上传到控制器后作为一次连续运动执行，行末掉头时不停止，也没有单独的Y移动和重新启动。
+    也可以直接执行其他连续轨迹，如 Scanner.fly_trajectory 生成的螺旋线、李萨如曲线。
+    相机连续采集，各帧位置由位置记录插值得到；执行进度在采集循环中查询，每换一行（或每10%）打印一次。
+    XPS 需使用多轴组（xps.init_pvt_group）。
+    """
+
+    def __init__(self, motion, camera, plan=None, filename='flyscan.trj', trajectory=None):
+        """
+        参数:
+            plan: scan_planner.FlyScanPlan，生成蛇形轨迹
+            filename: 控制器上的轨迹文件名
+            trajectory: pvt_trajectory.PVTTrajectory，给出时直接执行该轨迹，plan 可以为 None
+        """
+        self.plan = plan
+        self.trajectory = PVTTrajectory.from_plan(plan) if trajectory is None else trajectory
+        self.trajectory_file = filename
+        if plan is not None:
+            scan_params = plan.scan_params()
+        else:
+            period = camera.get_frame_period()
+            scan_params = {'sampling_interval': period if period and period > 0 else 0.02,
+                           'velocity': float(np.max(np.linalg.norm(self.trajectory.velocities, axis=1)))}
+        super().__init__(motion, camera, scan_params)
+        self._line = -1
+        self._progress_time = 0.0
+        self.progress_interval = 0.2  # 查询执行进度的间隔（s）
+
+    def _generate_path(self):
+        """整条轨迹作为一“行”：从起点到终点"""
+        self.x_pos = [self.trajectory.start[0], self.trajectory.end[0]]
+        self.y_pos = [self.trajectory.start[1], self.trajectory.end[1]]
+
+    def estimate_frame_count(self, margin=1.05):
+        return int(np.ceil(self.trajectory.duration / self.frame_interval() * margin))
+
+    def _prepare_line(self, i):
+        if not self.motion.upload_trajectory(self.trajectory, self.trajectory_file):
+            raise RuntimeError('轨迹上传或检查失败')
+        self._line = -1
+
+    def _start_line(self, i):
+        thread = Thread(target=self.motion.run_trajectory, args=(self.trajectory_file,))
+        thread.start()
+        return thread
+
+    def _line_progress(self):
+        now = time.perf_counter()
+        if now - self._progress_time < self.progress_interval:
+            return
+        self._progress_time = now
+        element = self.motion.trajectory_progress()
+        if element is None:
+            return
+        if self.trajectory.lines:
+            line = self.trajectory.line_of_element(element - 1)
+            if line != self._line:
+                self._line = line
+                print(f'第 {line + 1}/{len(self.trajectory.lines)} 行')
+        else:
+            percent = 10 * (10 * element // len(self.trajectory))
+            if percent != self._line:
+                self._line = percent
+                print(f'轨迹已执行 {percent}%')
+
+    def _next_line(self, i):
+        pass
+
+
 if __name__ == '__main__':
+    if any(arg.startswith('--simulate') for arg in sys.argv):
+        from simulation import simulate_triggered_scan, simulate_trajectory_scan
+        if '--simulate' in sys.argv:
+            n_images, _ = simulate_triggered_scan(scan_class=HardwareTriggerFlyScan)
+        elif '--simulate-spiral' in sys.argv:
+            n_images, _ = simulate_trajectory_scan(kind='spiral', scan_class=TrajectoryFlyScan)
+        else:
+            n_images, _ = simulate_trajectory_scan(scan_class=TrajectoryFlyScan)
+        print(f'saved {n_images} frames')
+        sys.exit(0)
+    from motion_controller import xps
+    from camera import PCOCamera
     save_path = 'data'
     motion = xps()
     motion.init_groups(['Group2', 'Group1'])
-    motion.set_velocity('Group2.Pos', 0.5)
 
     camera = PCOCamera()
     camera.start_acquisition()
 
     # print(camera.cam.get_frame_period())
-    # auto_exposure(camera, 3100, 3850)
+    # camera.auto_exposure(3475, tolerance=0.1)
     # # camera.cam.set_frame_period()
 
     camera.cam.stop_acquisition()
@@ -173,28 +539,23 @@ if __name__ == '__main__':
     camera.start_acquisition()
     image = camera.read_newest_image()
     print(np.max(image))
-    scan_params={
-            'xrange': (10.5, 12.5),      # (mm)
-            'y_ori': 11.2,             # y轴起始位置
-            'ystep': 0.1,           # 步长 (mm)
-            'sampling_interval': 0.3,  # 采样间隔 (秒)
-            'scan_num': 3
-        }
-    fc = SoftTriggerFlyScan(motion, camera, scan_params)
+    # 由扫描区域、探针尺寸、重叠率和允许的运动模糊规划行间距和速度
+    plan = FlyScanPlan.from_camera(camera, (10.5, 12.5), (11.2, 11.5), probe_size=0.02, overlap=0.7,
+                                   max_blur=0.002, exposure=0.0045, max_velocity=2.5, acceleration=10)
+    print(plan.summary())
+    motion.set_velocity('Group2.Pos', plan.velocity, plan.acceleration)
+    fc = SoftTriggerFlyScan(motion, camera, plan.scan_params())
 
     # print(fc.x_pos)
     # print(fc.y_pos)
-    images = fc.run_scan()
-    print('start saving')
+    n_images = fc.run_scan('chip_ph_4.5_0.5.h5_s')
+    print(f'saved {n_images} frames')
 
     # a = [np.random.randint(0, 4095,(5120,5120)).astype(np.uint16) for i in range(102)]
     # print(len(a))
     # aa = np.array(images, dtype=np.uint16)
     # print(aa.shape, aa.dtype)
 
-    save_as_compound_dataset('chip_ph_4.5_0.5.h5_s', images)
-
-
     # for i, image in enumerate(images):
     #     image_ = Image.fromarray(image)
     #     if not os.path.exists(save_path):
@@ -0,0 +1,218 @@
+import bisect
+import threading
+from collections import deque
+import numpy as np
+from beam_center import marginal_centroid
+
+# 每帧保存的质量指标
+QUALITY_FIELDS = ('total', 'saturation', 'centroid_shift', 'correlation')
+
+# 标记位
+FLAG_SATURATED = 1      # 饱和像素比例过高
+FLAG_EMPTY = 2          # 空帧（总计数接近0）
+FLAG_BEAM_DROP = 4      # 总计数明显低于近期水平（光束中断）
+FLAG_CENTROID_JUMP = 8  # 衍射图质心突变
+FLAG_LOW_CORR = 16      # 与上一帧相关性异常低
+FLAG_STALE = 32         # 与上一帧完全相同（读到了旧帧）
+
+FLAG_NAMES = {
+    FLAG_SATURATED: '饱和',
+    FLAG_EMPTY: '空帧',
+    FLAG_BEAM_DROP: '光束中断',
+    FLAG_CENTROID_JUMP: '质心突变',
+    FLAG_LOW_CORR: '相关性低',
+    FLAG_STALE: '重复帧',
+}
+
+
+def describe_flags(flags):
+    """把标记位转换为文字"""
+    return ','.join(name for bit, name in FLAG_NAMES.items() if flags & bit)
+
+
+class RollingRobustStats:
+    """
+    滑动窗口内的中位数和MAD。窗口保持有序，每次更新只做一次插入和一次删除
+    """
+
+    def __init__(self, window=50):
+        self.window = window
+        self._values = deque()
+        self._sorted = []
+
+    def __len__(self):
+        return len(self._values)
+
+    def update(self, value):
+        self._values.append(value)
+        bisect.insort(self._sorted, value)
+        if len(self._values) > self.window:
+            old = self._values.popleft()
+            del self._sorted[bisect.bisect_left(self._sorted, old)]
+
+    @property
+    def median(self):
+        n = len(self._sorted)
+        if n == 0:
+            return np.nan
+        mid = n // 2
+        return self._sorted[mid] if n % 2 else 0.5 * (self._sorted[mid - 1] + self._sorted[mid])
+
+    @property
+    def mad(self):
+        """中位数绝对偏差，已乘1.4826换算为正态分布的标准差"""
+        if not self._sorted:
+            return np.nan
+        return 1.4826 * float(np.median(np.abs(np.asarray(self._sorted) - self.median)))
+
+    def zscore(self, value):
+        """稳健z值，数据不足或MAD为0时返回0"""
+        mad = self.mad
+        if len(self) < 5 or not mad > 0:
+            return 0.0
+        return (value - self.median) / mad
+
+
+class FrameQualityMonitor:
+    """
+    逐帧质量检查：总计数、饱和比例、质心偏移、与上一帧的相关系数。
+    稳健统计量随每帧增量更新，异常帧在采集时即被标记，不需要扫描后再处理一遍。
+
+    相关系数和滑动统计与帧的顺序有关。多个线程并行处理时，measure 在各线程中计算与顺序无关的部分，
+    update_ordered 按序号顺序完成其余部分（先到的帧暂存抽样后的小图）。
+    """
+
+    def __init__(self, saturation_level=4095, saturation_fraction=1e-3, z_threshold=5.0,
+                 centroid_tolerance=20.0, min_correlation=0.2, window=50, decimation=4):
+        """
+        参数:
+            saturation_level: 饱和值（mono12 为4095）
+            saturation_fraction: 饱和像素比例超过该值时标记
+            z_threshold: 总计数稳健z值低于 -z_threshold 时标记为光束中断
+            centroid_tolerance: 质心偏离近期中位数超过该像素数时标记
+            min_correlation: 与上一帧的相关系数低于该值时标记
+            window: 滑动统计窗口长度（帧）
+            decimation: 计算相关系数时的抽样间隔
+        """
+        self.saturation_level = saturation_level
+        self.saturation_fraction = saturation_fraction
+        self.z_threshold = z_threshold
+        self.centroid_tolerance = centroid_tolerance
+        self.min_correlation = min_correlation
+        self.decimation = decimation
+        self.total_stats = RollingRobustStats(window)
+        self.row_stats = RollingRobustStats(window)
+        self.col_stats = RollingRobustStats(window)
+        self._previous = None
+        self.flagged = {}  # index -> flags
+        self._waiting = {}  # update_ordered 暂存的 index -> measure 的结果
+        self._next = 0
+        self._lock = threading.Lock()
+
+    def reset(self, first_index=0):
+        """first_index 为 update_ordered 的第一个序号"""
+        self.total_stats = RollingRobustStats(self.total_stats.window)
+        self.row_stats = RollingRobustStats(self.row_stats.window)
+        self.col_stats = RollingRobustStats(self.col_stats.window)
+        self._previous = None
+        self.flagged = {}
+        self._waiting = {}
+        self._next = first_index
+
+    def reset_reference(self):
+        """清除上一帧，下一帧不计算相关系数（例如重扫时相邻两帧不是相邻扫描点）"""
+        self._previous = None
+
+    def _correlation(self, small):
+        if self._previous is None:
+            return np.nan, False
+        if np.array_equal(small, self._previous):
+            return 1.0, True
+        a = small - small.mean()
+        b = self._previous - self._previous.mean()
+        norm = np.sqrt(np.dot(a, a) * np.dot(b, b))
+        return (float(np.dot(a, b) / norm) if norm > 0 else np.nan), False
+
+    def update(self, index, image, raw=None):
+        """
+        计算一帧的指标并更新统计量
+
+        参数:
+            index: 扫描点序号
+            image: 扣除暗场后的图像
+            raw: 扣除暗场前的图像，用于判断饱和；不提供时使用 image
+
+        返回:
+            (metrics, flags)，metrics 为按 QUALITY_FIELDS 排列的数组，flags 为标记位
+        """
+        return self.evaluate(index, self.measure(image, raw))
+
+    def measure(self, image, raw=None):
+        """
+        与帧顺序无关的部分（总计数、饱和比例、抽样小图和质心），可以在多个线程中并行计算
+
+        返回:
+            传给 evaluate / update_ordered 的结果，不引用 image 的缓冲区
+        """
+        total = float(image.sum(dtype=np.float64))
+        saturation = np.count_nonzero((image if raw is None else raw) >= self.saturation_level) / image.size
+        small = image[::self.decimation, ::self.decimation]
+        center = marginal_centroid(small)
+        if center is not None:
+            center = (center[0] * self.decimation, center[1] * self.decimation)
+        return total, saturation, small.ravel().astype(np.float32), center
+
+    def update_ordered(self, index, measured):
+        """
+        按序号顺序更新：index 之前的帧还没有到时暂存，可以在多个处理线程中调用
+
+        返回:
+            按序号顺序完成计算的 [(index, metrics, flags), ...]
+        """
+        results = []
+        with self._lock:
+            self._waiting[index] = measured
+            while self._next in self._waiting:
+                metrics, flags = self.evaluate(self._next, self._waiting.pop(self._next))
+                results.append((self._next, metrics, flags))
+                self._next += 1
+        return results
+
+    def evaluate(self, index, measured):
+        """与上一帧比较并更新统计量，需按扫描顺序调用，measured 为 measure 的结果"""
+        total, saturation, small, center = measured
+        correlation, stale = self._correlation(small)
+        self._previous = small
+
+        flags = 0
+        if saturation > self.saturation_fraction:
+            flags |= FLAG_SATURATED
+        if total <= 0:
+            flags |= FLAG_EMPTY
+        elif self.total_stats.zscore(total) < -self.z_threshold:
+            flags |= FLAG_BEAM_DROP
+        if stale:
+            flags |= FLAG_STALE
+        elif correlation < self.min_correlation:
+            flags |= FLAG_LOW_CORR
+
+        shift = np.nan
+        if center is not None:
+            row, col = center
+            if len(self.row_stats):
+                shift = float(np.hypot(row - self.row_stats.median, col - self.col_stats.median))
+                if shift > self.centroid_tolerance:
+                    flags |= FLAG_CENTROID_JUMP
+        # 异常帧不进入统计，避免光束中断期间把基准拉低
+        if not flags & (FLAG_EMPTY | FLAG_BEAM_DROP | FLAG_STALE):
+            self.total_stats.update(total)
+            if center is not None:
+                self.row_stats.update(row)
+                self.col_stats.update(col)
+
+        if flags:
+            self.flagged[index] = flags
+        else:
+            self.flagged.pop(index, None)
+        metrics = np.array([total, saturation, shift, correlation], dtype=np.float64)
+        return metrics, flags
@@ -0,0 +1,489 @@
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+import numpy as np
+from binning import Binner
+from calibration import neighbour_indices, replace_masked
+
+
+class Stage:
+    """
+    处理阶段基类。setup 在帧尺寸或类型变化时调用一次，用于预先分配输出缓冲区；
+    process 返回本阶段的输出，可以是输入的视图、输入本身（原地处理）或预分配的缓冲区。
+
+    in_place = True 的阶段会直接修改输入，Pipeline 保证传给它的数组不是调用方的原始帧。
+    """
+    name = 'stage'
+    in_place = False
+
+    def setup(self, shape, dtype):
+        """
+        参数:
+            shape, dtype: 输入的尺寸和类型
+
+        返回:
+            (输出尺寸, 输出类型)
+        """
+        return shape, dtype
+
+    def process(self, image):
+        return image
+
+
+class Crop(Stage):
+    """裁剪，返回视图，不复制"""
+    name = 'crop'
+
+    def __init__(self, size, origin=None):
+        """
+        参数:
+            size: 裁剪尺寸 (行, 列)
+            origin: 可选，函数 origin(image) -> (row, col) 返回裁剪窗口左上角；默认居中
+        """
+        self.size = tuple(size)
+        self.origin = origin
+        self.last_origin = None  # 最近一帧的裁剪窗口左上角
+
+    def setup(self, shape, dtype):
+        return (min(self.size[0], shape[0]), min(self.size[1], shape[1])) + tuple(shape[2:]), dtype
+
+    def process(self, image):
+        rows, cols = image.shape[:2]
+        if self.origin is not None:
+            r0, c0 = self.origin(image)
+        else:
+            r0, c0 = rows // 2 - self.size[0] // 2, cols // 2 - self.size[1] // 2
+        r0 = min(max(int(r0), 0), max(rows - self.size[0], 0))
+        c0 = min(max(int(c0), 0), max(cols - self.size[1], 0))
+        self.last_origin = (r0, c0)
+        return image[r0:r0 + self.size[0], c0:c0 + self.size[1]]
+
+
+class DarkSubtract(Stage):
+    """
+    扣暗场，结果小于0时为0。整数图像用 max(image, dark) - dark 实现饱和减法，
+    不需要转换为有符号类型，也不会在uint16下溢。结果写入预分配的缓冲区，输入（未扣暗场的图像）保持不变。
+    dark 为 None 时直接返回输入。
+
+    也可以用 set_full_dark 设置整帧暗场（如暗场库中的平均暗场），此时按前面 Crop 阶段的裁剪窗口和
+    Bin 阶段的合并倍数换算出与输入对应的暗场，只有裁剪窗口移动时才重新计算。
+    """
+    name = 'dark'
+
+    def __init__(self, dark=None, crop=None, bin=None):
+        """
+        参数:
+            dark: 与输入同尺寸的暗场
+            crop, bin: 位于本阶段之前的 Crop / Bin 阶段，使用整帧暗场时需要
+        """
+        self.dark = dark
+        self.crop = crop
+        self.bin = bin
+        self.full_dark = None
+        self._origin = None
+        self._out = None
+
+    def set_full_dark(self, full_dark):
+        """设置整帧暗场，None 表示不扣暗场"""
+        self.full_dark = full_dark
+        self.dark = None
+        self._origin = None
+
+    def _prepare(self, dtype):
+        dark = self.full_dark
+        if self.crop is not None and self.crop.last_origin is not None:
+            r0, c0 = self.crop.last_origin
+            dark = dark[r0:r0 + self.crop.size[0], c0:c0 + self.crop.size[1]]
+            self._origin = self.crop.last_origin
+        # 与帧相同的取整和合并方式，保证饱和减法两边的类型一致
+        if np.issubdtype(dtype, np.integer):
+            dark = np.clip(np.rint(dark), 0, np.iinfo(dtype).max).astype(dtype)
+        if self.bin is not None and self.bin.binner.enabled:
+            binner = self.bin.binner
+            dark = Binner(binner.factor, binner.dtype, binner.overflow)(dark)
+        self.dark = np.array(dark, dtype=dtype)
+
+    def setup(self, shape, dtype):
+        self._out = np.empty(shape, dtype=dtype)
+        return shape, dtype
+
+    def process(self, image):
+        if self.full_dark is not None and (self.dark is None or
+                                           (self.crop is not None and self.crop.last_origin != self._origin)):
+            self._prepare(image.dtype)
+        if self.dark is None:
+            return image
+        if self.dark.shape != image.shape:
+            raise ValueError(f'暗场尺寸 {self.dark.shape} 与图像尺寸 {image.shape} 不一致')
+        if np.issubdtype(image.dtype, np.integer):
+            np.maximum(image, self.dark, out=self._out, casting='unsafe')
+            np.subtract(self._out, self.dark, out=self._out, casting='unsafe')
+        else:
+            np.subtract(image, self.dark, out=self._out)
+            np.maximum(self._out, 0, out=self._out)
+        return self._out
+
+
+class FlatField(Stage):
+    """
+    平场校正：乘以预先计算的增益图（1 / 归一化平场），整数图像四舍五入并饱和到原类型的范围。
+    gain 为 None 时直接返回输入。
+    """
+    name = 'flat'
+
+    def __init__(self, gain=None):
+        """
+        参数:
+            gain: 增益图（float32），与输入同尺寸
+        """
+        self.gain = None if gain is None else np.asarray(gain, dtype=np.float32)
+        self._work = None
+        self._out = None
+
+    @classmethod
+    def from_flat(cls, flat, dark=None):
+        """由平场图像（可选扣暗场）计算增益图，死像素的增益为0"""
+        flat = np.asarray(flat, dtype=np.float32)
+        if dark is not None:
+            flat = flat - dark
+        with np.errstate(divide='ignore', invalid='ignore'):
+            gain = np.where(flat > 0, np.mean(flat[flat > 0]) / flat, 0).astype(np.float32)
+        return cls(gain)
+
+    def setup(self, shape, dtype):
+        self._work = np.empty(shape, dtype=np.float32)
+        self._out = np.empty(shape, dtype=dtype)
+        return shape, dtype
+
+    def process(self, image):
+        if self.gain is None:
+            return image
+        np.multiply(image, self.gain, out=self._work)
+        if np.issubdtype(image.dtype, np.integer):
+            np.rint(self._work, out=self._work)
+            np.clip(self._work, 0, np.iinfo(image.dtype).max, out=self._work)
+        np.copyto(self._out, self._work, casting='unsafe')
+        return self._out
+
+
+class Calibrate(Stage):
+    """
+    应用探测器标定（见 calibration.DetectorCalibration），原地处理：
+    乘以增益图与 1 / (ADU/光子) 合并成的系数图，再用预先计算的邻点索引替换坏像素，整数图像四舍五入并饱和。
+    标定数据为整帧尺寸，和 DarkSubtract 一样按前面 Crop 阶段的裁剪窗口和 Bin 阶段的合并倍数换算，
+    只有裁剪窗口移动时才重新计算。合并像素时系数图取块内平均，含坏像素的块整块替换。
+    """
+    name = 'calib'
+    in_place = True
+
+    def __init__(self, calibration, crop=None, bin=None):
+        """
+        参数:
+            calibration: DetectorCalibration
+            crop, bin: 位于本阶段之前的 Crop / Bin 阶段
+        """
+        self.calibration = calibration
+        self.crop = crop
+        self.bin = bin
+        self._origin = None
+        self._scale = None
+        self._groups = None
+        self._work = None
+
+    def _prepare(self, shape):
+        cal = self.calibration
+        full_shape = cal.shape
+        gain = cal.gain if cal.gain is not None else np.ones(full_shape, dtype=np.float32)
+        mask = cal.mask if cal.mask is not None else np.zeros(full_shape, dtype=bool)
+        if self.crop is not None and self.crop.last_origin is not None:
+            r0, c0 = self.crop.last_origin
+            gain = gain[r0:r0 + self.crop.size[0], c0:c0 + self.crop.size[1]]
+            mask = mask[r0:r0 + self.crop.size[0], c0:c0 + self.crop.size[1]]
+            self._origin = self.crop.last_origin
+        if self.bin is not None and self.bin.binner.enabled:
+            by, bx = self.bin.binner.factor
+            rows, cols = self.bin.binner.output_shape(gain.shape)
+            gain = gain[:rows * by, :cols * bx].reshape(rows, by, cols, bx).mean(axis=(1, 3))
+            mask = mask[:rows * by, :cols * bx].reshape(rows, by, cols, bx).any(axis=(1, 3))
+        if gain.shape != shape:
+            raise ValueError(f'标定数据尺寸 {gain.shape} 与图像尺寸 {shape} 不一致')
+        scale = np.where(mask, 0, gain).astype(np.float32)
+        if cal.adu_per_photon:
+            scale /= cal.adu_per_photon
+        self._scale = None if cal.gain is None and not cal.adu_per_photon else scale
+        self._groups = neighbour_indices(mask) if mask.any() else []
+
+    def setup(self, shape, dtype):
+        self._work = np.empty(shape, dtype=np.float32)
+        self._scale = None
+        self._groups = None
+        return shape, dtype
+
+    def process(self, image):
+        if self.calibration is None:
+            return image
+        if self._groups is None or (self.crop is not None and self.crop.last_origin != self._origin):
+            self._prepare(image.shape)
+        if self._scale is None and not self._groups:
+            return image
+        if self._scale is not None:
+            np.multiply(image, self._scale, out=self._work)
+        else:
+            np.copyto(self._work, image)
+        replace_masked(self._work.reshape(-1), self._groups)
+        if np.issubdtype(image.dtype, np.integer):
+            np.rint(self._work, out=self._work)
+            np.clip(self._work, 0, np.iinfo(image.dtype).max, out=self._work)
+        np.copyto(image, self._work, casting='unsafe')
+        return image
+
+
+class Bin(Stage):
+    """合并像素，见 binning.Binner"""
+    name = 'bin'
+
+    def __init__(self, factor=(2, 2), dtype=np.uint16, overflow='clip'):
+        self.binner = Binner(factor, dtype, overflow)
+
+    def setup(self, shape, dtype):
+        if not self.binner.enabled:
+            return shape, dtype
+        return self.binner.output_shape(shape), self.binner.dtype
+
+    def process(self, image):
+        return self.binner(image)
+
+
+class Threshold(Stage):
+    """小于等于阈值的像素置0，原地处理"""
+    name = 'threshold'
+    in_place = True
+
+    def __init__(self, threshold=0):
+        self.threshold = threshold
+        self._mask = None
+
+    def setup(self, shape, dtype):
+        self._mask = np.empty(shape, dtype=bool)
+        return shape, dtype
+
+    def process(self, image):
+        if self.threshold > 0:
+            np.greater(image, self.threshold, out=self._mask)
+            np.multiply(image, self._mask, out=image, casting='unsafe')
+        return image
+
+
+class Stats(Stage):
+    """统计最大值、总和、饱和像素数，不修改图像，结果在 result 中"""
+    name = 'stats'
+
+    def __init__(self, saturation_level=None):
+        self.saturation_level = saturation_level
+        self.result = {}
+
+    def process(self, image):
+        self.result = {'max': image.max(), 'sum': float(image.sum(dtype=np.float64))}
+        if self.saturation_level is not None:
+            self.result['saturated'] = int(np.count_nonzero(image >= self.saturation_level))
+        return image
+
+
+class ToneMap(Stage):
+    """
+    显示用的灰度映射：把 0~max_value 映射到 uint16 的 0~65535，线性或对数。
+    整数输入使用预先计算的查找表（np.take 写入预分配的缓冲区），避免逐帧浮点运算。
+    """
+    name = 'tone'
+
+    def __init__(self, max_value=4095, mode='linear'):
+        """
+        参数:
+            max_value: 输入的满量程（mono12 为4095）
+            mode: 'linear' 或 'log'（与原来的 4095 * log10(9x / 4095 + 1) 相同的曲线）
+        """
+        self.max_value = max_value
+        self.mode = mode
+        self._lut = None
+        self._lut_key = None
+        self._out = None
+
+    def _build_lut(self, size):
+        x = np.arange(size, dtype=np.float64) / self.max_value
+        x = np.clip(x, 0, 1)
+        if self.mode == 'log':
+            x = np.log10(9 * x + 1)
+        self._lut = np.round(x * 65535).astype(np.uint16)
+        self._lut_key = (self.max_value, self.mode, size)
+
+    def setup(self, shape, dtype):
+        self._out = np.empty(shape, dtype=np.uint16)
+        return shape, np.dtype(np.uint16)
+
+    def process(self, image):
+        if np.issubdtype(image.dtype, np.integer) and image.dtype.itemsize <= 2:
+            size = np.iinfo(image.dtype).max + 1
+            if self._lut_key != (self.max_value, self.mode, size):
+                self._build_lut(size)
+            np.take(self._lut, image, out=self._out)
+            return self._out
+        x = np.clip(image / self.max_value, 0, 1)
+        if self.mode == 'log':
+            x = np.log10(9 * x + 1)
+        np.multiply(x, 65535, out=x)
+        np.copyto(self._out, x, casting='unsafe')
+        return self._out
+
+
+class Pipeline:
+    """
+    由若干阶段组成的帧处理流程。每个阶段的输出缓冲区按帧尺寸和类型分配一次，尺寸不变时每帧复用；
+    返回的数组在处理下一帧时会被覆盖，需要保留时请复制（FrameSink.write 会自动复制）。
+
+    每个阶段的最近一次输出可以用 output(name) 取得（例如保存扣暗场前的图像用于饱和判断），
+    但之后的原地处理阶段可能修改它，需要保持不变的阶段放在 keep 中。
+    timings 记录各阶段的平均耗时。
+    """
+
+    def __init__(self, stages, keep=()):
+        """
+        参数:
+            stages: 处理阶段
+            keep: 阶段名，这些阶段的输出不会被之后的原地处理阶段修改（需要时先复制）
+        """
+        self.stages = list(stages)
+        self.keep = tuple(keep)
+        self.timings = {stage.name: [0, 0.0] for stage in self.stages}  # name -> [次数, 总耗时 s]
+        self._key = None
+        self._copies = {}
+        self._outputs = {}
+
+    def stage(self, name):
+        for stage in self.stages:
+            if stage.name == name:
+                return stage
+        raise KeyError(name)
+
+    def _setup(self, shape, dtype):
+        self._key = (shape, dtype)
+        for stage in self.stages:
+            shape, dtype = stage.setup(shape, dtype)
+        self._copies = {}
+
+    def reset(self):
+        """阶段参数改变后（如裁剪尺寸、合并倍数）需要重新分配缓冲区时调用"""
+        self._key = None
+
+    def __call__(self, image):
+        if (image.shape, image.dtype) != self._key:
+            self._setup(image.shape, image.dtype)
+        protected = [image]  # 调用方的原始帧和 keep 中阶段的输出
+        for k, stage in enumerate(self.stages):
+            start = time.perf_counter()
+            if stage.in_place and any(np.may_share_memory(image, other) for other in protected):
+                copy = self._copies.get(k)
+                if copy is None or copy.shape != image.shape or copy.dtype != image.dtype:
+                    copy = self._copies[k] = np.empty(image.shape, dtype=image.dtype)
+                np.copyto(copy, image)
+                image = copy
+            image = stage.process(image)
+            record = self.timings[stage.name]
+            record[0] += 1
+            record[1] += time.perf_counter() - start
+            self._outputs[stage.name] = image
+            if stage.name in self.keep:
+                protected.append(image)
+        return image
+
+    def output(self, name):
+        """最近一帧在某个阶段的输出"""
+        return self._outputs[name]
+
+    def timing_text(self):
+        return '  '.join(f'{name} {total / count * 1e3:.1f}ms' for name, (count, total) in self.timings.items()
+                         if count)
+
+
+class PipelinePool:
+    """
+    在线程池中并行处理多帧。numpy 运算时会释放GIL，多个线程可以同时处理不同的帧。
+    每个线程使用自己的 Pipeline（由 factory 创建），缓冲区互不干扰；
+    callback 在同一线程中处理完立即调用，此时缓冲区仍然有效。
+    处理或 callback 中的第一个异常记录在 error 中，由 check 重新抛出，不会因为不取 future 的结果而丢失。
+    """
+
+    def __init__(self, factory, workers=2):
+        """
+        参数:
+            factory: 无参数函数，返回一个新的 Pipeline
+            workers: 线程数
+        """
+        self.factory = factory
+        self._local = threading.local()
+        self._pipelines = []
+        self._lock = threading.Lock()
+        self._pending = 0
+        self.error = None
+        self._executor = ThreadPoolExecutor(max_workers=workers)
+
+    @property
+    def pending(self):
+        """已提交、尚未处理完的帧数"""
+        return self._pending
+
+    def _pipeline(self):
+        pipeline = getattr(self._local, 'pipeline', None)
+        if pipeline is None:
+            pipeline = self.factory()
+            self._local.pipeline = pipeline
+            with self._lock:
+                self._pipelines.append(pipeline)
+        return pipeline
+
+    def _run(self, image, callback, args):
+        try:
+            pipeline = self._pipeline()
+            result = pipeline(image)
+            return callback(result, pipeline, *args) if callback is not None else result.copy()
+        except Exception as e:
+            with self._lock:
+                if self.error is None:
+                    self.error = e
+            raise
+        finally:
+            with self._lock:
+                self._pending -= 1
+
+    def submit(self, image, callback=None, *args):
+        """
+        提交一帧。image 在处理完成前不能被修改
+
+        参数:
+            callback: callback(result, pipeline, *args)，为 None 时 future 返回结果的副本
+
+        返回:
+            concurrent.futures.Future
+        """
+        with self._lock:
+            self._pending += 1
+        return self._executor.submit(self._run, image, callback, args)
+
+    def timing_text(self):
+        """所有线程合计的各阶段平均耗时"""
+        totals = {}
+        with self._lock:
+            for pipeline in self._pipelines:
+                for name, (count, total) in pipeline.timings.items():
+                    record = totals.setdefault(name, [0, 0.0])
+                    record[0] += count
+                    record[1] += total
+        return '  '.join(f'{name} {total / count * 1e3:.1f}ms' for name, (count, total) in totals.items() if count)
+
+    def check(self):
+        """已处理的帧中出现过异常时重新抛出第一个异常"""
+        if self.error is not None:
+            raise RuntimeError(f'帧处理失败：{self.error}') from self.error
+
+    def close(self):
+        """等待所有帧处理完；出现过的异常需要调用 check 抛出"""
+        self._executor.shutdown(wait=True)
@@ -0,0 +1,80 @@
+import numpy as np
+
+
+class FrameSequence:
+    """
+    帧计数连续性检查：相机的帧计数应逐帧加1，跳过的计数即丢失的帧（相机缓冲区溢出、传输丢包等）。
+    没有帧计数的相机无法检查，update 始终返回0。
+    """
+
+    def __init__(self, wrap=None):
+        """
+        参数:
+            wrap: 帧计数的周期，如 GigE Vision 1.x 的16位块号为 65535（从1计到65535后回到1），None 表示不回绕
+        """
+        self.wrap = wrap
+        self.last_id = None
+        self.received = 0
+        self.duplicates = 0
+        self.gaps = []  # (序号, 第一个丢失的帧计数, 丢失帧数)
+
+    def reset(self):
+        self.last_id = None
+        self.received = 0
+        self.duplicates = 0
+        self.gaps = []
+
+    def update(self, frame_id, index=-1):
+        """
+        检查新到的一帧
+
+        参数:
+            frame_id: 帧计数，None 表示未知
+            index: 该帧在数据中的序号（跳过的帧为 -1），用于报告丢帧位置
+
+        返回:
+            与上一帧之间丢失的帧数；重复的帧（同一帧读了两次）返回 -1，调用方应丢弃
+        """
+        if frame_id is None:
+            self.received += 1
+            return 0
+        missing = 0
+        if self.last_id is not None:
+            step = frame_id - self.last_id
+            if self.wrap:
+                step %= self.wrap
+            if step == 0:
+                self.duplicates += 1
+                return -1
+            if step < 0:
+                # 计数回退（相机重启采集），从新的计数继续
+                print(f'帧计数从 {self.last_id} 回退到 {frame_id}')
+                step = 1
+            missing = step - 1
+            if missing:
+                self.gaps.append((index, self.last_id + 1, missing))
+        self.last_id = frame_id
+        self.received += 1
+        return missing
+
+    @property
+    def dropped(self):
+        return int(sum(gap[2] for gap in self.gaps))
+
+    def report(self):
+        """丢帧报告文本"""
+        total = self.received + self.dropped
+        text = f'收到 {self.received} 帧，丢失 {self.dropped} 帧'
+        if total:
+            text += f'（{self.dropped / total:.2%}）'
+        if self.duplicates:
+            text += f'，重复 {self.duplicates} 次'
+        if self.gaps:
+            worst = max(self.gaps, key=lambda gap: gap[2])
+            text += f'，{len(self.gaps)} 处中断，最长 {worst[2]} 帧（序号 {worst[0]} 之前）'
+        return text
+
+    def save(self, path):
+        """保存为 npz：gaps 每行为 (序号, 第一个丢失的帧计数, 丢失帧数)"""
+        np.savez(path, gaps=np.array(self.gaps, dtype=np.int64).reshape(-1, 3), received=self.received,
+                 dropped=self.dropped, duplicates=self.duplicates)
@@ -0,0 +1,722 @@
+import os
+import threading
+import time
+from abc import ABC, abstractmethod
+from concurrent.futures import ThreadPoolExecutor
+import numpy as np
+from frame_metrics import QUALITY_FIELDS
+
+# 重扫记录的字段：原扫描点序号、新帧写入的位置、时间、原帧的标记位
+RESCAN_FIELDS = ('index', 'slot', 'time', 'flags')
+
+
+def _resolve_file(path, default_name):
+    """path 为文件夹（或没有扩展名）时，在其中使用默认文件名"""
+    if os.path.isdir(path) or not os.path.splitext(path)[1]:
+        os.makedirs(path, exist_ok=True)
+        return os.path.join(path, default_name)
+    directory = os.path.dirname(path)
+    if directory:
+        os.makedirs(directory, exist_ok=True)
+    return path
+
+
+class FrameSink(ABC):
+    """
+    帧存储接口。扫描程序只调用 write/write_dark/close，具体格式由子类决定。
+
+    约定:
+        index 为扫描点序号（从0开始）；
+        写入默认在后台线程中完成，write 立即返回，pending 为尚未落盘的帧数。
+    """
+
+    supports_overwrite = True  # 能否按 index 覆盖已写入的帧（重扫时使用）
+
+    def __init__(self, path, workers=1):
+        """
+        参数:
+            path: 保存路径（文件夹或文件，取决于具体格式）
+            workers: 后台写入线程数，0 表示在调用线程中同步写入
+        """
+        super().__init__()
+        self.path = path
+        self.workers = workers
+        self.frame_count = 0
+        self.bytes_written = 0
+        self._pending = 0
+        self._lock = threading.Lock()
+        self._executor = ThreadPoolExecutor(max_workers=workers) if workers > 0 else None
+        self._futures = []
+        self._quality = {}
+        self._rescans = []
+
+    @property
+    def pending(self):
+        """尚未写完的帧数（写入积压）"""
+        return self._pending
+
+    def write(self, index, image):
+        """写入一帧，异步模式下会复制一份图像，调用方可以立即复用缓冲区"""
+        if self._executor is None:
+            self._write(index, image)
+            self._done(image)
+            return
+        image = np.array(image, copy=True)
+        with self._lock:
+            self._pending += 1
+        self._add_future(self._executor.submit(self._write_and_count, index, image))
+
+    def _add_future(self, future):
+        """记录后台任务，同时去掉已成功完成的任务（失败的保留到 flush 抛出），长时间扫描时列表不会一直增长"""
+        with self._lock:
+            self._futures.append(future)
+            self._futures = [f for f in self._futures if not f.done() or f.exception() is not None]
+
+    def _write_and_count(self, index, image):
+        try:
+            self._write(index, image)
+        finally:
+            with self._lock:
+                self._pending -= 1
+        self._done(image)
+
+    def _done(self, image):
+        with self._lock:
+            self.frame_count += 1
+            self.bytes_written += image.nbytes
+
+    @abstractmethod
+    def _write(self, index, image):
+        """实际写入一帧"""
+        pass
+
+    def _submit(self, func, *args):
+        """在写线程中执行 func，保证与帧写入的顺序一致（h5py等不能多线程同时访问）"""
+        if self._executor is None:
+            func(*args)
+        else:
+            self._add_future(self._executor.submit(func, *args))
+
+    def write_dark(self, image):
+        """保存暗场图像"""
+        pass
+
+    def write_position(self, index, x, y):
+        """记录第 index 帧的实测位置（mm），不支持的格式忽略"""
+        pass
+
+    def write_frame_time(self, index, t):
+        """记录第 index 帧的曝光时刻（s），不支持的格式忽略"""
+        pass
+
+    def write_metrics(self, index, metrics, flags=0):
+        """记录第 index 帧的质量指标（按 frame_metrics.QUALITY_FIELDS 排列）和标记位"""
+        self._submit(self._write_metrics, index, np.asarray(metrics, dtype=np.float64), int(flags))
+
+    def _write_metrics(self, index, metrics, flags):
+        self._quality[index] = (metrics, flags)
+
+    def write_rescan(self, index, slot, flags=0):
+        """
+        记录重扫：第 index 个扫描点的替换帧写在 slot 处（slot == index 为覆盖写入），
+        flags 为被替换帧的标记位
+        """
+        self._submit(self._write_rescan, index, slot, time.time(), int(flags))
+
+    def _write_rescan(self, index, slot, timestamp, flags):
+        self._rescans.append((index, slot, timestamp, flags))
+
+    def _save_quality(self):
+        """非HDF5格式把质量指标另存为 quality.npz"""
+        if not self._quality:
+            return
+        file_path = getattr(self, 'file_path', None)
+        directory = os.path.dirname(file_path) if file_path else self.path
+        index = np.array(sorted(self._quality))
+        np.savez(os.path.join(directory, 'quality.npz'), index=index, fields=np.array(QUALITY_FIELDS),
+                 metrics=np.array([self._quality[i][0] for i in index]),
+                 flags=np.array([self._quality[i][1] for i in index], dtype=np.uint8))
+
+    def _save_rescans(self):
+        """非HDF5格式把重扫记录另存为 rescan.npz"""
+        if not self._rescans:
+            return
+        file_path = getattr(self, 'file_path', None)
+        directory = os.path.dirname(file_path) if file_path else self.path
+        np.savez(os.path.join(directory, 'rescan.npz'), fields=np.array(RESCAN_FIELDS),
+                 rescans=np.array(self._rescans, dtype=np.float64))
+
+    def flush(self):
+        """等待所有后台写入完成，并把出现的异常重新抛出"""
+        with self._lock:
+            futures, self._futures = self._futures, []
+        for future in futures:
+            future.result()
+
+    def close(self):
+        """等待写入完成并释放资源"""
+        try:
+            self.flush()
+        finally:
+            if self._executor is not None:
+                self._executor.shutdown(wait=True)
+                self._executor = None
+            self._close()
+            self._save_quality()
+            self._save_rescans()
+
+    def _close(self):
+        pass
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.close()
+
+
+class PNGSink(FrameSink):
+    """
+    逐点保存PNG（原有格式）。文件名为 {index + 1}.png，暗场为 0.png，与旧版编号一致。
+    16位PNG编码很慢，因此使用多线程编码池（PIL编码时会释放GIL）。
+    """
+
+    def __init__(self, path, workers=4, compress_level=1):
+        super().__init__(path, workers=workers)
+        self.compress_level = compress_level
+        os.makedirs(self.path, exist_ok=True)
+
+    def _save(self, image, name):
+        from PIL import Image
+        Image.fromarray(image).save(os.path.join(self.path, f'{name}.png'), compress_level=self.compress_level)
+
+    def _write(self, index, image):
+        self._save(image, index + 1)
+
+    def write_dark(self, image):
+        self._save(np.ascontiguousarray(image), 0)
+
+
+class TiffStackSink(FrameSink):
+    """
+    多页TIFF堆栈。各页在编码池中并行压缩，再由单独的写线程按写入顺序追加到文件。
+    页按到达顺序追加，不能覆盖已写入的帧（supports_overwrite = False）。
+    """
+    supports_overwrite = False
+
+    def __init__(self, path, workers=4, compression='tiff_deflate'):
+        super().__init__(path, workers=0)
+        from PIL import TiffImagePlugin
+        path = _resolve_file(path, 'dps.tif')
+        self.file_path = path
+        self.compression = compression
+        self._tiff = TiffImagePlugin.AppendingTiffWriter(self.file_path, new=True)
+        self._encoder = ThreadPoolExecutor(max_workers=max(workers, 1))
+        self._writer = ThreadPoolExecutor(max_workers=1)  # 单线程保证页顺序
+
+    def write(self, index, image):
+        image = np.array(image, copy=True)
+        with self._lock:
+            self._pending += 1
+        encoded = self._encoder.submit(self._encode, image)
+        self._add_future(self._writer.submit(self._append, encoded, image))
+
+    def _encode(self, image):
+        import io
+        from PIL import Image
+        buffer = io.BytesIO()
+        Image.fromarray(image).save(buffer, format='TIFF', compression=self.compression)
+        return buffer.getvalue()
+
+    def _append(self, encoded, image):
+        try:
+            self._tiff.write(encoded.result())
+            self._tiff.newFrame()
+        finally:
+            with self._lock:
+                self._pending -= 1
+        self._done(image)
+
+    def _write(self, index, image):
+        pass
+
+    def write_dark(self, image):
+        from PIL import Image
+        Image.fromarray(np.ascontiguousarray(image)).save(
+            os.path.join(os.path.dirname(self.file_path), 'dark.tif'))
+
+    def _close(self):
+        self._encoder.shutdown(wait=True)
+        self._writer.shutdown(wait=True)
+        self._tiff.close()
+
+
+class NpySink(FrameSink):
+    """
+    原始数据，写入预分配的 .npy 内存映射文件。
+    文件头预留固定长度，帧数未知时先关闭映射、扩大文件再重新映射（Windows下不能改变已映射文件的大小）；
+    关闭时改写文件头中的帧数并截断文件。
+    """
+    _HEADER_SIZE = 256
+
+    def __init__(self, path, n_frames=None, workers=1):
+        super().__init__(path, workers=workers)
+        path = _resolve_file(path, 'dps.npy')
+        self.file_path = path
+        self.n_frames = n_frames or 64
+        self.memmap = None
+        self._frame_shape = None
+        self._dtype = None
+        self._max_index = -1
+
+    def _write_header(self, f, n_frames):
+        header = {'descr': np.lib.format.dtype_to_descr(self._dtype), 'fortran_order': False,
+                  'shape': (n_frames,) + self._frame_shape}
+        header = repr(header).encode('latin1')
+        header = header + b' ' * (self._HEADER_SIZE - 10 - len(header) - 1) + b'\n'
+        f.seek(0)
+        f.write(np.lib.format.magic(1, 0) + np.uint16(len(header)).astype('<u2').tobytes() + header)
+
+    def _map(self, n_frames):
+        """把文件扩大到 n_frames 帧并重新映射"""
+        frame_bytes = int(np.prod(self._frame_shape)) * self._dtype.itemsize
+        if self.memmap is not None:
+            self.memmap.flush()
+            self.memmap = None
+        mode = 'r+b' if os.path.exists(self.file_path) and self._max_index >= 0 else 'w+b'
+        with open(self.file_path, mode) as f:
+            self._write_header(f, n_frames)
+            f.truncate(self._HEADER_SIZE + n_frames * frame_bytes)
+        self.memmap = np.memmap(self.file_path, dtype=self._dtype, mode='r+', offset=self._HEADER_SIZE,
+                                shape=(n_frames,) + self._frame_shape)
+
+    def _write(self, index, image):
+        if self.memmap is None:
+            self._frame_shape = image.shape
+            self._dtype = image.dtype
+            self._map(max(self.n_frames, index + 1))
+        elif index >= len(self.memmap):
+            self._map(max(2 * len(self.memmap), index + 1))
+        self.memmap[index] = image
+        self._max_index = max(self._max_index, index)
+
+    def write_dark(self, image):
+        np.save(os.path.join(os.path.dirname(self.file_path), 'dark.npy'), image)
+
+    def _close(self):
+        if self.memmap is None:
+            return
+        frame_bytes = int(np.prod(self._frame_shape)) * self._dtype.itemsize
+        n = self._max_index + 1
+        self.memmap.flush()
+        self.memmap = None
+        with open(self.file_path, 'r+b') as f:
+            self._write_header(f, n)
+            f.truncate(self._HEADER_SIZE + n * frame_bytes)
+
+
+class HDF5Sink(FrameSink):
+    """
+    HDF5流式写入：数据集 'dps' 按单帧分块，边扫描边写，关闭时截断到实际帧数。
+
+    swmr=True 时使用HDF5单写多读（SWMR）模式：第一帧写入后文件切换到SWMR，
+    之后定期 flush，并在数据集 'frames_valid' 中公布已写入的帧数，
+    其他进程可以用 ScanDataset(path, swmr=True) 在扫描过程中读取新帧。
+    SWMR模式下不能再创建数据集，暗场需要在第一帧之前写入。
+
+    实测位置写在 'position' (N, 2)（mm）、曝光时刻写在 'frame_time' (N,)（s），未记录的为NaN，
+    与质量指标一样在第一帧时创建。
+    """
+
+    dark_name = 'dark'
+    position_name = 'position'
+
+    def __init__(self, path, n_frames=None, dataset='dps', compression=None, workers=1,
+                 swmr=False, flush_interval=1.0):
+        """
+        参数:
+            path: 保存路径，文件夹时使用 dps.h5
+            n_frames: 预分配帧数，不够时自动扩容
+            dataset: 帧数据集名称
+            compression: h5py压缩方式，如 'gzip', 'lzf'
+            workers: 后台写入线程数
+            swmr: 是否启用单写多读模式
+            flush_interval: SWMR模式下的最长flush间隔（秒）
+        """
+        super().__init__(path, workers=workers)
+        import h5py
+        path = _resolve_file(path, 'dps.h5')
+        self.file_path = path
+        self.n_frames = n_frames or 64
+        self.dataset_name = dataset
+        self.compression = compression
+        self.swmr = swmr
+        self.flush_interval = flush_interval
+        self.file = h5py.File(self.file_path, 'w', libver='latest' if swmr else None)
+        self.dataset = None
+        self.frames_valid = None
+        self.quality = None
+        self.flags = None
+        self.rescan = None
+        self.position = None
+        self.frame_time = None
+        self._positions = {}
+        self._frame_times = {}
+        self._last_flush = 0.0
+        self._max_index = -1
+
+    def _create_dataset(self, shape, dtype):
+        self.dataset = self.file.create_dataset(
+            self.dataset_name, shape=(self.n_frames,) + shape, maxshape=(None,) + shape,
+            dtype=dtype, chunks=(1,) + shape, compression=self.compression)
+
+    def _write(self, index, image):
+        if self.dataset is None:
+            self._create_dataset(image.shape, image.dtype)
+            self._create_quality()
+            if self.swmr:
+                self.frames_valid = self.file.create_dataset('frames_valid', data=np.zeros(1, dtype=np.int64))
+                self.file.swmr_mode = True
+        self._store(index, image)
+        self._max_index = max(self._max_index, index)
+        if self.swmr and time.time() - self._last_flush >= self.flush_interval:
+            self._publish()
+
+    def _store(self, index, image):
+        if index >= self.dataset.shape[0]:
+            self._resize(max(2 * self.dataset.shape[0], index + 1))
+        self.dataset[index] = image
+
+    def _create_quality(self):
+        """质量指标数据集，SWMR模式下必须在切换前创建"""
+        n = self.n_frames
+        self.quality = self.file.create_dataset('quality', data=np.full((n, len(QUALITY_FIELDS)), np.nan),
+                                                maxshape=(None, len(QUALITY_FIELDS)))
+        self.quality.attrs['fields'] = [np.bytes_(f) for f in QUALITY_FIELDS]
+        self.flags = self.file.create_dataset('flags', shape=(n,), maxshape=(None,), dtype=np.uint8)
+        for index, (metrics, flags) in self._quality.items():
+            self._write_metrics(index, metrics, flags)
+        self._quality = {}
+        self.rescan = self.file.create_dataset('rescan', shape=(0, len(RESCAN_FIELDS)),
+                                               maxshape=(None, len(RESCAN_FIELDS)), dtype=np.float64)
+        self.rescan.attrs['fields'] = [np.bytes_(f) for f in RESCAN_FIELDS]
+        rescans, self._rescans = self._rescans, []
+        for row in rescans:
+            self._write_rescan(*row)
+        if self.position_name is not None:
+            self.position = self.file.create_dataset(self.position_name, data=np.full((n, 2), np.nan),
+                                                     maxshape=(None, 2))
+            self.position.attrs['units'] = 'mm'
+            self.frame_time = self.file.create_dataset('frame_time', data=np.full(n, np.nan), maxshape=(None,))
+            self.frame_time.attrs['units'] = 's'
+            positions, self._positions = self._positions, {}
+            for index, (x, y) in positions.items():
+                self._write_position(index, x, y)
+            frame_times, self._frame_times = self._frame_times, {}
+            for index, t in frame_times.items():
+                self._write_frame_time(index, t)
+
+    @staticmethod
+    def _grow(dataset, index):
+        """index 超出数据集长度时扩容，新增部分填NaN"""
+        n_old = dataset.shape[0]
+        if index >= n_old:
+            dataset.resize(max(2 * n_old, index + 1), axis=0)
+            dataset[n_old:] = np.nan
+
+    def _write_metrics(self, index, metrics, flags):
+        if self.quality is None:
+            self._quality[index] = (metrics, flags)
+            return
+        n_old = self.quality.shape[0]
+        if index >= n_old:
+            n = max(2 * n_old, index + 1)
+            self.quality.resize(n, axis=0)
+            self.quality[n_old:] = np.nan
+            self.flags.resize(n, axis=0)
+        self.quality[index] = metrics
+        self.flags[index] = flags
+
+    def _write_rescan(self, index, slot, timestamp, flags):
+        if self.rescan is None:
+            super()._write_rescan(index, slot, timestamp, flags)
+            return
+        n = self.rescan.shape[0]
+        self.rescan.resize(n + 1, axis=0)
+        self.rescan[n] = (index, slot, timestamp, flags)
+
+    def write_position(self, index, x, y):
+        self._submit(self._write_position, index, x, y)
+
+    def _write_position(self, index, x, y):
+        if self.position is None:
+            self._positions[index] = (x, y)
+            return
+        self._grow(self.position, index)
+        self.position[index] = (x, y)
+
+    def write_frame_time(self, index, t):
+        self._submit(self._write_frame_time, index, t)
+
+    def _write_frame_time(self, index, t):
+        if self.frame_time is None:
+            self._frame_times[index] = t
+            return
+        self._grow(self.frame_time, index)
+        self.frame_time[index] = t
+
+    def _position_datasets(self):
+        return [d for d in (self.position, self.frame_time) if d is not None]
+
+    def _swmr_datasets(self):
+        return [self.dataset, self.quality, self.flags, self.rescan] + self._position_datasets()
+
+    def _publish(self):
+        """先flush帧数据再更新帧数，读者看到的帧数对应的数据一定已经可读"""
+        for dataset in self._swmr_datasets():
+            dataset.flush()
+        self.frames_valid[0] = self._max_index + 1
+        self.frames_valid.flush()
+        self._last_flush = time.time()
+
+    def _resize(self, n_frames):
+        self.dataset.resize(n_frames, axis=0)
+
+    def write_dark(self, image):
+        self._submit(self._write_dark, image)
+
+    def _write_dark(self, image):
+        if self.file.swmr_mode:
+            print('SWMR模式下不能新建数据集，暗场未写入文件，请在扫描开始前采集暗场')
+            return
+        if self.dark_name in self.file:
+            del self.file[self.dark_name]
+        self.file.create_dataset(self.dark_name, data=image)
+
+    def _close(self):
+        if self.dataset is not None:
+            self._resize(self._max_index + 1)
+            n = max(self._max_index + 1, 0)
+            self.quality.resize(n, axis=0)
+            self.flags.resize(n, axis=0)
+            for dataset in self._position_datasets():
+                dataset.resize(n, axis=0)
+            if self.frames_valid is not None:
+                self._publish()
+        self.file.close()
+
+
+class CXISink(HDF5Sink):
+    """
+    按CXI格式（Coherent X-ray Imaging, cxi_version 150）直接写出叠层成像数据，
+    衍射图、扫描位置、波长、像素尺寸、曝光时间和暗场放在同一个文件中，重建程序可直接读取。
+
+    结构:
+        /entry_1/instrument_1/detector_1/data          衍射图 (N, H, W)
+        /entry_1/instrument_1/detector_1/data_dark     暗场
+        /entry_1/instrument_1/detector_1/distance, x_pixel_size, y_pixel_size, count_time
+        /entry_1/instrument_1/source_1/energy, wavelength
+        /entry_1/sample_1/geometry_1/translation       名义位置 (N, 3)，单位m
+        /entry_1/sample_1/geometry_1/translation_measured  实测位置 (N, 3)，未测量为NaN
+        /entry_1/data_1/data, translation              指向上面数据的软链接
+    """
+    _DETECTOR = 'entry_1/instrument_1/detector_1'
+    _GEOMETRY = 'entry_1/sample_1/geometry_1'
+    dark_name = _DETECTOR + '/data_dark'
+    position_name = None  # 实测位置写在 translation_measured
+
+    def __init__(self, path, abs_x, abs_y, wavelength=None, distance=None, pixel_size=None,
+                 exposure=None, n_frames=None, compression=None, workers=1, swmr=False, flush_interval=1.0):
+        """
+        参数:
+            path: 保存路径，文件夹时使用 data.cxi
+            abs_x, abs_y: 扫描点绝对坐标（mm，Scanner.abs_x/abs_y）
+            wavelength: 波长（m）
+            distance: 样品到探测器距离（m）
+            pixel_size: 探测器像素尺寸（m），标量或 (x, y)，合并像素时为合并后的尺寸
+            exposure: 曝光时间（s）
+        """
+        import h5py
+        if os.path.isdir(path) or not os.path.splitext(path)[1]:
+            path = _resolve_file(path, 'data.cxi')
+        n_frames = n_frames or len(abs_x)
+        super().__init__(path, n_frames=n_frames, dataset=self._DETECTOR + '/data',
+                         compression=compression, workers=workers, swmr=swmr, flush_interval=flush_interval)
+        f = self.file
+        f.create_dataset('cxi_version', data=150)
+        f.create_dataset('entry_1/start_time', data=np.bytes_(time.strftime('%Y-%m-%dT%H:%M:%S')))
+        if wavelength is not None:
+            f.create_dataset('entry_1/instrument_1/source_1/wavelength', data=float(wavelength))
+            f.create_dataset('entry_1/instrument_1/source_1/energy',
+                             data=6.62607015e-34 * 299792458.0 / float(wavelength))  # J
+        detector = f.require_group(self._DETECTOR)
+        if distance is not None:
+            detector.create_dataset('distance', data=float(distance))
+        if pixel_size is not None:
+            x_pixel_size, y_pixel_size = np.broadcast_to(np.asarray(pixel_size, dtype=np.float64), (2,))
+            detector.create_dataset('x_pixel_size', data=x_pixel_size)
+            detector.create_dataset('y_pixel_size', data=y_pixel_size)
+        if exposure is not None:
+            detector.create_dataset('count_time', data=float(exposure))
+
+        translation = np.zeros((n_frames, 3))
+        translation[:len(abs_x), 0] = np.asarray(abs_x, dtype=float) * 1e-3
+        translation[:len(abs_y), 1] = np.asarray(abs_y, dtype=float) * 1e-3
+        self.translation = f.create_dataset(self._GEOMETRY + '/translation', data=translation,
+                                            maxshape=(None, 3))
+        self.translation_measured = f.create_dataset(self._GEOMETRY + '/translation_measured',
+                                                     data=np.full((n_frames, 3), np.nan), maxshape=(None, 3))
+        data_1 = f.require_group('entry_1/data_1')
+        data_1['data'] = h5py.SoftLink('/' + self.dataset_name)
+        data_1['translation'] = h5py.SoftLink('/' + self._GEOMETRY + '/translation')
+
+    def _resize(self, n_frames):
+        super()._resize(n_frames)
+        n_old = self.translation_measured.shape[0]
+        if n_frames > n_old:
+            self.translation_measured.resize(n_frames, axis=0)
+            self.translation_measured[n_old:] = np.nan
+            self.translation.resize(n_frames, axis=0)
+        elif n_frames < n_old:
+            self.translation_measured.resize(n_frames, axis=0)
+            self.translation.resize(n_frames, axis=0)
+
+    def write_position(self, index, x, y):
+        self._submit(self._write_position, index, x, y)
+
+    def _swmr_datasets(self):
+        return super()._swmr_datasets() + [self.translation_measured]
+
+    def _write_rescan(self, index, slot, timestamp, flags):
+        # 追加写入的替换帧使用原扫描点的名义位置
+        if slot != index:
+            if slot >= self.translation.shape[0]:
+                self._resize(slot + 1)
+            self.translation[slot] = self.translation[index]
+        super()._write_rescan(index, slot, timestamp, flags)
+
+    def _write_position(self, index, x, y):
+        if index >= self.translation_measured.shape[0]:
+            self.translation_measured.resize(index + 1, axis=0)
+            self.translation.resize(index + 1, axis=0)
+        self.translation_measured[index] = (x * 1e-3, y * 1e-3, 0.0)
+
+
+def encode_sparse(image, threshold=0):
+    """
+    把一帧转换为稀疏表示，只保留大于阈值的像素
+
+    参数:
+        image: 图像
+        threshold: 阈值，小于等于阈值的像素视为0
+
+    返回:
+        (indices, values)，indices 为展平后的像素序号（uint32）
+    """
+    flat = image.ravel()
+    indices = np.flatnonzero(flat > threshold)
+    return indices.astype(np.uint32), flat[indices]
+
+
+def decode_sparse(indices, values, shape, dtype=None, out=None):
+    """把稀疏表示还原为图像，out 不为None时写入 out（会先清零）"""
+    if out is None:
+        out = np.zeros(shape, dtype=dtype if dtype is not None else values.dtype)
+    else:
+        out[...] = 0
+    out.reshape(-1)[indices] = values
+    return out
+
+
+class SparseHDF5Sink(HDF5Sink):
+    """
+    低通量衍射图的稀疏存储：阈值化后每帧只保存 (像素序号, 数值)，按类似CSR的方式追加到HDF5:
+
+        /sparse/indptr       第 i 行的数据在 indices/values 中的范围为 indptr[i]:indptr[i+1]
+        /sparse/indices      展平后的像素序号
+        /sparse/values       像素值
+        /sparse/frame_index  每一行对应的扫描点序号（重扫时同一序号可能出现多次，以最后一行为准）
+
+    编码在写线程中完成。读取使用 ScanDataset，接口与稠密数据相同。
+    """
+
+    def __init__(self, path, threshold=0, n_frames=None, compression=None, workers=1,
+                 swmr=False, flush_interval=1.0):
+        """
+        参数:
+            threshold: 阈值（扣除暗场后），小于等于阈值的像素不保存
+            其余参数同 HDF5Sink
+        """
+        super().__init__(path, n_frames=n_frames, dataset='sparse', compression=compression, workers=workers,
+                         swmr=swmr, flush_interval=flush_interval)
+        self.threshold = threshold
+        self._rows = 0
+        self._nnz = 0
+
+    def _create_dataset(self, shape, dtype):
+        group = self.file.create_group(self.dataset_name)
+        group.attrs['frame_shape'] = shape
+        group.attrs['threshold'] = self.threshold
+        self.indptr = group.create_dataset('indptr', data=np.zeros(1, dtype=np.int64), maxshape=(None,),
+                                           chunks=(4096,))
+        self.frame_index = group.create_dataset('frame_index', shape=(0,), maxshape=(None,), dtype=np.int64,
+                                                chunks=(4096,))
+        self.indices = group.create_dataset('indices', shape=(0,), maxshape=(None,), dtype=np.uint32,
+                                            chunks=(1 << 16,), compression=self.compression)
+        self.values = group.create_dataset('values', shape=(0,), maxshape=(None,), dtype=dtype,
+                                           chunks=(1 << 16,), compression=self.compression)
+        self.dataset = self.indptr
+
+    def _store(self, index, image):
+        indices, values = encode_sparse(image, self.threshold)
+        start, stop = self._nnz, self._nnz + len(indices)
+        if stop > self.indices.shape[0]:
+            size = max(2 * self.indices.shape[0], stop, 1 << 16)
+            self.indices.resize(size, axis=0)
+            self.values.resize(size, axis=0)
+        self.indices[start:stop] = indices
+        self.values[start:stop] = values
+        self._nnz = stop
+        self._rows += 1
+        self.indptr.resize(self._rows + 1, axis=0)
+        self.indptr[self._rows] = stop
+        self.frame_index.resize(self._rows, axis=0)
+        self.frame_index[self._rows - 1] = index
+
+    def _resize(self, n_frames):
+        # CSR按行追加，只需要把预留的 indices/values 截断到实际长度
+        self.indices.resize(self._nnz, axis=0)
+        self.values.resize(self._nnz, axis=0)
+
+    def _swmr_datasets(self):
+        return ([self.values, self.indices, self.frame_index, self.indptr, self.quality, self.flags, self.rescan] +
+                self._position_datasets())
+
+
+SINK_TYPES = {
+    'hdf5': HDF5Sink,
+    'cxi': CXISink,
+    'sparse': SparseHDF5Sink,
+    'tiff': TiffStackSink,
+    'npy': NpySink,
+    'png': PNGSink,
+}
+
+
+def create_sink(kind, path, **kwargs):
+    """
+    按名称创建帧存储
+
+    参数:
+        kind: 'hdf5', 'cxi', 'sparse', 'tiff', 'npy' 或 'png'
+        path: 保存路径
+        kwargs: 传给具体存储类的参数
+
+    返回:
+        FrameSink对象
+    """
+    try:
+        sink_class = SINK_TYPES[kind.lower()]
+    except KeyError:
+        raise ValueError(f'未知的存储格式: {kind}，可选: {list(SINK_TYPES)}')
+    return sink_class(path, **kwargs)
@@ -68,6 +68,9 @@ class Ui_MainWindow(object):
         self.save_image.setIconSize(QtCore.QSize(30, 30))
         self.save_image.setObjectName("save_image")
         self.horizontalLayout_11.addWidget(self.save_image)
+        self.auto_center = QtWidgets.QPushButton(self.layoutWidget1)
+        self.auto_center.setObjectName("auto_center")
+        self.horizontalLayout_11.addWidget(self.auto_center)
         self.layoutWidget2 = QtWidgets.QWidget(self.centralwidget)
         self.layoutWidget2.setGeometry(QtCore.QRect(740, 650, 62, 151))
         self.layoutWidget2.setObjectName("layoutWidget2")
@@ -274,6 +277,67 @@ class Ui_MainWindow(object):
         self.select_motion.addItem("")
         self.verticalLayout_6.addWidget(self.select_motion)
         self.horizontalLayout_4.addLayout(self.verticalLayout_6)
+        self.verticalLayout_7 = QtWidgets.QVBoxLayout()
+        self.verticalLayout_7.setObjectName("verticalLayout_7")
+        self.label_17 = QtWidgets.QLabel(self.layoutWidget8)
+        font = QtGui.QFont()
+        font.setPointSize(11)
+        self.label_17.setFont(font)
+        self.label_17.setAlignment(QtCore.Qt.AlignCenter)
+        self.label_17.setObjectName("label_17")
+        self.verticalLayout_7.addWidget(self.label_17)
+        self.select_sink = QtWidgets.QComboBox(self.layoutWidget8)
+        self.select_sink.setMinimumSize(QtCore.QSize(0, 35))
+        self.select_sink.setObjectName("select_sink")
+        self.select_sink.addItem("")
+        self.select_sink.addItem("")
+        self.select_sink.addItem("")
+        self.select_sink.addItem("")
+        self.select_sink.addItem("")
+        self.select_sink.addItem("")
+        self.verticalLayout_7.addWidget(self.select_sink)
+        self.horizontalLayout_4.addLayout(self.verticalLayout_7)
+        self.verticalLayout_8 = QtWidgets.QVBoxLayout()
+        self.verticalLayout_8.setObjectName("verticalLayout_8")
+        self.label_18 = QtWidgets.QLabel(self.layoutWidget8)
+        font = QtGui.QFont()
+        font.setPointSize(11)
+        self.label_18.setFont(font)
+        self.label_18.setAlignment(QtCore.Qt.AlignCenter)
+        self.label_18.setObjectName("label_18")
+        self.verticalLayout_8.addWidget(self.label_18)
+        self.select_binning = QtWidgets.QComboBox(self.layoutWidget8)
+        self.select_binning.setMinimumSize(QtCore.QSize(0, 35))
+        self.select_binning.setObjectName("select_binning")
+        self.select_binning.addItem("")
+        self.select_binning.addItem("")
+        self.select_binning.addItem("")
+        self.verticalLayout_8.addWidget(self.select_binning)
+        self.horizontalLayout_4.addLayout(self.verticalLayout_8)
+        self.layoutWidget9 = QtWidgets.QWidget(self.centralwidget)
+        self.layoutWidget9.setGeometry(QtCore.QRect(20, 668, 640, 35))
+        self.layoutWidget9.setObjectName("layoutWidget9")
+        self.horizontalLayout_13 = QtWidgets.QHBoxLayout(self.layoutWidget9)
+        self.horizontalLayout_13.setContentsMargins(0, 0, 0, 0)
+        self.horizontalLayout_13.setObjectName("horizontalLayout_13")
+        self.label_25 = QtWidgets.QLabel(self.layoutWidget9)
+        self.label_25.setObjectName("label_25")
+        self.horizontalLayout_13.addWidget(self.label_25)
+        self.wavelength = QtWidgets.QLineEdit(self.layoutWidget9)
+        self.wavelength.setObjectName("wavelength")
+        self.horizontalLayout_13.addWidget(self.wavelength)
+        self.label_26 = QtWidgets.QLabel(self.layoutWidget9)
+        self.label_26.setObjectName("label_26")
+        self.horizontalLayout_13.addWidget(self.label_26)
+        self.detector_distance = QtWidgets.QLineEdit(self.layoutWidget9)
+        self.detector_distance.setObjectName("detector_distance")
+        self.horizontalLayout_13.addWidget(self.detector_distance)
+        self.label_27 = QtWidgets.QLabel(self.layoutWidget9)
+        self.label_27.setObjectName("label_27")
+        self.horizontalLayout_13.addWidget(self.label_27)
+        self.pixel_size = QtWidgets.QLineEdit(self.layoutWidget9)
+        self.pixel_size.setObjectName("pixel_size")
+        self.horizontalLayout_13.addWidget(self.pixel_size)
         MainWindow.setCentralWidget(self.centralwidget)
         self.menubar = QtWidgets.QMenuBar(MainWindow)
         self.menubar.setGeometry(QtCore.QRect(0, 0, 1097, 23))
@@ -296,6 +360,7 @@ class Ui_MainWindow(object):
         self.log.setText(_translate("MainWindow", "log显示"))
         self.save_raw_data.setText(_translate("MainWindow", "保存原始数据"))
         self.save_image.setText(_translate("MainWindow", "保存图片"))
+        self.auto_center.setText(_translate("MainWindow", "自动居中"))
         self.label_4.setText(_translate("MainWindow", "像素偏移"))
         self.label_5.setText(_translate("MainWindow", "像素数量"))
         self.label_8.setText(_translate("MainWindow", "曝光时间"))
@@ -326,3 +391,17 @@ class Ui_MainWindow(object):
         self.select_motion.setItemText(2, _translate("MainWindow", "nators"))
         self.select_motion.setItemText(3, _translate("MainWindow", "test2"))
         self.select_motion.setItemText(4, _translate("MainWindow", "test3"))
+        self.label_17.setText(_translate("MainWindow", "保存格式"))
+        self.select_sink.setItemText(0, _translate("MainWindow", "hdf5"))
+        self.select_sink.setItemText(1, _translate("MainWindow", "cxi"))
+        self.select_sink.setItemText(2, _translate("MainWindow", "sparse"))
+        self.select_sink.setItemText(3, _translate("MainWindow", "tiff"))
+        self.select_sink.setItemText(4, _translate("MainWindow", "npy"))
+        self.select_sink.setItemText(5, _translate("MainWindow", "png"))
+        self.label_18.setText(_translate("MainWindow", "合并像素"))
+        self.label_25.setText(_translate("MainWindow", "波长(nm)"))
+        self.label_26.setText(_translate("MainWindow", "探测器距离(mm)"))
+        self.label_27.setText(_translate("MainWindow", "像素尺寸(µm)"))
+        self.select_binning.setItemText(0, _translate("MainWindow", "1x1"))
+        self.select_binning.setItemText(1, _translate("MainWindow", "2x2"))
+        self.select_binning.setItemText(2, _translate("MainWindow", "4x4"))
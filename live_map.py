@@ -0,0 +1,132 @@
+import numpy as np
+
+
+class LiveScanMap:
+    """
+    扫描过程中实时生成STXM类型的样品图像。
+
+    每帧计算明场(BF)、暗场(DF)和质心偏移(DPC x/y)：探测器掩模在扫描开始前按帧尺寸预先计算，
+    拼成一个 (通道数, 像素数) 的矩阵，每帧只需一次矩阵-向量乘法。
+    结果按扫描位置 (abs_x, abs_y) 用双线性权重累加到图像上，图像随扫描逐帧更新。
+    """
+    CHANNELS = ('bf', 'df', 'dpc_x', 'dpc_y', 'total')
+
+    def __init__(self, abs_x, abs_y, frame_shape, center=None, bf_radius=None, df_radius=None,
+                 map_pixel=None):
+        """
+        参数:
+            abs_x, abs_y: 扫描点绝对坐标（mm，Scanner.abs_x/abs_y）
+            frame_shape: 衍射图尺寸
+            center: 衍射图中心 (row, col)，默认为图像中心
+            bf_radius: 明场半径（像素），默认为短边的1/8
+            df_radius: 暗场环 (内径, 外径)，默认为 (bf_radius, 短边的一半)
+            map_pixel: 图像像素对应的长度（mm），默认取相邻扫描点的最小间距
+        """
+        self.abs_x = np.asarray(abs_x, dtype=float)
+        self.abs_y = np.asarray(abs_y, dtype=float)
+        self.frame_shape = tuple(frame_shape)
+        self.center = center
+        self.bf_radius = bf_radius
+        self.df_radius = df_radius
+        self._build_masks()
+
+        if map_pixel is None:
+            steps = np.hypot(np.diff(self.abs_x), np.diff(self.abs_y))
+            steps = steps[steps > 0]
+            map_pixel = steps.min() if len(steps) else 1.0
+        self.map_pixel = map_pixel
+        self.x0 = self.abs_x.min()
+        self.y0 = self.abs_y.min()
+        nx = int(np.ceil((self.abs_x.max() - self.x0) / map_pixel)) + 1
+        ny = int(np.ceil((self.abs_y.max() - self.y0) / map_pixel)) + 1
+        self.sums = np.zeros((len(self.CHANNELS), ny, nx))
+        self.weights = np.zeros((ny, nx))
+        self.values = np.full((len(self.abs_x), len(self.CHANNELS)), np.nan)
+
+    def _build_masks(self):
+        rows, cols = self.frame_shape
+        if self.center is None:
+            self.center = ((rows - 1) / 2, (cols - 1) / 2)
+        short = min(rows, cols)
+        if self.bf_radius is None:
+            self.bf_radius = short / 8
+        if self.df_radius is None:
+            self.df_radius = (self.bf_radius, short / 2)
+        dy = (np.arange(rows) - self.center[0])[:, None]
+        dx = (np.arange(cols) - self.center[1])[None, :]
+        r2 = dx ** 2 + dy ** 2
+        bf = r2 <= self.bf_radius ** 2
+        df = (r2 > self.df_radius[0] ** 2) & (r2 <= self.df_radius[1] ** 2)
+        masks = np.empty((len(self.CHANNELS), rows * cols), dtype=np.float32)
+        masks[0] = bf.ravel()
+        masks[1] = df.ravel()
+        masks[2] = np.broadcast_to(dx, (rows, cols)).ravel()
+        masks[3] = np.broadcast_to(dy, (rows, cols)).ravel()
+        masks[4] = 1
+        self.masks = masks
+
+    def frame_values(self, image):
+        """
+        计算一帧的各通道数值
+
+        返回:
+            数组 [bf, df, dpc_x, dpc_y, total]，dpc 为质心相对中心的偏移（像素）
+        """
+        values = self.masks @ image.ravel().astype(np.float32, copy=False)
+        total = values[4]
+        if total > 0:
+            values[2:4] /= total
+        else:
+            values[2:4] = 0
+        return values
+
+    def add(self, index, image):
+        """
+        把第 index 个扫描点的帧加入图像。该点已经加入过（重扫覆盖原来的帧）时替换原来的数值，
+        不与原来的帧平均
+        """
+        if image.shape != self.frame_shape:
+            raise ValueError(f'帧尺寸 {image.shape} 与掩模尺寸 {self.frame_shape} 不一致')
+        values = self.frame_values(image)
+        previous = self.values[index].copy()
+        replace = bool(np.all(np.isfinite(previous)))
+        self.values[index] = values
+
+        # 双线性分配到相邻的4个像素
+        fx = (self.abs_x[index] - self.x0) / self.map_pixel
+        fy = (self.abs_y[index] - self.y0) / self.map_pixel
+        ix, iy = int(fx), int(fy)
+        wx, wy = fx - ix, fy - iy
+        for jy, wy_ in ((iy, 1 - wy), (iy + 1, wy)):
+            for jx, wx_ in ((ix, 1 - wx), (ix + 1, wx)):
+                w = wx_ * wy_
+                if w > 0 and jy < self.weights.shape[0] and jx < self.weights.shape[1]:
+                    if replace:
+                        # 权重不变，只把原来的贡献换成新的数值
+                        self.sums[:, jy, jx] += w * (values - previous)
+                    else:
+                        self.sums[:, jy, jx] += w * values
+                        self.weights[jy, jx] += w
+        return values
+
+    def image(self, channel='bf'):
+        """返回某个通道的当前图像，未扫描的位置为NaN"""
+        k = self.CHANNELS.index(channel)
+        with np.errstate(invalid='ignore', divide='ignore'):
+            return self.sums[k] / self.weights
+
+    def render(self, channel='bf'):
+        """归一化到 0~65535 的 uint16 图像，用于显示"""
+        image = self.image(channel)
+        valid = np.isfinite(image)
+        out = np.zeros(image.shape, dtype=np.uint16)
+        if valid.any():
+            lo, hi = np.percentile(image[valid], (1, 99))
+            if hi > lo:
+                out[valid] = (np.clip((image[valid] - lo) / (hi - lo), 0, 1) * 65535).astype(np.uint16)
+        return out
+
+    def render_mosaic(self, channels=('bf', 'df', 'dpc_x', 'dpc_y')):
+        """把多个通道拼成 2×2 图像"""
+        tiles = [self.render(c) for c in channels]
+        return np.vstack([np.hstack(tiles[:2]), np.hstack(tiles[2:4])])
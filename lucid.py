@@ -5,10 +5,12 @@ from abc import ABC, abstractmethod
 import numpy as np
 from PIL import Image as PIL_Image
 from arena_api.system import system
-from camera import Camera
+from camera import Camera, frame_info
 
 
 class LucidCamera(Camera):
+    ring_buffer = True
+
     def __init__(self, device_index=0, max_tries=6, wait_time=10):
         """
         初始化Lucid相机
@@ -23,6 +25,7 @@ class LucidCamera(Camera):
         self.tl_stream_nodemap = None
         self.nodemap = None
         self.is_streaming = False
+        self._n_buffers = 1  # read_new_frames 每次最多取出的帧数，start_sequence 设置
 
         # 连接设备
         self._connect_device(max_tries, wait_time)
@@ -113,6 +116,46 @@ class LucidCamera(Camera):
         except Exception as e:
             print(f'设置像素格式失败：{e}')
 
+    def get_camera_info(self):
+        info = {'serial': type(self).__name__, 'gain': None, 'roi': None}
+        try:
+            info['serial'] = str(self.nodemap['DeviceSerialNumber'].value)
+            info['roi'] = tuple(int(self.nodemap[n].value) for n in ('OffsetX', 'OffsetY', 'Width', 'Height'))
+            info['gain'] = float(self.nodemap['Gain'].value)
+        except Exception as e:
+            print(f'读取相机信息失败：{e}')
+        return info
+
+    def get_ex_time(self):
+        """读取曝光时间（s）"""
+        try:
+            return self.nodemap['ExposureTime'].value * 1e-6
+        except Exception as e:
+            print(f'读取曝光时间失败：{e}')
+            return None
+
+    def read_clock(self):
+        """GenICam：TimestampLatch 锁存当前时钟后读取 TimestampLatchValue（ns）"""
+        try:
+            self.nodemap['TimestampLatch'].execute()
+            return self.nodemap['TimestampLatchValue'].value * 1e-9
+        except Exception as e:
+            print(f'读取相机时钟失败：{e}')
+            return None
+
+    def set_external_trigger(self, enabled=True, line=None):
+        """GenICam：TriggerSelector=FrameStart，TriggerSource 默认 Line0（Lucid 的光耦输入）"""
+        try:
+            self.nodemap['TriggerSelector'].value = 'FrameStart'
+            if enabled:
+                self.nodemap['TriggerSource'].value = line or 'Line0'
+                self.nodemap['TriggerActivation'].value = 'RisingEdge'
+            self.nodemap['TriggerMode'].value = 'On' if enabled else 'Off'
+            return True
+        except Exception as e:
+            print(f'设置触发模式失败：{e}')
+            return False
+
     def start_acquisition(self):
         """开始图像采集"""
         if not self.is_streaming:
@@ -137,49 +180,96 @@ class LucidCamera(Camera):
         返回:
             numpy数组形式的图像数据，失败时返回None
         """
+        return self.read_newest_frame(timeout)[0]
+
+    def read_newest_frame(self, timeout=2000):
+        """
+        读取最新的图像和帧信息：frame_id 为GVSP块号，timestamp 为相机时间戳（timestamp_ns）
+
+        返回:
+            (图像, frame_info)，失败时图像为None
+        """
         try:
             if not self.is_streaming:
                 self.start_acquisition()
+            return self._get_frame(timeout)
 
-            # 获取图像缓冲区
-            image_buffer = self.device.get_buffer(timeout=timeout)
-
-            # 根据像素格式处理图像数据
-            if self.pixel_format in ['Mono8', 'Mono12', 'Mono12p', 'Mono16']:
-                # 处理单通道图像
-                if self.pixel_format == 'Mono12' or self.pixel_format == 'Mono16':
-                    # Mono12: 16位数据，实际使用12位
-                    pdata_as16 = ctypes.cast(image_buffer.pdata,
-                                             ctypes.POINTER(ctypes.c_ushort))
-                    image_array = np.ctypeslib.as_array(
-                        pdata_as16,
-                        (image_buffer.height, image_buffer.width)
-                    )
-                elif self.pixel_format == 'Mono12p':
-                    image_array = self._unpack_mono12p(
-                        image_buffer.pdata,
-                        image_buffer.width,
-                        image_buffer.height
-                    )
-                else:
-                    # Mono8: 8位数据
-                    image_array = np.ctypeslib.as_array(
-                        image_buffer.pdata,
-                        (image_buffer.height, image_buffer.width)
-                    )
+        except Exception as e:
+            print(f'获取图像失败：{e}')
+            return None, frame_info()
+
+    def _get_frame(self, timeout):
+        """取出一个缓冲区并转换为图像，超时抛出异常"""
+        # 获取图像缓冲区
+        image_buffer = self.device.get_buffer(timeout=timeout)
+        info = frame_info(image_buffer.frame_id, image_buffer.timestamp_ns * 1e-9)
+
+        # 根据像素格式处理图像数据
+        if self.pixel_format in ['Mono8', 'Mono12', 'Mono12p', 'Mono16']:
+            # 处理单通道图像
+            if self.pixel_format == 'Mono12' or self.pixel_format == 'Mono16':
+                # Mono12: 16位数据，实际使用12位
+                pdata_as16 = ctypes.cast(image_buffer.pdata,
+                                         ctypes.POINTER(ctypes.c_ushort))
+                image_array = np.ctypeslib.as_array(
+                    pdata_as16,
+                    (image_buffer.height, image_buffer.width)
+                )
+            elif self.pixel_format == 'Mono12p':
+                image_array = self._unpack_mono12p(
+                    image_buffer.pdata,
+                    image_buffer.width,
+                    image_buffer.height
+                )
             else:
-                # 其他格式可以在这里扩展
-                print(f"警告: 像素格式 {self.pixel_format} 的处理未实现")
-                image_array = None
-
-            # 归还缓冲区
-            self.device.requeue_buffer(image_buffer)
-
-            return image_array
+                # Mono8: 8位数据
+                image_array = np.ctypeslib.as_array(
+                    image_buffer.pdata,
+                    (image_buffer.height, image_buffer.width)
+                )
+        else:
+            # 其他格式可以在这里扩展
+            print(f"警告: 像素格式 {self.pixel_format} 的处理未实现")
+            image_array = None
+
+        # 归还缓冲区前复制，缓冲区会被下一帧覆盖
+        if image_array is not None:
+            image_array = np.array(image_array)
+        self.device.requeue_buffer(image_buffer)
+
+        return image_array, info
+
+    def start_sequence(self, n_buffers=256):
+        """按到达顺序取出所有帧（StreamBufferHandlingMode = OldestFirst），缓冲区满时丢弃最旧的帧"""
+        try:
+            self.stop_acquisition()
+            self.tl_stream_nodemap['StreamBufferHandlingMode'].value = 'OldestFirst'
+            self.device.start_stream(n_buffers)
+            self.is_streaming = True
+            self._n_buffers = n_buffers
+        except Exception as e:
+            print(f'开始连续采集失败：{e}')
 
+    def stop_sequence(self):
+        """恢复只保留最新帧（StreamBufferHandlingMode = NewestOnly）和默认的缓冲区数"""
+        try:
+            self.stop_acquisition()
+            self.tl_stream_nodemap['StreamBufferHandlingMode'].value = 'NewestOnly'
+            self.device.start_stream()
+            self.is_streaming = True
+            self._n_buffers = 1
         except Exception as e:
-            print(f'获取图像失败：{e}')
-            return None
+            print(f'结束连续采集失败：{e}')
+
+    def read_new_frames(self):
+        frames = []
+        # 没有可读的缓冲区时 get_buffer 超时抛出异常，即已取完
+        for _ in range(self._n_buffers):
+            try:
+                frames.append(self._get_frame(timeout=1))
+            except Exception:
+                break
+        return frames
 
     def save_image(self, image_array, filename, format='PNG'):
         """
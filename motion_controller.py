@@ -1,5 +1,5 @@
+import threading
 import time
-from pylablib.devices import SmarAct
 from abc import ABC, abstractmethod
 
 
@@ -11,10 +11,64 @@ class MotionController(ABC):
     def move_by(self, distance, axis):
         pass
 
+    def get_position(self, axis):
+        """读取当前位置（mm），不支持的位移台返回None"""
+        return None
+
+    def read_position(self, axis):
+        """
+        运动过程中高频采样位置（position_trace.PositionTrace 使用），可以在其他线程执行运动命令时调用；
+        默认与 get_position 相同
+        """
+        return self.get_position(axis)
+
+    def read_clock(self):
+        """
+        读取控制器当前时钟（s），用于 clock_sync 把控制器记录的时间换算到主机时钟；不支持的控制器返回 None
+        """
+        return None
+
+    def enable_position_compare(self, axis, start, stop, step):
+        """
+        位置比较触发：axis 从 start 运动到 stop（mm）的过程中，每经过 step 在触发输出上产生一个脉冲，
+        脉冲位置为 min(start, stop) + k × step（见 position_compare.compare_positions），往返两个方向相同。
+        需在轴静止时调用
+
+        返回:
+            按运动方向排列的脉冲位置，不支持的位移台返回 None
+        """
+        print(f'{type(self).__name__} 不支持位置比较触发')
+        return None
+
+    def disable_position_compare(self, axis):
+        """关闭位置比较触发"""
+        pass
+
+    def upload_trajectory(self, trajectory, filename='flyscan.trj'):
+        """
+        上传 PVT 轨迹（pvt_trajectory.PVTTrajectory）并检查能否执行
+
+        返回:
+            是否成功，默认不支持
+        """
+        print(f'{type(self).__name__} 不支持PVT轨迹')
+        return False
+
+    def run_trajectory(self, filename='flyscan.trj'):
+        """从当前位置（应为轨迹起点）执行已上传的轨迹，阻塞到结束"""
+        pass
+
+    def trajectory_progress(self):
+        """
+        正在执行的轨迹元素序号（从1开始），可以在其他线程执行轨迹时调用；不支持或未执行时返回 None
+        """
+        return None
+
 
 class smartact(MotionController):
     def __init__(self):
         super().__init__()
+        from pylablib.devices import SmarAct
         device = SmarAct.list_msc2_devices()
         if len(device) == 0:
             print('没有位移台')
@@ -25,8 +79,50 @@ class smartact(MotionController):
     def home(self, axis=0):
         self.motion.home(axis=axis)
 
-    def move_by(self, distance, axis=0):
-        self.motion.move_by(distance / 1000, axis=axis)
+    def move_by(self, distance, axis=0, relative=True):
+        if relative:
+            self.motion.move_by(distance / 1000, axis=axis)
+        else:
+            self.motion.move_to(distance / 1000, axis=axis)
+
+    def get_position(self, axis=0):
+        try:
+            return self.motion.get_position(axis=axis) * 1000
+        except Exception as e:
+            print(f'smartact读取位置失败：{e}')
+            return None
+
+    def enable_position_compare(self, axis, start, stop, step, pulse_width=1000):
+        """
+        MCS2 通道的触发输出设为位置比较模式（单位 pm），只在运动方向上触发：
+        起始阈值为沿运动方向的第一个脉冲位置，之后每 step 一个脉冲，超出 [min, max] 后不再触发
+
+        参数:
+            pulse_width: 脉冲宽度（ns）
+        """
+        from position_compare import compare_positions
+        positions = compare_positions(start, stop, step)
+        try:
+            self.motion.set_property('ch_output_trig_mode', 0, axis)
+            lower, upper = sorted((positions[0], positions[-1]))
+            self.motion.set_property('ch_pos_comp_limit_min', round(lower * 1e9) - 1, axis)
+            self.motion.set_property('ch_pos_comp_limit_max', round(upper * 1e9) + 1, axis)
+            self.motion.set_property('ch_pos_comp_start_threshold', round(positions[0] * 1e9), axis)
+            self.motion.set_property('ch_pos_comp_increment', round(step * 1e9), axis)
+            # 0 为正向，1 为反向
+            self.motion.set_property('ch_pos_comp_direction', 0 if stop >= start else 1, axis)
+            self.motion.set_property('ch_output_trig_pulse_width', pulse_width, axis)
+            self.motion.set_property('ch_output_trig_mode', 1, axis)
+            return positions
+        except Exception as e:
+            print(f'smartact设置位置比较失败：{e}')
+            return None
+
+    def disable_position_compare(self, axis):
+        try:
+            self.motion.set_property('ch_output_trig_mode', 0, axis)
+        except Exception as e:
+            print(f'smartact关闭位置比较失败：{e}')
 
     def stop_all(self):
         if self.motion.is_moving(axis=0):
@@ -44,6 +140,11 @@ class xps(MotionController):
             from newportxps import NewportXPS
             self.xps = NewportXPS(IP, username=username, password=password, port=port)
             self.groups = []
+            self._connection = (IP, username, password, port)
+            self._monitor = None
+            self._monitor_lock = threading.Lock()
+            self.positioners = None  # 各轴的定位器名，None 时为 <group>.Pos（单轴组）
+            self.pvt_group = None  # 执行 PVT 轨迹的多轴组（MultipleAxes）
         except Exception as e:
             print(f'XPS 初始化失败{e}')
 
@@ -61,6 +162,36 @@ class xps(MotionController):
             self.groups = groups
             print
 
+    def init_pvt_group(self, group, positioners=('X', 'Y')):
+        """
+        使用多轴组（system.ini 中定义为 MultipleAxes，如 XY.X、XY.Y）：PVT 轨迹只能在多轴组上执行，
+        之后各轴的运动、读位置、位置比较都使用该组的定位器
+        """
+        try:
+            self.xps.initialize_group(group)
+            time.sleep(0.5)
+            self.xps.home_group(group)
+        except Exception as e:
+            print(f'初始化xps多轴组异常，请检查是否重复初始化:{e}')
+        self.pvt_group = group
+        self.positioners = [f'{group}.{name}' for name in positioners]
+
+    def _positioner(self, axis):
+        if self.positioners is not None:
+            return self.positioners[axis]
+        return f'{self.groups[axis]}.Pos'
+
+    def _monitor_xps(self):
+        """
+        运动命令（GroupMoveAbsolute、MultipleAxesPVTExecution）会阻塞所在的连接直到运动结束，
+        运动过程中的查询使用另外建立的连接。驱动发送请求后读到 EndOfAPI 为止，没有加锁，
+        位置采样、轨迹进度和时钟采样在不同线程中查询，调用方需持有 _monitor_lock
+        """
+        if self._monitor is None:
+            IP, username, password, port = self._connection
+            self._monitor = NewportXPS(IP, username=username, password=password, port=port)
+        return self._monitor
+
     def init_all_groups(self):
         self.xps.initialize_allgroups()
 
@@ -70,10 +201,113 @@ class xps(MotionController):
 
     def move_by(self, distance: int, axis: int, relative: bool = True):
         try:
-            self.xps.move_stage(value=distance, stage=f'{self.groups[axis]}.Pos', relative=relative)
+            self.xps.move_stage(value=distance, stage=self._positioner(axis), relative=relative)
         except Exception as e:
             print(f'xps移动失败：{e}')
 
+    def get_position(self, axis: int):
+        try:
+            return self.xps.get_stage_position(self._positioner(axis))
+        except Exception as e:
+            print(f'xps读取位置失败：{e}')
+            return None
+
+    def read_position(self, axis: int):
+        """运动过程中的位置采样使用另外建立的连接（见 _monitor_xps）"""
+        try:
+            with self._monitor_lock:
+                return self._monitor_xps().get_stage_position(self._positioner(axis))
+        except Exception as e:
+            print(f'xps读取位置失败：{e}')
+            return None
+
+    def read_clock(self):
+        """XPS 控制器时钟（ElapsedTimeGet，开机以来的时间），使用查询连接"""
+        try:
+            with self._monitor_lock:
+                monitor = self._monitor_xps()
+                error, elapsed = monitor._xps.ElapsedTimeGet(monitor._sid)[:2]
+            return float(elapsed) if error == 0 else None
+        except Exception as e:
+            print(f'xps读取控制器时钟失败：{e}')
+            return None
+
+    def enable_position_compare(self, axis, start, stop, step, pulse_width=1, settling_time=0.075):
+        """
+        XPS 位置比较输出（PCO，PositionerPositionCompareSet）：在 [min, max] 内每经过 step 输出一个脉冲，
+        两个方向都触发。脉冲从定位器对应的 PCO 接口输出
+
+        参数:
+            pulse_width: 脉冲宽度（µs，可选 0.2、1、2.5、10）
+            settling_time: 编码器稳定时间（µs，可选 0.075、1、4、12）
+        """
+        from position_compare import compare_positions
+        positions = compare_positions(start, stop, step)
+        positioner = self._positioner(axis)
+        lower, upper = sorted((positions[0], positions[-1]))
+        try:
+            driver, sid = self.xps._xps, self.xps._sid
+            driver.PositionerPositionCompareDisable(sid, positioner)
+            for result in (driver.PositionerPositionComparePulseParametersSet(sid, positioner, pulse_width,
+                                                                               settling_time),
+                           driver.PositionerPositionCompareSet(sid, positioner, lower, upper, step),
+                           driver.PositionerPositionCompareEnable(sid, positioner)):
+                if result[0] != 0:
+                    raise RuntimeError(f'错误码 {result[0]}')
+            return positions
+        except Exception as e:
+            print(f'xps设置位置比较失败：{e}')
+            return None
+
+    def disable_position_compare(self, axis):
+        try:
+            self.xps._xps.PositionerPositionCompareDisable(self.xps._sid, self._positioner(axis))
+        except Exception as e:
+            print(f'xps关闭位置比较失败：{e}')
+
+    def upload_trajectory(self, trajectory, filename='flyscan.trj'):
+        """
+        上传 PVT 轨迹文件到 XPS（FTP，Public/Trajectories）并用 MultipleAxesPVTVerification 检查行程、
+        速度和加速度是否超限
+        """
+        if self.pvt_group is None:
+            print('PVT 轨迹需要多轴组，请先调用 init_pvt_group')
+            return False
+        try:
+            self.xps.upload_trajectory(filename, trajectory.text())
+            driver, sid = self.xps._xps, self.xps._sid
+            error = driver.MultipleAxesPVTVerification(sid, self.pvt_group, filename)[0]
+            if error != 0:
+                for positioner in self.positioners:
+                    result = driver.MultipleAxesPVTVerificationResultGet(sid, positioner)
+                    print(f'{positioner} 轨迹检查结果（最小位置, 最大位置, 最大速度, 最大加速度）：{result[2:]}')
+                print(f'xps轨迹检查失败：错误码 {error}')
+                return False
+            return True
+        except Exception as e:
+            print(f'xps上传轨迹失败：{e}')
+            return False
+
+    def run_trajectory(self, filename='flyscan.trj'):
+        """从当前位置执行已上传的轨迹，阻塞到执行结束，执行前应先移动到轨迹起点"""
+        try:
+            error = self.xps._xps.MultipleAxesPVTExecution(self.xps._sid, self.pvt_group, filename, 1)[0]
+            if error != 0:
+                print(f'xps执行轨迹失败：错误码 {error}')
+        except Exception as e:
+            print(f'xps执行轨迹失败：{e}')
+
+    def trajectory_progress(self):
+        """正在执行的轨迹元素序号（MultipleAxesPVTParametersGet，从1开始），使用查询连接"""
+        try:
+            with self._monitor_lock:
+                monitor = self._monitor_xps()
+                error, _, element = monitor._xps.MultipleAxesPVTParametersGet(monitor._sid, self.pvt_group)
+            return int(element) if error == 0 else None
+        except Exception as e:
+            print(f'xps读取轨迹进度失败：{e}')
+            return None
+
     def status_report(self):
         return self.xps.status_report()
 
@@ -3,7 +3,7 @@ import ids_peak_ipl.ids_peak_ipl as ids_ipl
 import ids_peak.ids_peak_ipl_extension as ids_ipl_extension
 import numpy as np
 from abc import ABC, abstractmethod
-from camera import Camera
+from camera import Camera, frame_info
 import copy
 
 
@@ -16,6 +16,7 @@ class IDSPeakCamera(Camera):
         self.datastream = None
         self.buffers = []
         self.is_acquiring = False
+        self.external_trigger = False
 
         # 初始化库
         ids_peak.Library.Initialize()
@@ -102,6 +103,47 @@ class IDSPeakCamera(Camera):
         self.remote_device_nodemap.FindNode("ExposureTime").SetValue(ex_time_us)
         print(f"Exposure time set to {ex_time_us} μs ({ex_time} s)")
 
+    def get_ex_time(self):
+        """读取曝光时间，返回：秒"""
+        return self.remote_device_nodemap.FindNode("ExposureTime").Value() * 1e-6
+
+    def get_camera_info(self):
+        nodemap = self.remote_device_nodemap
+        info = {'serial': type(self).__name__, 'gain': None, 'roi': None}
+        try:
+            info['serial'] = str(nodemap.FindNode("DeviceSerialNumber").Value())
+            info['roi'] = tuple(int(nodemap.FindNode(n).Value()) for n in ('OffsetX', 'OffsetY', 'Width', 'Height'))
+            info['gain'] = float(nodemap.FindNode("Gain").Value())
+        except Exception as e:
+            print(f'读取相机信息失败：{e}')
+        return info
+
+    def read_clock(self):
+        """GenICam：TimestampLatch 锁存当前时钟后读取 TimestampLatchValue（ns）"""
+        try:
+            nodemap = self.remote_device_nodemap
+            nodemap.FindNode("TimestampLatch").Execute()
+            nodemap.FindNode("TimestampLatch").WaitUntilDone()
+            return nodemap.FindNode("TimestampLatchValue").Value() * 1e-9
+        except Exception as e:
+            print(f'读取相机时钟失败：{e}')
+            return None
+
+    def set_external_trigger(self, enabled=True, line=None):
+        """触发源在软件触发和外部输入线（默认 Line0）之间切换，TriggerMode 始终为 On"""
+        try:
+            nodemap = self.remote_device_nodemap
+            if enabled:
+                nodemap.FindNode("TriggerSource").SetCurrentEntry(line or "Line0")
+                nodemap.FindNode("TriggerActivation").SetCurrentEntry("RisingEdge")
+            else:
+                nodemap.FindNode("TriggerSource").SetCurrentEntry("Software")
+            self.external_trigger = enabled
+            return True
+        except Exception as e:
+            print(f'设置触发模式失败：{e}')
+            return False
+
     def start_acquisition(self):
         """开始图像采集"""
         if self.is_acquiring:
@@ -116,14 +158,20 @@ class IDSPeakCamera(Camera):
 
     def read_newest_image(self):
         """读取最新的图像"""
+        return self.read_newest_frame()[0]
+
+    def read_newest_frame(self):
+        """读取最新的图像和帧信息：FrameID 为帧计数，Timestamp_ns 为相机时间戳"""
         if not self.is_acquiring:
             raise RuntimeError("Acquisition not started. Call start_acquisition() first.")
 
-        # 触发图像采集
-        self.remote_device_nodemap.FindNode("TriggerSoftware").Execute()
+        # 触发图像采集，外部触发时等待触发脉冲
+        if not self.external_trigger:
+            self.remote_device_nodemap.FindNode("TriggerSoftware").Execute()
 
         # 等待完成的缓冲区
         buffer = self.datastream.WaitForFinishedBuffer(5000)
+        info = frame_info(buffer.FrameID(), buffer.Timestamp_ns() * 1e-9)
 
         # 转换为图像
         raw_image = ids_ipl_extension.BufferToImage(buffer)
@@ -137,7 +185,7 @@ class IDSPeakCamera(Camera):
         # 重新将缓冲区加入队列
         self.datastream.QueueBuffer(buffer)
 
-        return picture
+        return picture, info
 
     def get_frame_period(self):
         """获取帧率，返回：秒"""
@@ -6,9 +6,11 @@ import numpy as np
 # 需要安装 pyvcam： pip install PyVCAM
 from pyvcam import pvc
 from pyvcam.camera import Camera as PyVcamCamera
-from camera import Camera
+from camera import Camera, frame_info
 
 class PyVCAM(Camera):
+    exposure_step = 1e-3  # 曝光时间按整数毫秒传给 pyvcam
+
     def __init__(self, cam_name: str = None, default_ex_time_s: float = 0.02):
         """
         cam_name: 可选，相机的名字（如 'PMUSBCam00'），不指定则使用detect第一个相机
@@ -60,6 +62,18 @@ class PyVCAM(Camera):
             pass
 
 
+    def get_ex_time(self):
+        return self._ex_time_s
+
+    def get_camera_info(self):
+        info = {'serial': type(self).__name__, 'gain': None, 'roi': None}
+        try:
+            info['serial'] = str(self.cam.serial_no)
+            info['gain'] = float(self.cam.gain)
+        except Exception as e:
+            print(f'读取相机信息失败：{e}')
+        return info
+
     def start_acquisition(self):
         """启动后台连续采集（如果已在采集则不重复启动）"""
         win_name = 'Live Mode'
@@ -81,6 +95,15 @@ class PyVCAM(Camera):
             print(f'获取图像失败：{e}')
         return image['pixel_data']
 
+    def read_newest_frame(self):
+        """poll_frame 返回的 frame_count 为帧计数；pyvcam 不提供相机时间戳（需开启元数据），只有主机时间"""
+        try:
+            image, fps, frame_count = self.cam.poll_frame()
+        except Exception as e:
+            print(f'获取图像失败：{e}')
+            return None, frame_info()
+        return image['pixel_data'], frame_info(frame_count)
+
     def get_frame_period(self):
         """
         返回帧周期（秒/帧）的近似值；优先使用历史时间戳计算平均间隔，
@@ -0,0 +1,185 @@
+import os
+import time
+import numpy as np
+from dark_library import acquire_frames
+
+
+class PixelStatistics:
+    """
+    Welford 算法逐帧更新每个像素的均值和方差，不保存各帧。
+    均值、二阶矩和两个临时缓冲区均为 float64，在第一帧时按帧尺寸分配，之后每帧原地更新；
+    与先求和再求平方和相比，信号远大于噪声时也不会因相减而损失精度。
+    """
+
+    def __init__(self):
+        self.count = 0
+        self._mean = None
+        self._m2 = None
+        self._delta = None
+        self._delta2 = None
+
+    def reset(self):
+        self.count = 0
+        if self._mean is not None:
+            self._mean[...] = 0
+            self._m2[...] = 0
+
+    def add(self, image):
+        if self._mean is None or self._mean.shape != image.shape:
+            self._mean = np.zeros(image.shape, dtype=np.float64)
+            self._m2 = np.zeros(image.shape, dtype=np.float64)
+            self._delta = np.empty(image.shape, dtype=np.float64)
+            self._delta2 = np.empty(image.shape, dtype=np.float64)
+            self.count = 0
+        self.count += 1
+        # delta = x - mean；mean += delta / n；m2 += delta × (x - mean_new)
+        np.subtract(image, self._mean, out=self._delta)
+        np.multiply(self._delta, 1.0 / self.count, out=self._delta2)
+        self._mean += self._delta2
+        np.subtract(image, self._mean, out=self._delta2)
+        self._delta *= self._delta2
+        self._m2 += self._delta
+
+    @property
+    def mean(self):
+        """每个像素的均值（返回内部缓冲区，继续添加帧时会改变）"""
+        return self._mean
+
+    @property
+    def variance(self):
+        """每个像素的无偏方差"""
+        if self.count < 2:
+            return None
+        return self._m2 / (self.count - 1)
+
+    def summary(self, mask=None):
+        """
+        空间平均的 (均值, 时间方差)
+
+        参数:
+            mask: 可选，参与统计的像素（True 为参与）
+        """
+        if self.count < 2:
+            return None
+        if mask is None:
+            return float(self._mean.mean()), float(self._m2.mean() / (self.count - 1))
+        return float(self._mean[mask].mean()), float(self._m2[mask].mean() / (self.count - 1))
+
+
+def fit_photon_transfer(means, variances, max_level=None, reject=3.0):
+    """
+    拟合光子转移曲线 variance = read_var + K × (mean - offset)，K 为 ADU/电子。
+    偏置 offset 由 mean 与曝光时间的线性关系外推到曝光为0得到（见 PhotonTransferCurve），
+    此处只拟合 variance = a + K × mean，再由 read_var = a + K × offset 得到读出噪声。
+
+    参数:
+        means, variances: 各曝光时间的空间平均均值和时间方差（ADU）
+        max_level: 均值超过该值的点（接近饱和，方差偏小）不参与拟合
+        reject: 相对残差超过 reject 倍稳健标准差的点剔除后重新拟合一次
+
+    返回:
+        (K, a, 参与拟合的点的布尔数组)
+    """
+    means = np.asarray(means, dtype=np.float64)
+    variances = np.asarray(variances, dtype=np.float64)
+    used = np.isfinite(means) & np.isfinite(variances)
+    if max_level is not None:
+        used &= means < max_level
+    if np.count_nonzero(used) < 3:
+        raise ValueError('有效的曝光点少于3个，无法拟合光子转移曲线')
+    slope, intercept = np.polyfit(means[used], variances[used], 1)
+    # 方差的统计误差与方差成正比，用相对残差判断离群点
+    residual = variances / (intercept + slope * means) - 1
+    # 点数少、数据很干净时稳健标准差会过小，下限取2%
+    sigma = max(1.4826 * np.median(np.abs(residual[used] - np.median(residual[used]))), 0.02)
+    keep = used & (np.abs(residual) <= reject * sigma)
+    if np.count_nonzero(keep) >= 3:
+        used = keep
+        slope, intercept = np.polyfit(means[used], variances[used], 1)
+    return float(slope), float(intercept), used
+
+
+class PhotonTransferCurve:
+    """
+    光子转移曲线测量：在均匀、稳定的照明下逐个设置曝光时间，每个曝光时间用 PixelStatistics
+    累加 n_frames 帧，记录空间平均的均值和时间方差（逐像素的时间方差不含固定图样噪声），不保存帧。
+    拟合得到 ADU/电子（转换增益）和读出噪声，可用于任何实现了 Camera 接口的相机。
+    """
+
+    def __init__(self, camera, exposures, n_frames=32, settle_frames=2, roi=None, max_level=None):
+        """
+        参数:
+            camera: Camera 对象
+            exposures: 曝光时间序列（s）
+            n_frames: 每个曝光时间统计的帧数
+            settle_frames: 改变曝光时间后丢弃的帧数（可能仍是旧曝光时间的帧）
+            roi: 可选，统计区域 (行切片, 列切片)，默认整帧
+            max_level: 饱和附近的均值上限（ADU），超过的点不参与拟合
+        """
+        self.camera = camera
+        step = getattr(camera, 'exposure_step', None)
+        if step:
+            # 按相机的设置步长取整，去掉取整后重复的曝光时间
+            exposures = np.unique(np.maximum(np.round(np.asarray(exposures) / step), 1) * step)
+        self.exposures = [float(t) for t in exposures]
+        self.n_frames = n_frames
+        self.settle_frames = settle_frames
+        self.roi = roi
+        self.max_level = max_level
+        self.means = []
+        self.variances = []
+        self.result = None
+
+    def measure(self, restore_exposure=None):
+        """
+        依次测量所有曝光时间并拟合
+
+        参数:
+            restore_exposure: 测量结束后恢复的曝光时间（s），None 表示不恢复
+        """
+        stats = PixelStatistics()
+        self.means, self.variances = [], []
+        try:
+            for exposure in self.exposures:
+                self.camera.set_ex_time(exposure)
+                stats.reset()
+                frames = acquire_frames(self.camera, self.settle_frames + self.n_frames)
+                for k, image in enumerate(frames):
+                    if k < self.settle_frames:
+                        continue
+                    stats.add(image if self.roi is None else image[self.roi])
+                summary = stats.summary()
+                mean, variance = summary if summary is not None else (np.nan, np.nan)
+                self.means.append(mean)
+                self.variances.append(variance)
+                print(f'曝光 {exposure * 1e3:.3f} ms: 均值 {mean:.1f} ADU, 方差 {variance:.2f} ADU²')
+        finally:
+            if restore_exposure is not None:
+                self.camera.set_ex_time(restore_exposure)
+        return self.fit()
+
+    def fit(self):
+        """
+        返回:
+            dict: adu_per_electron, read_noise_adu, read_noise_e, offset, 以及各点数据
+        """
+        exposures = np.asarray(self.exposures)
+        means = np.asarray(self.means)
+        variances = np.asarray(self.variances)
+        gain, intercept, used = fit_photon_transfer(means, variances, self.max_level)
+        # 均值随曝光时间线性增加，外推到曝光为0即偏置（含暗电流的零点）
+        rate, offset = np.polyfit(exposures[used], means[used], 1)
+        read_var = intercept + gain * offset
+        read_noise = float(np.sqrt(read_var)) if read_var > 0 else 0.0
+        self.result = {'adu_per_electron': gain, 'read_noise_adu': read_noise,
+                       'read_noise_e': read_noise / gain if gain > 0 else np.nan, 'offset': float(offset),
+                       'signal_rate': float(rate), 'exposures': exposures, 'means': means,
+                       'variances': variances, 'used': used}
+        print(f"转换增益 {gain:.4f} ADU/e-，读出噪声 {read_noise:.2f} ADU = {self.result['read_noise_e']:.2f} e-")
+        return self.result
+
+    def save(self, path):
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        np.savez(path, time=time.strftime('%Y-%m-%dT%H:%M:%S'), n_frames=self.n_frames, **self.result)
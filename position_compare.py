@@ -0,0 +1,83 @@
+import numpy as np
+
+
+def compare_positions(start, stop, step):
+    """
+    位置比较触发的脉冲位置：min(start, stop) + k × step，不超过 max(start, stop)，按 start → stop 的运动方向排列。
+    往返扫描时两个方向的脉冲落在同一组位置上
+
+    参数:
+        start, stop: 触发区间（mm），沿运动方向
+        step: 脉冲间隔（mm）
+
+    返回:
+        脉冲位置数组
+    """
+    if step <= 0:
+        raise ValueError('触发间隔必须大于0')
+    lower, upper = sorted((float(start), float(stop)))
+    # 浮点误差不应丢掉正好落在区间端点的脉冲
+    n = int(np.floor((upper - lower) / step + 1e-9)) + 1
+    positions = lower + np.arange(n) * step
+    return positions if stop >= start else positions[::-1]
+
+
+class TriggerMatcher:
+    """
+    把一行扫描中收到的帧对应到位置比较触发的脉冲序号：外部触发时相机每个脉冲曝光一帧，
+    帧计数与脉冲序号一一对应，丢帧时仍能对上后面的帧；没有帧计数的相机按到达顺序对应。
+    """
+
+    def __init__(self, positions, first_id=None, wrap=None):
+        """
+        参数:
+            positions: 按运动方向排列的脉冲位置（mm）
+            first_id: 第一个脉冲对应的帧计数（通常为开启触发前最后一帧的计数 + 1），
+                None 表示以收到的第一帧为第一个脉冲
+            wrap: 帧计数的回绕周期，见 frame_sequence.FrameSequence
+        """
+        self.positions = np.asarray(positions, dtype=np.float64)
+        self.first_id = first_id
+        self.wrap = wrap
+        self.received = np.zeros(len(self.positions), dtype=bool)
+        self.extra = 0
+        self._count = 0
+
+    def match(self, frame_id):
+        """
+        返回:
+            该帧对应的脉冲序号，超出脉冲数（多余的触发或帧计数对不上）时返回 -1
+        """
+        if frame_id is None or (isinstance(frame_id, float) and np.isnan(frame_id)):
+            index = self._count
+        else:
+            frame_id = int(frame_id)
+            if self.first_id is None:
+                self.first_id = frame_id
+            index = frame_id - self.first_id
+            if self.wrap:
+                index %= self.wrap
+        self._count += 1
+        if not 0 <= index < len(self.positions):
+            self.extra += 1
+            return -1
+        self.received[index] = True
+        return index
+
+    def position(self, frame_id):
+        """该帧曝光时的位置（mm），对不上脉冲时为 NaN"""
+        index = self.match(frame_id)
+        return self.positions[index] if index >= 0 else np.nan
+
+    @property
+    def missing(self):
+        """没有收到帧的脉冲序号"""
+        return np.flatnonzero(~self.received)
+
+    def report(self):
+        text = f'触发 {len(self.positions)} 次，收到 {int(self.received.sum())} 帧'
+        if len(self.missing):
+            text += f'，缺 {len(self.missing)} 帧'
+        if self.extra:
+            text += f'，{self.extra} 帧对不上触发'
+        return text
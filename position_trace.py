@@ -0,0 +1,183 @@
+import threading
+import time
+import numpy as np
+from clock_sync import ClockSync
+
+
+class PositionTrace:
+    """
+    在后台线程中连续读取位移台位置，记录 (主机时间, 位置)，用于给飞扫的每一帧插值出曝光时刻的位置。
+    时间使用 time.perf_counter()，与 camera.frame_info 的 host_time 相同；
+    每次读取取调用前后时间的中点，多个轴依次读取，各轴有自己的时间戳。
+    """
+
+    def __init__(self, motion, axes=(0, 1), interval=0.0):
+        """
+        参数:
+            motion: MotionController，使用 read_position(axis) 读取位置
+            axes: 记录的轴
+            interval: 两次采样之间的等待时间（s），0 表示尽可能快
+        """
+        self.motion = motion
+        self.axes = tuple(axes)
+        self.interval = interval
+        self.times = [[] for _ in self.axes]
+        self.positions = [[] for _ in self.axes]
+        self._stop = threading.Event()
+        self._thread = None
+
+    def start(self):
+        if self._thread is not None:
+            return
+        self._stop.clear()
+        self._thread = threading.Thread(target=self._run, daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        if self._thread is None:
+            return
+        self._stop.set()
+        self._thread.join()
+        self._thread = None
+
+    def _run(self):
+        while not self._stop.is_set():
+            for k, axis in enumerate(self.axes):
+                t0 = time.perf_counter()
+                position = self.motion.read_position(axis)
+                t1 = time.perf_counter()
+                if position is not None:
+                    self.times[k].append((t0 + t1) / 2)
+                    self.positions[k].append(position)
+            if self.interval:
+                time.sleep(self.interval)
+
+    def __enter__(self):
+        self.start()
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.stop()
+
+    def sample_rate(self, axis_index=0):
+        """平均采样率（Hz）"""
+        t = self.times[axis_index]
+        if len(t) < 2:
+            return 0.0
+        return (len(t) - 1) / (t[-1] - t[0])
+
+    def positions_at(self, times, max_gap=None):
+        """
+        线性插值出 times 时刻各轴的位置
+
+        参数:
+            times: 主机时间（perf_counter，s）
+            max_gap: 与最近的采样点相距超过该时间（s）的时刻返回 NaN，默认为平均采样间隔的5倍
+
+        返回:
+            (n, 轴数) 的数组，超出记录范围的时刻为 NaN
+        """
+        times = np.asarray(times, dtype=np.float64)
+        result = np.full((times.size, len(self.axes)), np.nan)
+        for k in range(len(self.axes)):
+            # 复制一份，采样线程可能还在追加
+            n = min(len(self.times[k]), len(self.positions[k]))
+            t = np.array(self.times[k][:n])
+            p = np.array(self.positions[k][:n], dtype=np.float64)
+            if n < 2:
+                continue
+            gap = max_gap if max_gap is not None else 5 * (t[-1] - t[0]) / (n - 1)
+            values = np.interp(times, t, p)
+            i = np.clip(np.searchsorted(t, times), 1, n - 1)
+            nearest = np.minimum(np.abs(times - t[i - 1]), np.abs(t[i] - times))
+            valid = (times >= t[0] - gap) & (times <= t[-1] + gap) & (nearest <= gap)
+            result[valid, k] = values[valid]
+        return result
+
+    def save(self, path):
+        """保存为 npz：每个轴 time_<axis>、position_<axis>"""
+        arrays = {}
+        for k, axis in enumerate(self.axes):
+            arrays[f'time_{axis}'] = np.array(self.times[k])
+            arrays[f'position_{axis}'] = np.array(self.positions[k], dtype=np.float64)
+        np.savez(path, **arrays)
+
+
+class FrameTimes:
+    """
+    记录每帧的帧信息（camera.frame_info），换算为主机时钟下的曝光时刻。
+
+    有相机时间戳时，用 clock_sync.ClockSync 把相机时钟换算到主机时钟：给出主动采样相机时钟的 clock 时，
+    换算结果即为时间戳对应的主机时刻；否则用各帧（相机时间戳, 主机接收时间）作为被动样本拟合下包络
+    （接收时间 = 曝光时刻 + 传输延迟，延迟最小的帧最接近真实关系），换算结果含最短传输延迟。
+    没有相机时间戳时直接使用主机接收时间。time_offset 为时间戳到曝光中点的固定偏移（s），
+    相机时间戳通常为曝光开始，取 +曝光时间/2（被动拟合时还应减去读出传输时间）；
+    只有接收时间时取 -(曝光时间/2 + 读出传输时间)。
+    """
+
+    def __init__(self, time_offset=0.0, clock=None):
+        """
+        参数:
+            time_offset: 时间戳到曝光中点的偏移（s）
+            clock: 主动采样相机时钟的 ClockSync（见 clock_sync.ClockSyncService.add_camera），
+                None 或没有主动样本时由帧时间戳被动拟合
+        """
+        self.time_offset = time_offset
+        self.clock = clock
+        self.indices = []
+        self.frame_ids = []
+        self.timestamps = []
+        self.host_times = []
+
+    def add(self, index, info):
+        self.indices.append(index)
+        self.frame_ids.append(np.nan if info['frame_id'] is None else info['frame_id'])
+        self.timestamps.append(np.nan if info['timestamp'] is None else info['timestamp'])
+        self.host_times.append(info['host_time'])
+
+    def __len__(self):
+        return len(self.indices)
+
+    def clock_sync(self):
+        """
+        相机时钟到主机时钟的 ClockSync：clock 有主动样本时使用 clock，否则由帧时间戳被动拟合；
+        相机时间戳少于2个时返回 None
+        """
+        if self.clock is not None and np.any(np.isfinite(self.clock.round_trips)) and len(self.clock) >= 2:
+            return self.clock
+        timestamps = np.array(self.timestamps, dtype=np.float64)
+        valid = np.isfinite(timestamps)
+        if np.count_nonzero(valid) < 2:
+            return None
+        clock = ClockSync(name='camera')
+        for timestamp, host_time in zip(timestamps[valid], np.array(self.host_times)[valid]):
+            clock.add(timestamp, host_time)
+        return clock
+
+    def clock_fit(self):
+        """
+        相机时钟到主机时钟的线性关系 (斜率, 截距)，相机时间戳少于2个时返回 None
+        """
+        clock = self.clock_sync()
+        return None if clock is None else clock.fit()
+
+    def exposure_times(self):
+        """
+        每帧曝光中点的主机时间（perf_counter，s），顺序与 indices 相同
+        """
+        timestamps = np.array(self.timestamps, dtype=np.float64)
+        times = np.array(self.host_times, dtype=np.float64)
+        clock = self.clock_sync()
+        if clock is not None:
+            valid = np.isfinite(timestamps)
+            times[valid] = clock.to_host(timestamps[valid])
+        return times + self.time_offset
+
+    def latencies(self):
+        """每帧从曝光中点到主机收到该帧的时间（s），用于统计读出和传输延迟"""
+        return np.array(self.host_times, dtype=np.float64) - self.exposure_times()
+
+    def save(self, path):
+        np.savez(path, index=np.array(self.indices), frame_id=np.array(self.frame_ids),
+                 timestamp=np.array(self.timestamps), host_time=np.array(self.host_times),
+                 exposure_time=self.exposure_times())
@@ -0,0 +1,205 @@
+import os
+import numpy as np
+
+
+class PVTTrajectory:
+    """
+    位置-速度-时间（PVT）轨迹：由若干元素组成，每个元素给出持续时间、各轴的相对位移和结束时的速度，
+    元素之间按三次多项式插值（与 XPS 的 MultipleAxesPVT 相同），起点和终点速度为0。
+    整条轨迹由控制器连续执行，换行时不停止。
+    """
+
+    def __init__(self, start, durations, displacements, velocities, lines=None):
+        """
+        参数:
+            start: 起点 (x, y)（mm），执行前位移台应停在起点
+            durations: 各元素的持续时间（s）
+            displacements: (n, 轴数) 各元素的相对位移（mm）
+            velocities: (n, 轴数) 各元素结束时的速度（mm/s）
+            lines: 可选，扫描行（匀速段）对应的元素序号
+        """
+        self.start = np.asarray(start, dtype=np.float64)
+        self.durations = np.asarray(durations, dtype=np.float64)
+        self.displacements = np.asarray(displacements, dtype=np.float64).reshape(len(self.durations), -1)
+        self.velocities = np.asarray(velocities, dtype=np.float64).reshape(len(self.durations), -1)
+        self.lines = [] if lines is None else list(lines)
+        if np.any(self.durations <= 0):
+            raise ValueError('PVT 元素的持续时间必须大于0')
+
+    @classmethod
+    def from_plan(cls, plan):
+        """
+        由 scan_planner.FlyScanPlan 生成连续的蛇形轨迹：加速段、各行匀速段、行末掉头（X减速反向的同时Y移到下一行）、
+        减速段。掉头时X超出行末的距离为 v² / (2a)，与规划的加速余量一致
+        """
+        v, a = plan.velocity, plan.acceleration
+        direction = 1.0 if plan.xrange[1] >= plan.xrange[0] else -1.0
+        accel_distance = v ** 2 / (2 * a)
+        settle_distance = v * plan.settle_time
+        line_length = abs(plan.xrange[1] - plan.xrange[0]) + 2 * settle_distance
+        # 掉头时间：X按加速度 a 减速反向；Y为三次曲线，峰值加速度 6 × dy / T² 也不超过 a
+        turn_time = max(2 * v / a, np.sqrt(6 * abs(plan.line_spacing) / a))
+
+        durations, displacements, velocities, lines = [v / a], [(direction * accel_distance, 0.0)], \
+            [(direction * v, 0.0)], []
+        for i in range(plan.n_lines):
+            sign = direction if i % 2 == 0 else -direction
+            lines.append(len(durations))
+            durations.append(line_length / v)
+            displacements.append((sign * line_length, 0.0))
+            velocities.append((sign * v, 0.0))
+            if i < plan.n_lines - 1:
+                durations.append(turn_time)
+                displacements.append((0.0, plan.line_spacing))
+                velocities.append((-sign * v, 0.0))
+        sign = direction if plan.n_lines % 2 == 1 else -direction
+        durations.append(v / a)
+        displacements.append((sign * accel_distance, 0.0))
+        velocities.append((0.0, 0.0))
+        start = (plan.xrange[0] - direction * (accel_distance + settle_distance), plan.yrange[0])
+        return cls(start, durations, displacements, velocities, lines)
+
+    @classmethod
+    def from_samples(cls, times, positions, velocities, lines=None):
+        """由按时间排列的采样点（时间、位置、速度）生成轨迹，第一个和最后一个点的速度应为0"""
+        times = np.asarray(times, dtype=np.float64)
+        positions = np.asarray(positions, dtype=np.float64)
+        velocities = np.asarray(velocities, dtype=np.float64)
+        return cls(positions[0], np.diff(times), np.diff(positions, axis=0), velocities[1:], lines)
+
+    @classmethod
+    def from_path(cls, path, velocity, acceleration, sample_time=0.01, max_turn=0.1):
+        """
+        沿给定路径（密集的折线）以不超过 velocity 的速度运动，从静止开始、到静止结束。
+        速度曲线满足加速度限制：法向加速度 v²κ 和切向加速度各不超过 acceleration / √2，
+        合加速度（因而每个轴的加速度）不超过 acceleration；曲率大处（如螺旋线中心）自动减速。
+        之后按 sample_time 的时间间隔取点作为 PVT 元素，曲率大处缩短间隔，使每个元素内切向转过的角度
+        不超过 max_turn，三次插值不会偏离路径
+
+        参数:
+            path: (n, 2) 路径点，相邻点间距应远小于 velocity × sample_time
+            velocity: 最大线速度（mm/s）
+            acceleration: 最大加速度（mm/s²）
+            sample_time: PVT 元素的时间间隔（s）
+            max_turn: 每个元素内切向转过的最大角度（rad）
+        """
+        path = np.asarray(path, dtype=np.float64)
+        # 去掉重合的点
+        keep = np.concatenate([[True], np.any(np.diff(path, axis=0) != 0, axis=1)])
+        path = path[keep]
+        ds = np.linalg.norm(np.diff(path, axis=0), axis=1)
+        s = np.concatenate([[0.0], np.cumsum(ds)])
+        d1 = np.gradient(path, s, axis=0)
+        d2 = np.gradient(d1, s, axis=0)
+        speed = np.linalg.norm(d1, axis=1)
+        curvature = np.abs(d1[:, 0] * d2[:, 1] - d1[:, 1] * d2[:, 0]) / np.maximum(speed, 1e-12) ** 3
+
+        limit = acceleration / np.sqrt(2)
+        v = np.minimum(velocity, np.sqrt(limit / np.maximum(curvature, 1e-12)))
+        v[0] = v[-1] = 0.0
+        # 前向、后向两遍限制切向加速度
+        for i in range(1, len(v)):
+            v[i] = min(v[i], np.sqrt(v[i - 1] ** 2 + 2 * limit * ds[i - 1]))
+        for i in range(len(v) - 2, -1, -1):
+            v[i] = min(v[i], np.sqrt(v[i + 1] ** 2 + 2 * limit * ds[i]))
+        # 相邻点之间为匀加速运动
+        dt = 2 * ds / (v[:-1] + v[1:])
+        t = np.concatenate([[0.0], np.cumsum(dt)])
+
+        # 取点的“相位”：时间和切向转角各占一份，每增加1取一个点
+        phase = t / sample_time + np.concatenate([[0.0], np.cumsum((curvature[:-1] + curvature[1:]) / 2 * ds)]) / max_turn
+        n = max(int(np.ceil(phase[-1])), 1)
+        times = np.interp(np.linspace(0, phase[-1], n + 1), phase, t)
+        i = np.clip(np.searchsorted(t, times, side='right') - 1, 0, len(dt) - 1)
+        tau = times - t[i]
+        rate = (v[i + 1] - v[i]) / dt[i]
+        si = np.minimum(s[i] + v[i] * tau + rate * tau ** 2 / 2, s[-1])
+        vi = v[i] + rate * tau
+        positions = np.column_stack([np.interp(si, s, path[:, k]) for k in range(path.shape[1])])
+        tangent = np.column_stack([np.interp(si, s, d1[:, k]) for k in range(path.shape[1])])
+        tangent /= np.maximum(np.linalg.norm(tangent, axis=1, keepdims=True), 1e-12)
+        velocities = tangent * vi[:, None]
+        velocities[0] = velocities[-1] = 0.0
+        return cls.from_samples(times, positions, velocities)
+
+    def __len__(self):
+        return len(self.durations)
+
+    @property
+    def duration(self):
+        return float(self.durations.sum())
+
+    @property
+    def end(self):
+        return self.start + self.displacements.sum(axis=0)
+
+    def points(self):
+        """
+        各元素端点的位置和速度（含起点）
+
+        返回:
+            (位置, 速度)，均为 (n + 1, 轴数)
+        """
+        positions = self.start + np.vstack([np.zeros(self.start.size), np.cumsum(self.displacements, axis=0)])
+        velocities = np.vstack([np.zeros(self.start.size), self.velocities])
+        return positions, velocities
+
+    def element_at(self, times):
+        """times（相对轨迹开始，s）所在的元素序号"""
+        ends = np.cumsum(self.durations)
+        return np.minimum(np.searchsorted(ends, times, side='right'), len(self) - 1)
+
+    def evaluate(self, times):
+        """
+        按三次 Hermite 插值计算 times（相对轨迹开始，s）时刻的位置和速度
+
+        返回:
+            (位置, 速度)，均为 (len(times), 轴数)
+        """
+        times = np.clip(np.atleast_1d(np.asarray(times, dtype=np.float64)), 0, self.duration)
+        positions, velocities = self.points()
+        k = self.element_at(times)
+        begin = np.concatenate([[0.0], np.cumsum(self.durations)])[k]
+        T = self.durations[k][:, None]
+        s = ((times - begin)[:, None] / T)
+        p0, p1 = positions[k], positions[k + 1]
+        v0, v1 = velocities[k], velocities[k + 1]
+        h00, h10, h01, h11 = 2 * s ** 3 - 3 * s ** 2 + 1, s ** 3 - 2 * s ** 2 + s, -2 * s ** 3 + 3 * s ** 2, s ** 3 - s ** 2
+        position = h00 * p0 + h10 * T * v0 + h01 * p1 + h11 * T * v1
+        d00, d10, d01, d11 = 6 * s ** 2 - 6 * s, 3 * s ** 2 - 4 * s + 1, -6 * s ** 2 + 6 * s, 3 * s ** 2 - 2 * s
+        velocity = (d00 * p0 + d01 * p1) / T + d10 * v0 + d11 * v1
+        return position, velocity
+
+    def peak_values(self, dt=1e-3):
+        """
+        各轴的位置范围、最大速度和最大加速度，用于上传前检查行程和位移台限制
+
+        返回:
+            dict: min, max, velocity, acceleration（均为每轴一个值）
+        """
+        times = np.arange(0, self.duration + dt, dt)
+        position, velocity = self.evaluate(times)
+        acceleration = np.diff(velocity, axis=0) / dt
+        return {'min': position.min(axis=0), 'max': position.max(axis=0),
+                'velocity': np.abs(velocity).max(axis=0), 'acceleration': np.abs(acceleration).max(axis=0)}
+
+    def line_of_element(self, element):
+        """元素序号所在的扫描行（从0开始，行之间的掉头计入前一行）"""
+        return max(int(np.searchsorted(self.lines, element, side='right')) - 1, 0)
+
+    def text(self):
+        """XPS PVT 轨迹文件：每行为 时间, X位移, X速度, Y位移, Y速度"""
+        lines = []
+        for dt, displacement, velocity in zip(self.durations, self.displacements, self.velocities):
+            values = [f'{dt:.6f}']
+            for dx, vx in zip(displacement, velocity):
+                values += [f'{dx:.6f}', f'{vx:.6f}']
+            lines.append(', '.join(values))
+        return '\n'.join(lines) + '\n'
+
+    def save(self, path):
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        with open(path, 'w') as f:
+            f.write(self.text())
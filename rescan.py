@@ -0,0 +1,81 @@
+import numpy as np
+
+
+def path_length(abs_x, abs_y, order, start=(0.0, 0.0)):
+    """从 start 出发依次经过 order 中各点的总路程（mm）"""
+    x = np.concatenate(([start[0]], np.asarray(abs_x, dtype=float)[order]))
+    y = np.concatenate(([start[1]], np.asarray(abs_y, dtype=float)[order]))
+    return float(np.hypot(np.diff(x), np.diff(y)).sum())
+
+
+def plan_revisit(abs_x, abs_y, indices, start=(0.0, 0.0), max_passes=20):
+    """
+    为需要重扫的点规划较短的访问顺序：先用最近邻法构造路径，再用2-opt（翻转子路径）改进。
+    起点固定，终点不回到起点。
+
+    参数:
+        abs_x, abs_y: 扫描点绝对坐标（mm，Scanner.abs_x/abs_y）
+        indices: 需要重扫的扫描点序号
+        start: 当前位置（与 abs_x/abs_y 同一坐标系）
+        max_passes: 2-opt 最大迭代轮数
+
+    返回:
+        按访问顺序排列的扫描点序号列表
+    """
+    indices = list(dict.fromkeys(int(i) for i in indices))
+    if len(indices) <= 1:
+        return indices
+    px = np.asarray(abs_x, dtype=float)[indices]
+    py = np.asarray(abs_y, dtype=float)[indices]
+
+    # 最近邻
+    remaining = np.ones(len(indices), dtype=bool)
+    route = []
+    cx, cy = start
+    for _ in range(len(indices)):
+        d = np.hypot(px - cx, py - cy)
+        d[~remaining] = np.inf
+        k = int(np.argmin(d))
+        route.append(k)
+        remaining[k] = False
+        cx, cy = px[k], py[k]
+
+    # 2-opt：节点0为起点
+    x = np.concatenate(([start[0]], px[route]))
+    y = np.concatenate(([start[1]], py[route]))
+    route = np.array([-1] + route)
+    n = len(route)
+
+    def dist(a, b):
+        return np.hypot(x[a] - x[b], y[a] - y[b])
+
+    for _ in range(max_passes):
+        improved = False
+        for i in range(1, n - 1):
+            for j in range(i + 1, n):
+                # 翻转 route[i:j+1]，末端之后没有点时只比较一条边
+                before = dist(i - 1, i) + (dist(j, j + 1) if j + 1 < n else 0.0)
+                after = dist(i - 1, j) + (dist(i, j + 1) if j + 1 < n else 0.0)
+                if after < before - 1e-12:
+                    route[i:j + 1] = route[i:j + 1][::-1].copy()
+                    x[i:j + 1] = x[i:j + 1][::-1].copy()
+                    y[i:j + 1] = y[i:j + 1][::-1].copy()
+                    improved = True
+        if not improved:
+            break
+    return [indices[k] for k in route[1:]]
+
+
+def revisit_moves(abs_x, abs_y, order, start=(0.0, 0.0)):
+    """
+    把访问顺序转换为相对移动量，格式与 Scanner.x/y 相同，可直接用于 motion.move_by
+
+    返回:
+        (dx, dy, back)，dx/dy 为到达各点的相对移动量列表，back 为最后回到 start 的移动量
+    """
+    x = np.concatenate(([start[0]], np.asarray(abs_x, dtype=float)[order]))
+    y = np.concatenate(([start[1]], np.asarray(abs_y, dtype=float)[order]))
+    dx = np.diff(x).tolist()
+    dy = np.diff(y).tolist()
+    back = (start[0] - x[-1], start[1] - y[-1])
+    return dx, dy, back
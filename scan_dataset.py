@@ -0,0 +1,383 @@
+import os
+import time
+import numpy as np
+
+
+class GridIndex:
+    """
+    扫描位置的均匀网格索引。点按所在网格排序存放，查询时只检查覆盖查询区域的网格，
+    每次查询的代价与命中点数相当，而不是与总点数相当。
+    """
+
+    def __init__(self, x, y, cell_size=None):
+        """
+        参数:
+            x, y: 点坐标
+            cell_size: 网格边长，默认按平均点间距估计
+        """
+        self.x = np.asarray(x, dtype=float)
+        self.y = np.asarray(y, dtype=float)
+        n = len(self.x)
+        if n == 0:
+            raise ValueError('坐标数据为空')
+        self.x0, self.y0 = self.x.min(), self.y.min()
+        width = max(self.x.max() - self.x0, self.y.max() - self.y0)
+        if cell_size is None:
+            cell_size = width / np.sqrt(n) if width > 0 else 1.0
+        self.cell_size = cell_size
+        self.nx = int((self.x.max() - self.x0) // cell_size) + 1
+        self.ny = int((self.y.max() - self.y0) // cell_size) + 1
+
+        cell = self._cell_id(self._ix(self.x), self._iy(self.y))
+        self.order = np.argsort(cell, kind='stable')
+        # 每个网格在 order 中的起止位置
+        self.starts = np.searchsorted(cell[self.order], np.arange(self.nx * self.ny + 1))
+
+    def _ix(self, x):
+        return np.clip(((np.asarray(x) - self.x0) // self.cell_size).astype(int), 0, self.nx - 1)
+
+    def _iy(self, y):
+        return np.clip(((np.asarray(y) - self.y0) // self.cell_size).astype(int), 0, self.ny - 1)
+
+    def _cell_id(self, ix, iy):
+        return iy * self.nx + ix
+
+    def _candidates(self, x_min, x_max, y_min, y_max):
+        if x_max < self.x0 or y_max < self.y0 or \
+                x_min > self.x0 + self.nx * self.cell_size or y_min > self.y0 + self.ny * self.cell_size:
+            return np.empty(0, dtype=int)
+        ix0, ix1 = self._ix(x_min), self._ix(x_max)
+        iy0, iy1 = self._iy(y_min), self._iy(y_max)
+        parts = []
+        for iy in range(iy0, iy1 + 1):
+            start = self.starts[self._cell_id(ix0, iy)]
+            stop = self.starts[self._cell_id(ix1, iy) + 1]
+            parts.append(self.order[start:stop])
+        return np.concatenate(parts) if parts else np.empty(0, dtype=int)
+
+    def query_radius(self, x, y, r):
+        """返回距 (x, y) 不超过 r 的点序号（升序）"""
+        idx = self._candidates(x - r, x + r, y - r, y + r)
+        keep = (self.x[idx] - x) ** 2 + (self.y[idx] - y) ** 2 <= r * r
+        return np.sort(idx[keep])
+
+    def query_rect(self, x_min, x_max, y_min, y_max):
+        """返回矩形区域内的点序号（升序）"""
+        idx = self._candidates(x_min, x_max, y_min, y_max)
+        xs, ys = self.x[idx], self.y[idx]
+        keep = (xs >= x_min) & (xs <= x_max) & (ys >= y_min) & (ys <= y_max)
+        return np.sort(idx[keep])
+
+
+class SparseFrames:
+    """
+    SparseHDF5Sink 写出的稀疏数据，按帧解码，接口与 h5py 数据集相同（shape/dtype/索引/refresh）
+    """
+
+    def __init__(self, group):
+        self.group = group
+        self.indptr = group['indptr']
+        self.indices = group['indices']
+        self.values = group['values']
+        self.frame_index = group['frame_index']
+        self.frame_shape = tuple(int(n) for n in group.attrs['frame_shape'])
+        self.threshold = group.attrs['threshold']
+        self.dtype = self.values.dtype
+        self._build_rows()
+
+    def _build_rows(self):
+        # 扫描点序号 -> 行号，重扫的点取最后一行
+        frame_index = self.frame_index[()]
+        n_rows = min(len(frame_index), self.indptr.shape[0] - 1)
+        frame_index = frame_index[:n_rows]
+        n = int(frame_index.max()) + 1 if n_rows else 0
+        self.rows = np.full(n, -1, dtype=np.int64)
+        self.rows[frame_index] = np.arange(n_rows)
+
+    @property
+    def shape(self):
+        return (len(self.rows),) + self.frame_shape
+
+    def refresh(self):
+        for dataset in (self.frame_index, self.indptr, self.indices, self.values):
+            dataset.refresh()
+        self._build_rows()
+
+    def _read(self, index, out=None):
+        from frame_sink import decode_sparse
+        row = self.rows[index]
+        if row < 0:
+            raise IndexError(f'第 {index} 帧没有数据')
+        start, stop = self.indptr[row:row + 2]
+        return decode_sparse(self.indices[start:stop], self.values[start:stop], self.frame_shape,
+                             dtype=self.dtype, out=out)
+
+    def __getitem__(self, index):
+        if np.isscalar(index):
+            return self._read(int(index))
+        indices = np.arange(len(self.rows))[index]
+        out = np.empty((len(indices),) + self.frame_shape, dtype=self.dtype)
+        for i, n in enumerate(indices):
+            self._read(int(n), out=out[i])
+        return out
+
+
+class ScanDataset:
+    """
+    扫描数据读取器，支持本程序写出的 dps.h5 / CXI / 稀疏HDF5 / dps.npy 文件。
+    帧数据按需读取（HDF5按单帧分块读取，npy使用内存映射），不会把整个数据集载入内存。
+    位置单位统一为mm，与Scanner一致。
+
+    读取正在写入的SWMR文件时使用 swmr=True，len() 为写入端公布的有效帧数，
+    调用 refresh() 或 wait_for_frames() 获取新写入的帧。
+    """
+
+    def __init__(self, path, positions=None, swmr=False, use_rescans=True):
+        """
+        参数:
+            path: 数据文件路径（.h5 / .cxi / .npy），或包含 dps.h5 / data.cxi / dps.npy 的文件夹
+            positions: 可选，(abs_x, abs_y) 或 Scanner.save_to_npy 保存的文件路径；
+                       CXI文件自带位置，可不提供
+            swmr: 以SWMR读模式打开HDF5文件
+            use_rescans: 读取帧时用重扫追加的替换帧代替原帧
+        """
+        self.path = self._find_file(path)
+        self.file = None
+        self.dark = None
+        self.measured_positions = None
+        self.frame_times = None  # 每帧曝光时刻（s），飞扫时记录
+        self.frames_valid = None
+        self._n_valid = None
+        self.quality = None  # (N, len(QUALITY_FIELDS)) 质量指标
+        self.flags = None    # (N,) 标记位，见 frame_metrics
+        self.rescans = None  # (K, len(RESCAN_FIELDS)) 重扫记录
+        self.replacement = {}  # 原扫描点序号 -> 替换帧位置
+        self.use_rescans = use_rescans
+        ext = os.path.splitext(self.path)[1]
+        if ext == '.npy':
+            self.frames = np.load(self.path, mmap_mode='r')
+            dark_file = os.path.join(os.path.dirname(self.path), 'dark.npy')
+            if os.path.exists(dark_file):
+                self.dark = np.load(dark_file)
+            self._load_quality()
+            rescan_file = os.path.join(os.path.dirname(self.path), 'rescan.npz')
+            if os.path.exists(rescan_file):
+                self.rescans = np.load(rescan_file)['rescans']
+            file_positions = None
+        else:
+            import h5py
+            self.file = h5py.File(self.path, 'r', libver='latest', swmr=True) if swmr else h5py.File(self.path, 'r')
+            file_positions = self._open_hdf5()
+        self._update_replacement()
+
+        if positions is None:
+            positions = file_positions
+        elif isinstance(positions, str):
+            from Scanner import Scanner
+            scanner = Scanner.load_from_npy(positions)
+            positions = (scanner.abs_x, scanner.abs_y)
+        if positions is not None:
+            n = self.n_points
+            self.x = np.asarray(positions[0], dtype=float)[:n]
+            self.y = np.asarray(positions[1], dtype=float)[:n]
+            self.index = GridIndex(self.x, self.y)
+        else:
+            self.x = self.y = self.index = None
+
+    @staticmethod
+    def _find_file(path):
+        if not os.path.isdir(path):
+            return path
+        for name in ('data.cxi', 'dps.h5', 'dps.npy'):
+            if os.path.exists(os.path.join(path, name)):
+                return os.path.join(path, name)
+        raise FileNotFoundError(f'{path} 中没有找到扫描数据')
+
+    def _open_hdf5(self):
+        f = self.file
+        if 'quality' in f:
+            self.quality = f['quality']
+            self.flags = f['flags']
+        if 'rescan' in f:
+            self.rescans = f['rescan']
+        if 'frames_valid' in f:
+            self.frames_valid = f['frames_valid']
+            self._n_valid = int(self.frames_valid[0])
+        if 'entry_1' in f:
+            detector = f['entry_1/instrument_1/detector_1']
+            self.frames = detector['data']
+            if 'data_dark' in detector:
+                self.dark = detector['data_dark'][()]
+            geometry = f['entry_1/sample_1/geometry_1']
+            if 'translation_measured' in geometry:
+                self.measured_positions = geometry['translation_measured'][:, :2] * 1e3
+            translation = geometry['translation'][()] * 1e3
+            return translation[:, 0], translation[:, 1]
+        self.frames = SparseFrames(f['sparse']) if 'sparse' in f else f['dps']
+        if 'dark' in f:
+            self.dark = f['dark'][()]
+        if 'frame_time' in f:
+            self.frame_times = f['frame_time'][()]
+        if 'position' in f:
+            self.measured_positions = f['position'][()]
+            # 飞扫没有名义位置，每帧的位置都已记录时直接作为扫描位置
+            if len(self.measured_positions) and np.all(np.isfinite(self.measured_positions)):
+                return self.measured_positions[:, 0], self.measured_positions[:, 1]
+        return None
+
+    def _load_quality(self):
+        quality_file = os.path.join(os.path.dirname(self.path), 'quality.npz')
+        if not os.path.exists(quality_file):
+            return
+        data = np.load(quality_file)
+        n = self.frames.shape[0]
+        self.quality = np.full((n, data['metrics'].shape[1]), np.nan)
+        self.flags = np.zeros(n, dtype=np.uint8)
+        index = data['index'][data['index'] < n]
+        self.quality[index] = data['metrics'][:len(index)]
+        self.flags[index] = data['flags'][:len(index)]
+
+    def _update_replacement(self):
+        self.replacement = {}
+        if self.rescans is None:
+            return
+        for index, slot in np.asarray(self.rescans[:, :2], dtype=int).tolist():
+            if slot != index:
+                self.replacement[index] = slot
+            else:
+                self.replacement.pop(index, None)
+
+    @property
+    def n_points(self):
+        """原扫描的点数，不包括重扫追加在末尾的帧"""
+        n = self.frames.shape[0]
+        if self.rescans is not None and len(self.rescans):
+            rows = np.asarray(self.rescans[:, :2], dtype=int)
+            appended = rows[rows[:, 1] != rows[:, 0], 1]
+            if len(appended):
+                n = min(n, int(appended.min()))
+        return n
+
+    def resolve(self, indices):
+        """把扫描点序号换成实际读取的帧位置（有重扫替换帧时指向替换帧）"""
+        if not self.use_rescans or not self.replacement:
+            return indices
+        if np.isscalar(indices):
+            return self.replacement.get(int(indices), indices)
+        return np.array([self.replacement.get(int(i), i) for i in indices], dtype=int)
+
+    def flagged_indices(self, mask=0xFF):
+        """返回标记位与 mask 有交集的扫描点序号（已被重扫替换的点按替换帧的标记位判断）"""
+        if self.flags is None:
+            return np.empty(0, dtype=int)
+        flags = np.asarray(self.flags[:len(self)])
+        points = np.arange(min(self.n_points, len(flags)))
+        slots = np.asarray(self.resolve(points))
+        # 替换帧尚未写入（SWMR读取时）的点仍按原帧判断
+        slots = np.where(slots < len(flags), slots, points)
+        return np.flatnonzero(flags[slots] & mask)
+
+    def __len__(self):
+        if self._n_valid is not None:
+            return min(self._n_valid, self.frames.shape[0])
+        return self.frames.shape[0]
+
+    def refresh(self):
+        """
+        刷新SWMR文件的元数据，返回当前有效帧数。先读帧数再刷新数据集，保证帧数范围内的数据已可读
+        """
+        if self.frames_valid is not None:
+            self.frames_valid.refresh()
+            self._n_valid = int(self.frames_valid[0])
+            self.frames.refresh()
+            if self.quality is not None:
+                self.quality.refresh()
+                self.flags.refresh()
+            if self.rescans is not None:
+                self.rescans.refresh()
+                self._update_replacement()
+        return len(self)
+
+    def wait_for_frames(self, n, timeout=None, poll_interval=0.1):
+        """
+        轮询等待至少 n 帧可读
+
+        返回:
+            当前有效帧数（超时时可能小于 n）
+        """
+        start = time.time()
+        while self.refresh() < n:
+            if timeout is not None and time.time() - start > timeout:
+                break
+            time.sleep(poll_interval)
+        return len(self)
+
+    @property
+    def frame_shape(self):
+        return self.frames.shape[1:]
+
+    def __getitem__(self, index):
+        """按扫描序号读取一帧或多帧"""
+        if np.isscalar(index):
+            return self.frames[self.resolve(index)]
+        return self.get_frames(index)
+
+    def get_frames(self, indices):
+        """
+        读取多帧，只读取需要的分块
+
+        参数:
+            indices: 扫描序号列表
+
+        返回:
+            (len(indices), H, W) 数组，顺序与 indices 相同
+        """
+        indices = np.asarray(self.resolve(indices), dtype=int)
+        if len(indices) == 0:
+            return np.empty((0,) + self.frame_shape, dtype=self.frames.dtype)
+        # h5py 的花式索引要求递增且不重复
+        unique, inverse = np.unique(indices, return_inverse=True)
+        return self.frames[unique][inverse] if self.file is not None else self.frames[indices]
+
+    def _require_index(self):
+        if self.index is None:
+            raise ValueError('没有扫描位置信息，请提供 positions')
+
+    def query_radius(self, x, y, r):
+        """返回距 (x, y) 不超过 r（mm）的扫描点序号"""
+        self._require_index()
+        return self.index.query_radius(x, y, r)
+
+    def query_rect(self, x_min, x_max, y_min, y_max):
+        """返回矩形区域内的扫描点序号"""
+        self._require_index()
+        return self.index.query_rect(x_min, x_max, y_min, y_max)
+
+    def frames_in_radius(self, x, y, r):
+        """返回 (序号, 帧数据)"""
+        idx = self.query_radius(x, y, r)
+        return idx, self.get_frames(idx)
+
+    def frames_in_rect(self, x_min, x_max, y_min, y_max):
+        """返回 (序号, 帧数据)"""
+        idx = self.query_rect(x_min, x_max, y_min, y_max)
+        return idx, self.get_frames(idx)
+
+    def close(self):
+        if self.file is not None:
+            self.file.close()
+            self.file = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.close()
+
+
+if __name__ == '__main__':
+    with ScanDataset('data') as ds:
+        print(len(ds), ds.frame_shape)
+        if ds.index is not None:
+            idx, frames = ds.frames_in_radius(0, 0, 0.5)
+            print(idx, frames.shape)
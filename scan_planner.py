@@ -0,0 +1,152 @@
+import math
+import numpy as np
+
+_LIMIT_NAMES = {'overlap': '重叠', 'blur': '运动模糊', 'stage': '位移台最大速度'}
+
+
+class FlyScanPlan:
+    """
+    飞扫规划：由扫描区域、探针尺寸、目标重叠率、允许的运动模糊和相机帧周期，计算行间距、X轴速度、
+    加速段余量，给出蛇形路径和预计帧数。
+
+    速度取以下限制中最小的一个：
+        重叠：相邻两帧间距 v × 帧周期 不超过 探针尺寸 × (1 - 重叠率)
+        模糊：曝光期间移动距离 v × 曝光时间 不超过允许的模糊
+        位移台最大速度
+    每行两端各延长 v² / (2a) + v × 稳定时间，使扫描区域内为匀速运动。
+    扫描区域指探针中心的范围，单位均为 mm、s。
+    """
+
+    def __init__(self, xrange, yrange, probe_size, overlap=0.7, max_blur=None, frame_period=0.01, exposure=None,
+                 max_velocity=None, acceleration=100.0, settle_time=0.0):
+        """
+        参数:
+            xrange: X方向扫描范围 (起点, 终点)，行方向
+            yrange: Y方向扫描范围 (起点, 终点)
+            probe_size: 探针（光斑）直径
+            overlap: 相邻探针位置的目标线重叠率，行内和行间相同
+            max_blur: 曝光期间允许的最大移动距离，None 表示不限制
+            frame_period: 相机帧周期
+            exposure: 曝光时间，None 时取帧周期
+            max_velocity: 位移台最大速度，None 表示不限制
+            acceleration: 位移台加速度（mm/s²）
+            settle_time: 加速结束后到进入扫描区域的稳定时间
+        """
+        self.xrange = (float(xrange[0]), float(xrange[1]))
+        self.yrange = (float(yrange[0]), float(yrange[1]))
+        self.probe_size = probe_size
+        self.overlap = overlap
+        self.max_blur = max_blur
+        self.frame_period = frame_period
+        self.exposure = frame_period if exposure is None else exposure
+        self.max_velocity = max_velocity
+        self.acceleration = acceleration
+        self.settle_time = settle_time
+        self.plan()
+
+    @classmethod
+    def from_camera(cls, camera, xrange, yrange, probe_size, exposure=None, **kwargs):
+        """帧周期从相机读取（Camera.get_frame_period）"""
+        period = camera.get_frame_period()
+        if not period or period <= 0:
+            raise ValueError('无法读取相机帧周期')
+        return cls(xrange, yrange, probe_size, frame_period=period, exposure=exposure, **kwargs)
+
+    def plan(self):
+        if not 0 <= self.overlap < 1:
+            raise ValueError('重叠率应在 [0, 1) 内')
+        if self.exposure > self.frame_period:
+            print(f'曝光时间 {self.exposure * 1e3:.3f} ms 大于帧周期 {self.frame_period * 1e3:.3f} ms')
+        self.step = self.probe_size * (1 - self.overlap)
+
+        # 行间距：不超过 step，均分Y范围
+        height = abs(self.yrange[1] - self.yrange[0])
+        self.n_lines = int(math.ceil(height / self.step - 1e-9)) + 1 if height > 0 else 1
+        self.line_spacing = height / (self.n_lines - 1) if self.n_lines > 1 else self.step
+        if self.yrange[1] < self.yrange[0]:
+            self.line_spacing = -self.line_spacing
+
+        limits = {'overlap': self.step / self.frame_period}
+        if self.max_blur is not None and self.exposure > 0:
+            limits['blur'] = self.max_blur / self.exposure
+        if self.max_velocity is not None:
+            limits['stage'] = self.max_velocity
+        self.limited_by = min(limits, key=limits.get)
+        self.velocity = limits[self.limited_by]
+        self.frame_spacing = self.velocity * self.frame_period
+        self.blur = self.velocity * self.exposure
+
+        self.run_up = self.velocity ** 2 / (2 * self.acceleration) + self.velocity * self.settle_time
+        length = abs(self.xrange[1] - self.xrange[0])
+        travel = length + 2 * self.run_up
+        # 梯形速度曲线：匀速段 + 加速、减速各 v / a
+        self.line_time = travel / self.velocity + self.velocity / self.acceleration
+        self.frames_in_roi = self.n_lines * (int(math.floor(length / self.frame_spacing + 1e-9)) + 1)
+        # 整行运动期间（含加减速段）连续采集的帧数，用于预分配存储
+        self.frames_per_line = int(math.ceil(self.line_time / self.frame_period))
+        self.frame_count = self.n_lines * self.frames_per_line
+        # 换行按三角速度曲线估计
+        self.duration = self.n_lines * self.line_time + \
+            (self.n_lines - 1) * 2 * math.sqrt(abs(self.line_spacing) / self.acceleration)
+        return self
+
+    def trajectory(self):
+        """
+        蛇形路径的各行端点（含加速段余量），与 SoftTriggerFlyScan 的 x_pos、y_pos 相同：
+        先移动X到下一个点扫描一行，再移动Y到下一行
+
+        返回:
+            (n_lines + 1, 2) 数组，每行为 (x, y)
+        """
+        direction = 1 if self.xrange[1] >= self.xrange[0] else -1
+        ends = (self.xrange[0] - direction * self.run_up, self.xrange[1] + direction * self.run_up)
+        points = [(ends[0], self.yrange[0])]
+        for i in range(self.n_lines):
+            points.append((ends[(i + 1) % 2], self.yrange[0] + (i + 1) * self.line_spacing))
+        return np.array(points)
+
+    def probe_positions(self):
+        """
+        扫描区域内各帧的探针位置（按帧间距 frame_spacing 排列），用于检查覆盖
+
+        返回:
+            (frames_in_roi, 2) 数组
+        """
+        length = self.xrange[1] - self.xrange[0]
+        n = int(math.floor(abs(length) / self.frame_spacing + 1e-9)) + 1
+        x = self.xrange[0] + np.sign(length) * np.arange(n) * self.frame_spacing
+        positions = []
+        for i in range(self.n_lines):
+            y = self.yrange[0] + i * self.line_spacing
+            positions.extend((value, y) for value in (x if i % 2 == 0 else x[::-1]))
+        return np.array(positions).reshape(-1, 2)
+
+    def scan_params(self):
+        """SoftTriggerFlyScan / HardwareTriggerFlyScan 使用的 scan_params"""
+        direction = 1 if self.xrange[1] >= self.xrange[0] else -1
+        return {
+            'xrange': (self.xrange[0] - direction * self.run_up, self.xrange[1] + direction * self.run_up),
+            'y_ori': self.yrange[0],
+            'ystep': self.line_spacing,
+            'sampling_interval': self.frame_period,
+            'scan_num': self.n_lines,
+            'velocity': self.velocity,
+            'acceleration': self.acceleration,
+            'trigger_step': self.frame_spacing,
+            'trigger_margin': self.run_up,
+            'frame_count': self.frame_count
+        }
+
+    def summary(self):
+        return (f'{self.n_lines} 行，行间距 {abs(self.line_spacing) * 1e3:.1f} µm，'
+                f'速度 {self.velocity:.4f} mm/s（受{_LIMIT_NAMES[self.limited_by]}限制），'
+                f'帧间距 {self.frame_spacing * 1e3:.2f} µm，模糊 {self.blur * 1e3:.2f} µm，'
+                f'加速余量 {self.run_up * 1e3:.1f} µm，预计 {self.frame_count} 帧'
+                f'（扫描区域内 {self.frames_in_roi} 帧），约 {self.duration:.0f} s')
+
+
+if __name__ == '__main__':
+    plan = FlyScanPlan((10.5, 12.5), (11.2, 11.5), probe_size=0.02, overlap=0.7, max_blur=0.002,
+                       frame_period=0.01, exposure=0.0045, max_velocity=2.5, acceleration=10)
+    print(plan.summary())
+    print(plan.scan_params())
@@ -0,0 +1,356 @@
+import importlib.util
+import os
+import sys
+import threading
+import time
+from collections import deque
+import numpy as np
+from camera import Camera, frame_info
+from motion_controller import MotionController
+from position_compare import compare_positions
+from scan_planner import FlyScanPlan
+
+
+class VirtualTriggerLine:
+    """
+    虚拟触发线：SimulatedStage 的位置比较脉冲分发给连接在线上的 SimulatedCamera，
+    代替实际的 PCO → 相机触发输入接线，用于在没有硬件时测试触发飞扫。
+    """
+
+    def __init__(self):
+        self._receivers = []
+        self.count = 0
+
+    def connect(self, receiver):
+        """receiver(host_time) 在每个脉冲时调用"""
+        self._receivers.append(receiver)
+
+    def pulse(self, host_time=None):
+        host_time = time.perf_counter() if host_time is None else host_time
+        self.count += 1
+        for receiver in self._receivers:
+            receiver(host_time)
+
+
+class SimulatedStage(MotionController):
+    """
+    模拟位移台：匀速运动（没有加减速），move_by 阻塞到运动结束，运动过程中可以在其他线程读取位置。
+    开启位置比较后，经过脉冲位置时在 trigger_line 上产生脉冲，脉冲时刻按匀速运动插值。
+    """
+
+    def __init__(self, n_axes=2, velocity=1.0, trigger_line=None, dt=1e-3, latency=1e-3):
+        """
+        参数:
+            n_axes: 轴数
+            velocity: 各轴速度（mm/s）
+            trigger_line: VirtualTriggerLine，None 时位置比较不输出脉冲
+            dt: 运动过程中更新位置和检查脉冲的间隔（s）
+            latency: read_position 的通信延迟（s）
+        """
+        super().__init__()
+        self.velocity = [float(velocity)] * n_axes
+        self.trigger_line = trigger_line
+        self.dt = dt
+        self.latency = latency
+        self._position = [0.0] * n_axes
+        self._compare = [None] * n_axes
+        self._trajectories = {}
+        self._element = None
+        self._boot = time.perf_counter()
+        self._lock = threading.Lock()
+
+    def set_velocity(self, axis, velocity):
+        self.velocity[axis] = float(velocity)
+
+    def move_by(self, distance, axis, relative=True):
+        with self._lock:
+            start = self._position[axis]
+        target = start + distance if relative else float(distance)
+        length = abs(target - start)
+        if length == 0:
+            return
+        direction = 1.0 if target > start else -1.0
+        duration = length / self.velocity[axis]
+        pulses = self._pulses_between(axis, start, target)
+        t0 = time.perf_counter()
+        while True:
+            elapsed = min(time.perf_counter() - t0, duration)
+            position = start + direction * self.velocity[axis] * elapsed
+            with self._lock:
+                self._position[axis] = position
+            # 已经经过的脉冲位置依次输出，时刻按匀速插值
+            while pulses and (pulses[0] - position) * direction <= 1e-12:
+                pulse_position = pulses.popleft()
+                if self.trigger_line is not None:
+                    self.trigger_line.pulse(t0 + abs(pulse_position - start) / self.velocity[axis])
+            if elapsed >= duration:
+                break
+            time.sleep(self.dt)
+        with self._lock:
+            self._position[axis] = target
+
+    def _pulses_between(self, axis, start, target):
+        positions = self._compare[axis]
+        if positions is None:
+            return deque()
+        lower, upper = sorted((start, target))
+        inside = positions[(positions >= lower - 1e-12) & (positions <= upper + 1e-12)]
+        return deque(np.sort(inside) if target > start else np.sort(inside)[::-1])
+
+    def get_position(self, axis):
+        with self._lock:
+            return self._position[axis]
+
+    def read_position(self, axis):
+        time.sleep(self.latency)
+        return self.get_position(axis)
+
+    def read_clock(self):
+        """控制器时钟：创建以来的时间，读取有 latency 的通信延迟（请求和返回各一半）"""
+        time.sleep(self.latency / 2)
+        now = time.perf_counter() - self._boot
+        time.sleep(self.latency / 2)
+        return now
+
+    def enable_position_compare(self, axis, start, stop, step):
+        positions = compare_positions(start, stop, step)
+        self._compare[axis] = np.sort(positions)
+        return positions
+
+    def disable_position_compare(self, axis):
+        self._compare[axis] = None
+
+    def upload_trajectory(self, trajectory, filename='flyscan.trj'):
+        self._trajectories[filename] = trajectory
+        return True
+
+    def run_trajectory(self, filename='flyscan.trj'):
+        """按三次插值的轨迹更新各轴位置（位置比较在轨迹中不输出脉冲）"""
+        trajectory = self._trajectories[filename]
+        with self._lock:
+            origin = np.array(self._position[:trajectory.start.size])
+        t0 = time.perf_counter()
+        while True:
+            elapsed = min(time.perf_counter() - t0, trajectory.duration)
+            position, _ = trajectory.evaluate(elapsed)
+            with self._lock:
+                self._position[:origin.size] = list(origin + position[0] - trajectory.start)
+                self._element = int(trajectory.element_at(elapsed)) + 1
+            if elapsed >= trajectory.duration:
+                break
+            time.sleep(self.dt)
+        self._element = None
+
+    def trajectory_progress(self):
+        return self._element
+
+
+class SimulatedCamera(Camera):
+    """
+    模拟相机：图像为 dark + signal × 曝光时间 的泊松噪声（ADU），带帧计数和相机时间戳。
+    自由运行时按 frame_period 连续产生帧；外部触发时连接到 VirtualTriggerLine，每个脉冲产生一帧。
+    相机时钟 = (主机时间 + clock_offset) × (1 + clock_drift)，用于测试时钟换算。
+    """
+
+    exposure_step = 1e-6
+    ring_buffer = True
+
+    def __init__(self, shape=(256, 256), signal=2000.0, dark=100.0, frame_period=0.02, trigger_line=None,
+                 clock_offset=1000.0, clock_drift=2e-5, saturation=4095, seed=None):
+        """
+        参数:
+            shape: 图像尺寸
+            signal: 信号（ADU/s），标量或与 shape 相同的数组
+            dark: 偏置（ADU）
+            frame_period: 自由运行时的帧周期（s）
+            trigger_line: VirtualTriggerLine，外部触发时的触发源
+            saturation: 饱和值（ADU）
+        """
+        super().__init__()
+        self.shape = tuple(shape)
+        self.signal = signal
+        self.dark = dark
+        self.frame_period = frame_period
+        self.exposure = 0.01
+        self._exposures = [(-np.inf, self.exposure)]  # (改变的主机时间, 曝光时间)
+        self.saturation = saturation
+        self.clock_offset = clock_offset
+        self.clock_drift = clock_drift
+        self.external_trigger = False
+        self._rng = np.random.default_rng(seed)
+        self._buffer = deque(maxlen=256)
+        self._lock = threading.Lock()
+        self._frame_id = 0
+        self._t0 = None
+        self._id0 = 0
+        self._acquiring = False
+        if trigger_line is not None:
+            trigger_line.connect(self._on_trigger)
+
+    def set_ex_time(self, ex_time):
+        """采集过程中也可以改变，改变之前开始曝光的帧仍使用原来的曝光时间"""
+        self.exposure = float(ex_time)
+        self._exposures.append((time.perf_counter(), self.exposure))
+
+    def _exposure_at(self, host_time):
+        for changed_at, exposure in reversed(self._exposures):
+            if changed_at <= host_time:
+                return exposure
+        return self._exposures[0][1]
+
+    def get_ex_time(self):
+        return self.exposure
+
+    def start_acquisition(self):
+        self._acquiring = True
+        self._restart()
+
+    def _restart(self):
+        """自由运行的帧从现在开始计"""
+        self._t0 = time.perf_counter()
+        self._id0 = self._frame_id
+
+    def stop_acquisition(self):
+        self._acquiring = False
+
+    def get_frame_period(self):
+        return self.frame_period
+
+    def read_clock(self):
+        return (time.perf_counter() + self.clock_offset) * (1 + self.clock_drift)
+
+    def set_external_trigger(self, enabled=True, line=None):
+        self.external_trigger = enabled
+        with self._lock:
+            self._buffer.clear()
+        self._restart()
+        return True
+
+    def start_sequence(self, n_buffers=256):
+        with self._lock:
+            self._buffer = deque(self._buffer, maxlen=n_buffers)
+        self.start_acquisition()
+
+    def get_camera_info(self):
+        return {'serial': type(self).__name__, 'gain': None, 'roi': (0, 0, self.shape[1], self.shape[0])}
+
+    def _on_trigger(self, host_time):
+        if not (self._acquiring and self.external_trigger):
+            return
+        with self._lock:
+            self._frame_id += 1
+            # 缓冲区满时丢弃最旧的帧，帧计数可以检查出来
+            self._buffer.append((self._frame_id, host_time))
+
+    def _free_run(self):
+        """自由运行：补上从上次读取到现在应产生的帧"""
+        if not self._acquiring or self.external_trigger:
+            return
+        n = self._id0 + int((time.perf_counter() - self._t0) / self.frame_period)
+        with self._lock:
+            # 超出缓冲区的帧直接跳过
+            self._frame_id = max(self._frame_id, n - self._buffer.maxlen)
+            while self._frame_id < n:
+                self._frame_id += 1
+                self._buffer.append((self._frame_id, self._t0 + (self._frame_id - self._id0) * self.frame_period))
+
+    def _render(self, frame_id, host_time):
+        exposure = self._exposure_at(host_time)
+        level = self.dark + np.asarray(self.signal, dtype=np.float64) * exposure
+        image = self._rng.poisson(np.broadcast_to(level, self.shape))
+        image = np.minimum(image, self.saturation).astype(np.uint16)
+        timestamp = (host_time + self.clock_offset) * (1 + self.clock_drift)
+        # 主机收到帧的时间晚于曝光开始：曝光 + 读出
+        return image, frame_info(frame_id, timestamp, host_time + exposure + 1e-3)
+
+    def read_new_frames(self):
+        self._free_run()
+        with self._lock:
+            pending = list(self._buffer)
+            self._buffer.clear()
+        return [self._render(frame_id, host_time) for frame_id, host_time in pending]
+
+    def read_newest_frame(self):
+        frames = self.read_new_frames()
+        if not frames:
+            if self.external_trigger:
+                return None, frame_info()
+            time.sleep(self.frame_period)
+            frames = self.read_new_frames()
+            if not frames:
+                return None, frame_info()
+        return frames[-1]
+
+    def read_newest_image(self):
+        return self.read_newest_frame()[0]
+
+
+def load_fly_scan():
+    """
+    导入 fly-scan/fly-scan.py（文件名含 '-'，不能直接 import），模块名为 fly_scan
+
+    返回:
+        模块
+    """
+    module = sys.modules.get('fly_scan')
+    if module is None:
+        path = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'fly-scan', 'fly-scan.py')
+        spec = importlib.util.spec_from_file_location('fly_scan', path)
+        module = importlib.util.module_from_spec(spec)
+        sys.modules['fly_scan'] = module
+        spec.loader.exec_module(module)
+    return module
+
+
+def simulate_triggered_scan(save_file='simulated_fly_scan.h5', probe_size=0.025, max_velocity=0.5,
+                            scan_class=None):
+    """
+    不连接硬件测试硬件触发飞扫：模拟位移台的位置比较脉冲经虚拟触发线触发模拟相机
+
+    参数:
+        scan_class: 飞扫类，None 时为 fly-scan.py 中的 HardwareTriggerFlyScan
+
+    返回:
+        (采集的帧数, 飞扫对象)
+    """
+    if scan_class is None:
+        scan_class = load_fly_scan().HardwareTriggerFlyScan
+    line = VirtualTriggerLine()
+    motion = SimulatedStage(trigger_line=line)
+    camera = SimulatedCamera(trigger_line=line)
+    camera.start_acquisition()
+    plan = FlyScanPlan.from_camera(camera, (1.0, 1.5), (0.5, 0.53), probe_size, overlap=0.6,
+                                   max_velocity=max_velocity, acceleration=10)
+    print(plan.summary())
+    motion.set_velocity(0, plan.velocity)
+    fc = scan_class(motion, camera, plan.scan_params())
+    return fc.run_scan(save_file, decimation=1), fc
+
+
+def simulate_trajectory_scan(save_file='simulated_trajectory_scan.h5', probe_size=0.025, max_velocity=0.5,
+                             kind='serpentine', scan_class=None):
+    """
+    不连接硬件测试 PVT 轨迹飞扫：模拟位移台执行轨迹，模拟相机自由运行
+
+    参数:
+        kind: 'serpentine' 由 FlyScanPlan 生成的蛇形轨迹，'spiral'、'lissajous' 由 Scanner.fly_trajectory 生成
+        scan_class: 飞扫类，None 时为 fly-scan.py 中的 TrajectoryFlyScan
+
+    返回:
+        (采集的帧数, 飞扫对象)
+    """
+    if scan_class is None:
+        scan_class = load_fly_scan().TrajectoryFlyScan
+    motion = SimulatedStage()
+    camera = SimulatedCamera()
+    camera.start_acquisition()
+    if kind == 'serpentine':
+        plan = FlyScanPlan.from_camera(camera, (1.0, 1.5), (0.5, 0.53), probe_size, overlap=0.6,
+                                       max_velocity=max_velocity, acceleration=10)
+        print(plan.summary())
+        fc = scan_class(motion, camera, plan)
+    else:
+        from Scanner import Scanner
+        trajectory = Scanner(probe_size * 0.4, 4).fly_trajectory(max_velocity, 10, kind, center=(1.0, 0.5))
+        fc = scan_class(motion, camera, trajectory=trajectory)
+    return fc.run_scan(save_file, decimation=1), fc
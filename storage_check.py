@@ -0,0 +1,142 @@
+import math
+import os
+import time
+import numpy as np
+
+
+def benchmark_write(path, size_mb=128, block_mb=8):
+    """
+    在目标文件夹中顺序写入临时文件，测量磁盘写入速度（包含fsync，不受页缓存影响）
+
+    参数:
+        path: 目标文件夹
+        size_mb: 写入总量（MB）
+        block_mb: 每次写入的块大小（MB）
+
+    返回:
+        写入速度（MB/s）
+    """
+    os.makedirs(path, exist_ok=True)
+    test_file = os.path.join(path, f'.write_test_{os.getpid()}.tmp')
+    block = np.random.randint(0, 255, block_mb * 1024 * 1024, dtype=np.uint8).tobytes()
+    n_blocks = max(1, size_mb // block_mb)
+    try:
+        start = time.perf_counter()
+        with open(test_file, 'wb', buffering=0) as f:
+            for _ in range(n_blocks):
+                f.write(block)
+            os.fsync(f.fileno())
+        elapsed = time.perf_counter() - start
+    finally:
+        if os.path.exists(test_file):
+            os.remove(test_file)
+    return n_blocks * block_mb / elapsed
+
+
+def expected_data_rate(frame_shape, dtype=np.uint16, fps=1.0, compression_ratio=1.0):
+    """
+    预计数据速率（MB/s） = 单帧大小 × 帧率 / 压缩比
+
+    参数:
+        frame_shape: 保存的图像尺寸
+        dtype: 像素类型
+        fps: 保存帧率
+        compression_ratio: 压缩比（稀疏存储、压缩等），1表示不压缩
+    """
+    frame_mb = np.prod(frame_shape) * np.dtype(dtype).itemsize / 1024 / 1024
+    return frame_mb * fps / compression_ratio
+
+
+def estimate_compression_ratio(image, kind=None, threshold=0):
+    """
+    由一帧要保存的图像估计存储的压缩比
+
+    参数:
+        image: 保存的图像（裁剪、合并像素、扣暗场之后）
+        kind: 'sparse' 稀疏存储（每个大于阈值的像素保存值和 uint32 序号），
+              'deflate' 无损压缩（PNG、TIFF），None 表示不压缩
+        threshold: 稀疏存储的阈值
+
+    返回:
+        压缩比（原始大小 / 存储大小）
+    """
+    image = np.ascontiguousarray(image)
+    if kind == 'sparse':
+        stored = np.count_nonzero(image > threshold) * (image.dtype.itemsize + 4)
+    elif kind == 'deflate':
+        import zlib
+        stored = len(zlib.compress(image.tobytes(), 1))
+    else:
+        return 1.0
+    return image.nbytes / max(stored, 1)
+
+
+def check_storage(path, frame_shape, dtype=np.uint16, fps=1.0, compression_ratio=1.0, safety=0.7,
+                  size_mb=128):
+    """
+    扫描开始前检查磁盘能否承受预计的数据速率
+
+    参数:
+        safety: 只按实测速度的这一比例计算可用带宽，留出余量
+        其余参数同 expected_data_rate / benchmark_write
+
+    返回:
+        (ok, measured, expected, decimation)
+        ok: 磁盘速度是否足够
+        measured: 实测写入速度（MB/s）
+        expected: 预计数据速率（MB/s）
+        decimation: 建议的抽帧系数（每 decimation 帧保存一帧），磁盘足够时为1
+    """
+    measured = benchmark_write(path, size_mb=size_mb)
+    expected = expected_data_rate(frame_shape, dtype, fps, compression_ratio)
+    available = measured * safety
+    ok = expected <= available
+    decimation = 1 if ok else int(math.ceil(expected / available))
+    if ok:
+        print(f'磁盘写入速度 {measured:.1f} MB/s，预计数据速率 {expected:.1f} MB/s')
+    else:
+        print(f'警告：磁盘写入速度 {measured:.1f} MB/s 不足以保存 {expected:.1f} MB/s 的数据，'
+              f'建议每 {decimation} 帧保存一帧')
+    return ok, measured, expected, decimation
+
+
+class WriteRateMonitor:
+    """
+    扫描过程中监视帧存储的写入速度和积压帧数，数据来自 FrameSink.bytes_written / pending
+    """
+
+    def __init__(self, sink, smoothing=0.5):
+        """
+        参数:
+            sink: FrameSink对象
+            smoothing: 速度的指数平滑系数（0~1，越大越平滑）
+        """
+        self.sink = sink
+        self.smoothing = smoothing
+        self.rate = 0.0
+        self._last_bytes = sink.bytes_written
+        self._last_time = time.perf_counter()
+
+    def sample(self):
+        """
+        返回:
+            (写入速度 MB/s, 积压帧数)
+        """
+        now = time.perf_counter()
+        written = self.sink.bytes_written
+        elapsed = now - self._last_time
+        if elapsed > 0:
+            rate = (written - self._last_bytes) / 1024 / 1024 / elapsed
+            self.rate = self.smoothing * self.rate + (1 - self.smoothing) * rate
+        self._last_bytes = written
+        self._last_time = now
+        return self.rate, self.sink.pending
+
+    def status_text(self):
+        rate, backlog = self.sample()
+        return f'写入 {rate:.1f} MB/s  积压 {backlog} 帧  已保存 {self.sink.frame_count} 帧'
+
+
+if __name__ == '__main__':
+    print(f'{benchmark_write("data"):.1f} MB/s')
+    print(check_storage('data', (2048, 2048), fps=30))
@@ -0,0 +1,18 @@
+import h5py
+import numpy as np
+from simulation import simulate_triggered_scan
+
+
+def test_triggered_scan_positions(tmp_path):
+    """模拟硬件触发飞扫：每个触发都有对应的帧，每行内各帧的X位置等间距"""
+    n_frames, scan = simulate_triggered_scan(str(tmp_path / 'scan.h5'))
+    assert n_frames > 0
+    assert scan.missing_triggers == 0
+    with h5py.File(tmp_path / 'scan.h5', 'r') as f:
+        position = f['position'][:]
+    assert len(position) == n_frames
+    assert not np.any(np.isnan(position))
+    steps = np.abs(np.diff(position[:, 0]))
+    # 换行处Y改变，X不按触发间隔前进
+    same_line = np.abs(np.diff(position[:, 1])) < scan.trigger_step() / 2
+    assert np.allclose(steps[same_line], scan.trigger_step())